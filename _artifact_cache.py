@@ -0,0 +1,243 @@
+# Copyright (c) 2022 https://github.com/ping/
+#
+# This software is released under the GNU General Public License v3.0
+# https://opensource.org/licenses/GPL-3.0
+
+# Persistent, content-addressed local cache for files downloaded from the
+# published site, e.g. on self-hosted runners
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Mapping, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+
+logger = logging.getLogger(__file__)
+
+FICLONE = 0x40049409  # ioctl to reflink a file on Linux
+entries_filename = "entries.json"
+default_max_age_days = 14
+
+
+def file_sha256(file_path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with file_path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def link_or_copy(src: Path, dest: Path, writable: bool = False) -> None:
+    """
+    Make dest a reflink of src where supported, or else a hardlink, without
+    copying the bytes. A hardlink shares src's read-only permissions and any
+    change to it, so dest is a copy instead if it is going to be modified,
+    e.g. to update a book's metadata. A reflink is a separate file and is
+    always writable.
+
+    :param src:
+    :param dest:
+    :param writable: dest is going to be modified
+    :return:
+    """
+    temp_dest = dest.with_name(f"{dest.name}.{threading.get_ident()}.tmp")
+    try:
+        if not fcntl:
+            raise OSError("reflink not supported")
+        with src.open("rb") as f_src, temp_dest.open("wb") as f_dest:
+            fcntl.ioctl(f_dest.fileno(), FICLONE, f_src.fileno())
+    except OSError:
+        temp_dest.unlink(missing_ok=True)
+        try:
+            if writable:
+                raise OSError("hardlink is not writable")
+            os.link(src, temp_dest)
+        except OSError:
+            # e.g. on another filesystem
+            shutil.copyfile(src, temp_dest)
+    os.replace(temp_dest, dest)
+
+
+class ArtifactCache:
+    """
+    Files are stored by their sha256 in ``objects/`` and are read-only.
+    Restored files are reflinks or hardlinks, or copies if they are going
+    to be modified. ``entries.json`` maps the source url to the object and
+    its validators. The access times of restored entries are written
+    with the next change to the entries, or by save().
+    """
+
+    def __init__(self, cache_folder: Path, max_age_days: int = default_max_age_days):
+        self.cache_folder = cache_folder
+        self.objects_folder = cache_folder.joinpath("objects")
+        self.objects_folder.mkdir(parents=True, exist_ok=True)
+        self.max_age_days = max_age_days
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+        self.is_modified = False
+        try:
+            with cache_folder.joinpath(entries_filename).open(
+                "r", encoding="utf-8"
+            ) as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as err:  # noqa, pylint: disable=broad-except
+            logger.warning(f"Unable to load artifact cache entries: {err}")
+
+    def _object_path(self, sha256: str) -> Path:
+        return self.objects_folder.joinpath(sha256[:2], sha256)
+
+    def _save(self) -> None:
+        entries_path = self.cache_folder.joinpath(entries_filename)
+        temp_path = entries_path.with_name(f"{entries_path.name}.tmp")
+        with temp_path.open("w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=0)
+        os.replace(temp_path, entries_path)
+        self.is_modified = False
+
+    def save(self) -> None:
+        """
+        Write the entries if they have been modified, e.g. by restore()
+
+        :return:
+        """
+        with self.lock:
+            if self.is_modified:
+                self._save()
+
+    def lookup(self, url: str) -> Optional[Path]:
+        """
+        Get the cached file for a url
+
+        :param url:
+        :return:
+        """
+        with self.lock:
+            entry = self.entries.get(url)
+        if not entry:
+            return None
+        object_path = self._object_path(entry["sha256"])
+        return object_path if object_path.exists() else None
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """
+        Headers to revalidate the cached file for a url
+
+        :param url:
+        :return:
+        """
+        if not self.lookup(url):
+            return {}
+        with self.lock:
+            entry = self.entries[url]
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def restore(self, url: str, dest: Path, writable: bool = False) -> bool:
+        """
+        Link the cached file for a url to dest
+
+        :param url:
+        :param dest:
+        :param writable: dest is going to be modified, so it must not be a hardlink
+        :return: False if the url is not cached
+        """
+        object_path = self.lookup(url)
+        if not object_path:
+            return False
+        link_or_copy(object_path, dest, writable)
+        with self.lock:
+            self.entries[url]["accessed"] = time.time()
+            self.is_modified = True
+        return True
+
+    def store(self, url: str, file_path: Path, headers: Mapping[str, str]) -> Path:
+        """
+        Add a downloaded file to the cache
+
+        :param url:
+        :param file_path: downloaded file
+        :param headers: response headers
+        :return: cached file
+        """
+        sha256 = file_sha256(file_path)
+        object_path = self._object_path(sha256)
+        if not object_path.exists():
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            # not linked, the cached copy must not change with file_path
+            link_or_copy(file_path, object_path, writable=True)
+            object_path.chmod(stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        with self.lock:
+            self.entries[url] = {
+                "sha256": sha256,
+                "size": object_path.stat().st_size,
+                "etag": headers.get("ETag", ""),
+                "last_modified": headers.get("Last-Modified", ""),
+                "accessed": time.time(),
+            }
+            self._save()
+        return object_path
+
+    def discard(self, url: str) -> None:
+        """
+        Remove the entry for a url, e.g. if the cached copy is not valid
+
+        :param url:
+        :return:
+        """
+        with self.lock:
+            if self.entries.pop(url, None):
+                self._save()
+
+    def store_content(
+        self, url: str, content: bytes, headers: Mapping[str, str]
+    ) -> Path:
+        """
+        Add downloaded content to the cache
+
+        :param url:
+        :param content:
+        :param headers: response headers
+        :return: cached file
+        """
+        temp_path = self.cache_folder.joinpath(f"{threading.get_ident()}.download")
+        temp_path.write_bytes(content)
+        try:
+            return self.store(url, temp_path, headers)
+        finally:
+            temp_path.unlink()
+
+    def prune(self) -> None:
+        """
+        Remove the entries that have not been used recently and
+        the objects that are no longer referenced
+
+        :return:
+        """
+        cutoff = time.time() - self.max_age_days * 24 * 60 * 60
+        with self.lock:
+            self.entries = {
+                url: entry
+                for url, entry in self.entries.items()
+                if entry.get("accessed", 0) >= cutoff
+            }
+            self._save()
+            in_use = {entry["sha256"] for entry in self.entries.values()}
+        for object_path in self.objects_folder.glob("*/*"):
+            if object_path.name not in in_use:
+                object_path.chmod(stat.S_IWUSR | stat.S_IRUSR)
+                object_path.unlink()
@@ -0,0 +1,95 @@
+# Copyright (c) 2022 https://github.com/ping/
+#
+# This software is released under the GNU General Public License v3.0
+# https://opensource.org/licenses/GPL-3.0
+
+# Wall-clock budget for a run so that low priority recipes can be
+# restored from cache instead of pushing the run over its time limit
+import threading
+from timeit import default_timer as timer
+from typing import Dict, List, Optional, Tuple
+
+# time reserved at the end of the run for generating the site
+default_reserve_seconds = 5 * 60
+
+
+def get_recipe_priority(
+    category: str,
+    tags: List[str],
+    categories_sort: List[str],
+    priority_tags: Optional[List[str]] = None,
+) -> int:
+    """
+    Priority of a recipe, higher is more important. Recipes with any of the
+    priority tags rank above all others, then recipes are ranked by their
+    category's position in categories_sort.
+
+    :param category:
+    :param tags:
+    :param categories_sort:
+    :param priority_tags:
+    :return:
+    """
+    priority = 0
+    if category in categories_sort:
+        priority = len(categories_sort) - categories_sort.index(category)
+    if priority_tags and set(tags).intersection(priority_tags):
+        priority += len(categories_sort) + 1
+    return priority
+
+
+class RunBudget:
+    """Tracks the remaining time and the pending work for a run"""
+
+    def __init__(
+        self,
+        seconds: float,
+        workers: int = 1,
+        reserve_seconds: float = default_reserve_seconds,
+    ):
+        self.deadline = timer() + seconds - reserve_seconds
+        self.workers = max(1, workers)
+        self.pending: Dict[str, Tuple[int, float]] = {}
+        self.lock = threading.Lock()
+
+    def remaining(self) -> float:
+        return self.deadline - timer()
+
+    def add(self, slug: str, priority: int, estimate: float) -> None:
+        """
+        Register a pending recipe
+
+        :param slug:
+        :param priority: higher is more important
+        :param estimate: estimated duration in seconds
+        :return:
+        """
+        with self.lock:
+            self.pending[slug] = (priority, estimate)
+
+    def claim(self, slug: str) -> bool:
+        """
+        Start a pending recipe. Checks that the recipe can finish within the
+        remaining time after setting aside time for the pending recipes with
+        a higher priority.
+
+        :param slug:
+        :return: False if the recipe should not be run
+        """
+        with self.lock:
+            priority, estimate = self.pending.pop(slug, (0, 0))
+            reserved = (
+                sum(e for p, e in self.pending.values() if p > priority) / self.workers
+            )
+            return estimate + reserved <= self.remaining()
+
+    def release(self, slug: str) -> None:
+        """
+        Stop setting aside time for a pending recipe that will not be run,
+        e.g. because it was restored from cache
+
+        :param slug:
+        :return:
+        """
+        with self.lock:
+            self.pending.pop(slug, None)
@@ -0,0 +1,245 @@
+# Copyright (c) 2022 https://github.com/ping/
+#
+# This software is released under the GNU General Public License v3.0
+# https://opensource.org/licenses/GPL-3.0
+
+# Long-lived calibre processes that run ebook-convert/ebook-meta jobs in-process
+# so that calibre's startup cost is only paid once per worker instead of per command
+import io
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import traceback
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+# executed with ``calibre-debug -c`` so that calibre's modules are importable
+WORKER_SCRIPT = f"""
+import sys
+sys.path.insert(0, {str(Path(__file__).parent.absolute())!r})
+from _calibre_worker import serve_calibre
+serve_calibre()
+"""
+
+
+class CalibreWorkerError(Exception):
+    """The calibre worker is not available."""
+
+
+def serve(entry_points: Dict[str, Callable[[List[str]], Optional[int]]]) -> None:
+    """
+    Worker loop. Reads one JSON request per line from stdin and writes one
+    JSON response per line, e.g.
+    ``{"cmd": ["ebook-meta", "book.epub"], "env": {}}`` ->
+    ``{"exit_code": 0, "output": "..."}``
+
+    :param entry_points: command name to main(argv) function
+    :return:
+    """
+    # keep the protocol on a private fd so that anything written directly
+    # to stdout by the job does not corrupt the responses
+    protocol_out = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    real_stdout, real_stderr = sys.stdout, sys.stderr
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        cmd = request["cmd"]
+        buffer = io.BytesIO()
+        job_out = io.TextIOWrapper(
+            buffer, encoding="utf-8", errors="replace", write_through=True
+        )
+        original_env = dict(os.environ)
+        os.environ.update(request.get("env") or {})
+        sys.stdout = sys.stderr = job_out
+        try:
+            exit_code = entry_points[cmd[0]](cmd) or 0
+        except SystemExit as exit_err:
+            exit_code = (
+                exit_err.code
+                if isinstance(exit_err.code, int)
+                else int(exit_err.code is not None)
+            )
+        except Exception:  # noqa, pylint: disable=broad-except
+            traceback.print_exc(file=job_out)
+            exit_code = 1
+        finally:
+            sys.stdout, sys.stderr = real_stdout, real_stderr
+            os.environ.clear()
+            os.environ.update(original_env)
+        job_out.flush()
+        protocol_out.write(
+            json.dumps(
+                {
+                    "exit_code": exit_code,
+                    "output": buffer.getvalue().decode("utf-8", "replace"),
+                }
+            )
+            + "\n"
+        )
+        protocol_out.flush()
+
+
+def serve_calibre() -> None:  # pragma: no cover
+    """
+    Worker loop for the calibre commands. Must be run with calibre-debug.
+
+    :return:
+    """
+    from calibre.ebooks.conversion.cli import main as ebook_convert  # type: ignore
+    from calibre.ebooks.metadata.cli import main as ebook_meta  # type: ignore
+
+    serve({"ebook-convert": ebook_convert, "ebook-meta": ebook_meta})
+
+
+class CalibreWorker:
+    """A single worker process. Runs one command at a time."""
+
+    def __init__(self, worker_cmd: List[str]):
+        try:
+            self.proc = subprocess.Popen(
+                worker_cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                encoding="utf-8",
+            )
+        except OSError as err:
+            raise CalibreWorkerError(f"Unable to start worker: {err}") from err
+        self.completed = 0  # number of commands run
+        self.killed = False
+        self.responses: queue.Queue = queue.Queue()
+        self.reader = threading.Thread(target=self._read_responses, daemon=True)
+        self.reader.start()
+
+    def _read_responses(self) -> None:
+        for line in self.proc.stdout:  # type: ignore[union-attr]
+            self.responses.put(line)
+        self.responses.put(None)  # worker exited
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def run(
+        self, cmd: List[str], env: Optional[Dict] = None, timeout: Optional[int] = None
+    ) -> Tuple[int, str]:
+        """
+        Run a command in the worker
+
+        :param cmd:
+        :param env: additional environment variables
+        :param timeout:
+        :return: exit code, output
+        """
+        try:
+            self.proc.stdin.write(  # type: ignore[union-attr]
+                json.dumps({"cmd": cmd, "env": env or {}}) + "\n"
+            )
+            self.proc.stdin.flush()  # type: ignore[union-attr]
+        except (OSError, ValueError) as err:
+            self.stop()
+            raise CalibreWorkerError(f"Worker exited: {err}") from err
+        try:
+            line = self.responses.get(timeout=timeout)
+        except queue.Empty:
+            self.stop(kill=True)
+            raise subprocess.TimeoutExpired(cmd, timeout)  # type: ignore[arg-type]
+        if not line:
+            self.stop()
+            raise CalibreWorkerError(f"Worker exited: {self.proc.returncode}")
+        response = json.loads(line)
+        self.completed += 1
+        return int(response["exit_code"]), response["output"]
+
+    def stop(self, kill: bool = False) -> None:
+        try:
+            if kill:
+                self.killed = True
+                self.proc.kill()
+            self.proc.stdin.close()  # type: ignore[union-attr]
+            self.proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+            self.proc.wait()
+        self.reader.join(timeout=5)
+        self.proc.stdout.close()  # type: ignore[union-attr]
+
+
+class CalibreWorkerPool:
+    """
+    Pool of calibre workers that are started on demand.
+    Workers that die are discarded and replaced on the next command.
+    """
+
+    def __init__(self, size: int = 1, worker_cmd: Optional[List[str]] = None):
+        self.size = max(1, size)
+        self.worker_cmd = worker_cmd or ["calibre-debug", "-c", WORKER_SCRIPT]
+        self.idle: List[CalibreWorker] = []
+        self.started = 0
+        self.disabled = False
+        self.condition = threading.Condition()
+
+    def _acquire(self) -> CalibreWorker:
+        with self.condition:
+            while True:
+                if self.disabled:
+                    raise CalibreWorkerError("Worker is disabled")
+                if self.idle:
+                    return self.idle.pop()
+                if self.started < self.size:
+                    self.started += 1
+                    break
+                self.condition.wait()
+        try:
+            return CalibreWorker(self.worker_cmd)
+        except CalibreWorkerError:
+            with self.condition:
+                # don't keep trying if the worker can't be started at all
+                self.started -= 1
+                self.disabled = True
+                self.condition.notify_all()
+            raise
+
+    def _release(self, worker: CalibreWorker) -> None:
+        with self.condition:
+            if worker.alive and not self.disabled:
+                self.idle.append(worker)
+                self.condition.notify()
+                return
+            self.started -= 1
+            if not (worker.completed or worker.killed):
+                # worker is not usable, e.g. calibre-debug exits on startup
+                self.disabled = True
+            self.condition.notify_all()
+        worker.stop()
+
+    def run(
+        self, cmd: List[str], env: Optional[Dict] = None, timeout: Optional[int] = None
+    ) -> Tuple[int, str]:
+        """
+        Run a command with the next available worker
+
+        :param cmd:
+        :param env: additional environment variables
+        :param timeout:
+        :return: exit code, output
+        """
+        worker = self._acquire()
+        try:
+            return worker.run(cmd, env, timeout)
+        finally:
+            self._release(worker)
+
+    def close(self) -> None:
+        with self.condition:
+            self.disabled = True
+            workers, self.idle = self.idle, []
+            self.condition.notify_all()
+        for worker in workers:
+            worker.stop()
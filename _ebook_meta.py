@@ -0,0 +1,626 @@
+# Copyright (c) 2022 https://github.com/ping/
+#
+# This software is released under the GNU General Public License v3.0
+# https://opensource.org/licenses/GPL-3.0
+
+# Minimal in-process ebook metadata reader/writer so that we don't need to
+# launch calibre's ebook-meta for every book
+import copy
+import io
+import os
+import posixpath
+import re
+import struct
+import zipfile
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from html import unescape
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape, quoteattr
+
+NAMESPACES = {
+    "container": "urn:oasis:names:tc:opendocument:xmlns:container",
+    "opf": "http://www.idpf.org/2007/opf",
+    "dc": "http://purl.org/dc/elements/1.1/",
+}
+
+# EXTH record types
+EXTH_PUBLISHER = 101
+EXTH_DESCRIPTION = 103
+EXTH_PUBLISHED = 106
+EXTH_KF8_BOUNDARY = 121
+EXTH_COVER_OFFSET = 201
+EXTH_THUMB_OFFSET = 202
+EXTH_UPDATED_TITLE = 503
+
+MOBI_THUMBNAIL_SIZE = (180, 240)  # same as calibre
+ZIP_LOCAL_HEADER_SIZE = 30
+
+_HTML_BREAK_RE = re.compile(r"<\s*(br|/p|/div|/li|/h\d)\b[^>]*>", re.IGNORECASE)
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+
+
+class BookMetaError(Exception):
+    """Unable to read the metadata of a book."""
+
+
+@dataclass
+class BookMeta:
+    """Book metadata"""
+
+    title: str = ""
+    published: Optional[datetime] = None  # UTC
+    comments: str = ""  # plain text
+    publisher: str = ""
+
+
+def parse_meta_date(date_string: str) -> Optional[datetime]:
+    """
+    Parse an ISO 8601 date as written by calibre into a UTC datetime
+
+    :param date_string:
+    :return:
+    """
+    date_string = (date_string or "").strip()
+    if not date_string:
+        return None
+    if date_string.endswith("Z"):
+        date_string = date_string[:-1] + "+00:00"
+    try:
+        dt = datetime.fromisoformat(date_string)
+    except ValueError:
+        try:
+            # for example: 2023-10-30T03:12:45.123456789+00:00
+            dt = datetime.fromisoformat(date_string[:19])
+        except ValueError:
+            return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def html_to_text(html: str) -> str:
+    """
+    Very lightweight conversion of a comments html fragment into plain text
+
+    :param html:
+    :return:
+    """
+    if "<" not in html:
+        return html
+    return unescape(_HTML_TAG_RE.sub("", _HTML_BREAK_RE.sub("\n", html)))
+
+
+def _find_opf_path(book: zipfile.ZipFile) -> str:
+    try:
+        container = ElementTree.fromstring(book.read("META-INF/container.xml"))
+        rootfile = container.find(".//container:rootfile", NAMESPACES)
+        if rootfile is not None and rootfile.get("full-path"):
+            return str(rootfile.get("full-path"))
+    except KeyError:
+        pass
+    opf_paths = [n for n in book.namelist() if n.lower().endswith(".opf")]
+    if not opf_paths:
+        raise BookMetaError("Unable to find OPF")
+    return opf_paths[0]
+
+
+def read_opf_meta(opf_xml: Union[bytes, str]) -> BookMeta:
+    """
+    Read metadata from an OPF document
+
+    :param opf_xml:
+    :return:
+    """
+    try:
+        opf = ElementTree.fromstring(opf_xml)
+    except ElementTree.ParseError as err:
+        raise BookMetaError(f"Invalid OPF: {err}") from err
+    metadata = opf.find("opf:metadata", NAMESPACES)
+    if metadata is None:
+        raise BookMetaError("Unable to find OPF metadata")
+
+    meta = BookMeta()
+    title = metadata.find("dc:title", NAMESPACES)
+    if title is not None and title.text:
+        meta.title = title.text.strip()
+    for date in metadata.findall("dc:date", NAMESPACES):
+        event = date.get(f'{{{NAMESPACES["opf"]}}}event') or date.get("event") or ""
+        if event and event != "publication":
+            continue
+        meta.published = parse_meta_date(date.text or "")
+        if meta.published:
+            break
+    description = metadata.find("dc:description", NAMESPACES)
+    if description is not None and description.text:
+        meta.comments = html_to_text(description.text)
+    publisher = metadata.find("dc:publisher", NAMESPACES)
+    if publisher is not None and publisher.text:
+        meta.publisher = publisher.text.strip()
+    return meta
+
+
+def read_epub_meta(file_path: Path) -> BookMeta:
+    """
+    Read metadata from the OPF in an EPUB
+
+    :param file_path:
+    :return:
+    """
+    try:
+        with zipfile.ZipFile(file_path) as book:
+            return read_opf_meta(book.read(_find_opf_path(book)))
+    except (zipfile.BadZipFile, KeyError) as err:
+        raise BookMetaError(f"Invalid EPUB: {err}") from err
+
+
+def _read_exth_list(header_record: bytes) -> List[Tuple[int, bytes]]:
+    """
+    Read the EXTH records, in order, from a MOBI header record
+
+    :param header_record:
+    :return: list of (type, value)
+    """
+    if header_record[16:20] != b"MOBI":
+        raise BookMetaError("Invalid MOBI header")
+    (mobi_header_length,) = struct.unpack(">I", header_record[20:24])
+    (exth_flags,) = struct.unpack(">I", header_record[128:132])
+    exth_list: List[Tuple[int, bytes]] = []
+    if not exth_flags & 0x40:
+        return exth_list
+    exth_offset = 16 + mobi_header_length
+    if header_record[exth_offset : exth_offset + 4] != b"EXTH":
+        raise BookMetaError("Invalid EXTH header")
+    (exth_count,) = struct.unpack(
+        ">I", header_record[exth_offset + 8 : exth_offset + 12]
+    )
+    pos = exth_offset + 12
+    for _ in range(exth_count):
+        exth_type, exth_length = struct.unpack(">II", header_record[pos : pos + 8])
+        if exth_length < 8:
+            raise BookMetaError("Invalid EXTH record")
+        exth_list.append((exth_type, header_record[pos + 8 : pos + exth_length]))
+        pos += exth_length
+    return exth_list
+
+
+def read_mobi_exth(data: bytes) -> Dict[int, List[bytes]]:
+    """
+    Read the EXTH records from a MOBI file's first record
+
+    :param data: MOBI file contents
+    :return: EXTH records by type
+    """
+    records = read_mobi_records(data)
+    exth_records: Dict[int, List[bytes]] = {}
+    for exth_type, value in _read_exth_list(data[records[0][0] : records[0][1]]):
+        exth_records.setdefault(exth_type, []).append(value)
+    return exth_records
+
+
+def read_mobi_records(data: bytes) -> List[List[int]]:
+    """
+    Get the [start, end] offsets of the records in a PalmDB file
+
+    :param data:
+    :return:
+    """
+    if len(data) < 78 or data[60:68] != b"BOOKMOBI":
+        raise BookMetaError("Not a MOBI file")
+    (record_count,) = struct.unpack(">H", data[76:78])
+    offsets = [
+        struct.unpack(">I", data[78 + i * 8 : 82 + i * 8])[0]
+        for i in range(record_count)
+    ]
+    return [
+        [offset, offsets[i + 1] if i + 1 < len(offsets) else len(data)]
+        for i, offset in enumerate(offsets)
+    ]
+
+
+def read_mobi_meta(file_path: Path) -> BookMeta:
+    """
+    Read metadata from the MOBI/EXTH headers
+
+    :param file_path:
+    :return:
+    """
+    with file_path.open("rb") as f:
+        data = f.read()
+    try:
+        records = read_mobi_records(data)
+        record0 = data[records[0][0] : records[0][1]]
+        exth_records = read_mobi_exth(data)
+        (text_encoding,) = struct.unpack(">I", record0[28:32])
+        (full_name_offset, full_name_length) = struct.unpack(">II", record0[84:92])
+    except struct.error as err:
+        raise BookMetaError(f"Invalid MOBI: {err}") from err
+    encoding = "cp1252" if text_encoding == 1252 else "utf-8"
+
+    def _exth_text(exth_type: int) -> str:
+        values = exth_records.get(exth_type)
+        if not values:
+            return ""
+        return values[0].decode(encoding, "replace").strip()
+
+    meta = BookMeta()
+    meta.title = (
+        _exth_text(EXTH_UPDATED_TITLE)
+        or record0[full_name_offset : full_name_offset + full_name_length]
+        .decode(encoding, "replace")
+        .strip()
+    )
+    meta.published = parse_meta_date(_exth_text(EXTH_PUBLISHED))
+    meta.comments = html_to_text(_exth_text(EXTH_DESCRIPTION))
+    meta.publisher = _exth_text(EXTH_PUBLISHER)
+    return meta
+
+
+def read_meta(file_path: Path) -> BookMeta:
+    """
+    Read a book's metadata
+
+    :param file_path:
+    :return:
+    """
+    ext = file_path.suffix.lower()
+    if ext == ".epub":
+        return read_epub_meta(file_path)
+    if ext in (".mobi", ".azw", ".azw3"):
+        return read_mobi_meta(file_path)
+    raise BookMetaError(f"Unsupported format: {ext}")
+
+
+def _image_bytes(image_path: Path, image_format: str, max_size=None) -> bytes:
+    """
+    Convert an image into the format used by the book
+
+    :param image_path:
+    :param image_format: PIL format name, e.g. JPEG
+    :param max_size: optional (width, height) to fit the image into
+    :return:
+    """
+    from PIL import Image  # type: ignore
+
+    with Image.open(image_path) as src_img:
+        img = src_img.convert("RGB") if image_format == "JPEG" else src_img.copy()
+    if max_size:
+        img.thumbnail(max_size)
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format, quality=90)
+    return buffer.getvalue()
+
+
+def _copy_zip_entry(src_fp, dest: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+    """
+    Copy a zip entry's compressed data as-is, without decompressing
+    and recompressing it
+
+    :param src_fp: source zip file object
+    :param dest:
+    :param info: source entry
+    :return:
+    """
+    src_fp.seek(info.header_offset)
+    local_header = src_fp.read(ZIP_LOCAL_HEADER_SIZE)
+    name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+    src_fp.seek(info.header_offset + ZIP_LOCAL_HEADER_SIZE + name_length + extra_length)
+    compressed_data = src_fp.read(info.compress_size)
+
+    new_info = copy.copy(info)
+    # sizes and crc are written into the local header instead of a data descriptor
+    new_info.flag_bits &= ~0x08
+    dest.fp.seek(dest.start_dir)  # type: ignore[union-attr]
+    new_info.header_offset = dest.fp.tell()  # type: ignore[union-attr]
+    dest.fp.write(new_info.FileHeader())  # type: ignore[union-attr]
+    dest.fp.write(compressed_data)  # type: ignore[union-attr]
+    dest.start_dir = dest.fp.tell()  # type: ignore[union-attr]
+    dest.filelist.append(new_info)
+    dest.NameToInfo[new_info.filename] = new_info
+
+
+def update_zip(file_path: Path, replacements: Dict[str, bytes]) -> None:
+    """
+    Replace entries in a zip file. Unchanged entries are copied
+    without being recompressed.
+
+    :param file_path:
+    :param replacements: new content by entry name
+    :return:
+    """
+    temp_path = file_path.with_name(f"{file_path.name}.tmp")
+    try:
+        with file_path.open("rb") as src_fp, zipfile.ZipFile(
+            src_fp
+        ) as src, zipfile.ZipFile(temp_path, "w") as dest:
+            for info in src.infolist():
+                if info.filename not in replacements:
+                    _copy_zip_entry(src_fp, dest, info)
+                    continue
+                new_info = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                new_info.compress_type = info.compress_type
+                new_info.external_attr = info.external_attr
+                dest.writestr(new_info, replacements[info.filename])
+        os.replace(temp_path, file_path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+
+def _update_opf_metadata(
+    opf_text: str,
+    series: Optional[str] = None,
+    series_index: Optional[float] = None,
+    publisher: Optional[str] = None,
+) -> str:
+    """
+    Update an OPF's metadata with minimal text edits so that the rest
+    of the document is left untouched
+
+    :param opf_text:
+    :param series:
+    :param series_index:
+    :param publisher:
+    :return:
+    """
+    metadata_end = re.search(r"</(\w+:)?metadata>", opf_text)
+    if not metadata_end:
+        raise BookMetaError("Unable to find OPF metadata")
+    mobj = re.search(r'xmlns:(\w+)=["\']' + re.escape(NAMESPACES["dc"]), opf_text)
+    dc_prefix = mobj.group(1) if mobj else "dc"
+
+    new_tags = []
+    if series is not None:
+        opf_text = re.sub(
+            r'<(\w+:)?meta\s[^>]*name=["\']calibre:series(_index)?["\'][^>]*/>\s*',
+            "",
+            opf_text,
+        )
+        new_tags.append(f'<meta name="calibre:series" content={quoteattr(series)}/>')
+        if series_index is not None:
+            new_tags.append(
+                f'<meta name="calibre:series_index" content="{series_index}"/>'
+            )
+    if publisher is not None:
+        opf_text = re.sub(
+            rf"<{dc_prefix}:publisher\b[^>]*(/>|>.*?</{dc_prefix}:publisher>)\s*",
+            "",
+            opf_text,
+            flags=re.DOTALL,
+        )
+        if not mobj:
+            # the dc namespace is declared on the tag itself
+            new_tags.append(
+                f'<dc:publisher xmlns:dc="{NAMESPACES["dc"]}">{escape(publisher)}</dc:publisher>'
+            )
+        else:
+            new_tags.append(
+                f"<{dc_prefix}:publisher>{escape(publisher)}</{dc_prefix}:publisher>"
+            )
+    if not new_tags:
+        return opf_text
+    metadata_end = re.search(r"</(\w+:)?metadata>", opf_text)
+    pos = metadata_end.start()  # type: ignore[union-attr]
+    return opf_text[:pos] + "\n".join(new_tags) + "\n" + opf_text[pos:]
+
+
+def _find_epub_cover(book: zipfile.ZipFile, opf_path: str, opf_xml: bytes) -> str:
+    """
+    Get the path of an EPUB's raster cover image
+
+    :param book:
+    :param opf_path:
+    :param opf_xml:
+    :return:
+    """
+    opf = ElementTree.fromstring(opf_xml)
+    cover_id = ""
+    for meta in opf.iterfind("opf:metadata/opf:meta", NAMESPACES):
+        if meta.get("name") == "cover":
+            cover_id = meta.get("content") or ""
+            break
+    for item in opf.iterfind("opf:manifest/opf:item", NAMESPACES):
+        if (cover_id and item.get("id") == cover_id) or (
+            "cover-image" in (item.get("properties") or "").split()
+        ):
+            cover_path = posixpath.normpath(
+                posixpath.join(posixpath.dirname(opf_path), item.get("href") or "")
+            )
+            if cover_path in book.namelist():
+                return cover_path
+    raise BookMetaError("Unable to find cover image")
+
+
+def write_epub_meta(
+    file_path: Path,
+    series: Optional[str] = None,
+    series_index: Optional[float] = None,
+    publisher: Optional[str] = None,
+    cover_path: Optional[Path] = None,
+) -> None:
+    """
+    Update the series and publisher in an EPUB's OPF and replace the cover image
+
+    :param file_path:
+    :param series:
+    :param series_index:
+    :param publisher:
+    :param cover_path: new cover image
+    :return:
+    """
+    replacements: Dict[str, bytes] = {}
+    try:
+        with zipfile.ZipFile(file_path) as book:
+            opf_path = _find_opf_path(book)
+            opf_xml = book.read(opf_path)
+            replacements[opf_path] = _update_opf_metadata(
+                opf_xml.decode("utf-8"), series, series_index, publisher
+            ).encode("utf-8")
+            if cover_path:
+                from PIL import Image  # type: ignore
+
+                book_cover_path = _find_epub_cover(book, opf_path, opf_xml)
+                image_format = (
+                    "PNG" if book_cover_path.lower().endswith(".png") else "JPEG"
+                )
+                replacements[book_cover_path] = _image_bytes(cover_path, image_format)
+                with Image.open(cover_path) as img:
+                    width, height = img.size
+                # update the dimensions of the svg wrapper in calibre's titlepage
+                cover_name = posixpath.basename(book_cover_path)
+                for name in book.namelist():
+                    if not name.lower().endswith((".xhtml", ".html", ".htm")):
+                        continue
+                    html = book.read(name).decode("utf-8", "replace")
+                    if cover_name not in html or "viewBox" not in html:
+                        continue
+                    html = re.sub(
+                        r'viewBox="0 0 \d+ \d+"',
+                        f'viewBox="0 0 {width} {height}"',
+                        html,
+                    )
+                    html = re.sub(
+                        r'(<image\b[^>]*?)width="\d+"(\s[^>]*?)height="\d+"',
+                        rf'\g<1>width="{width}"\g<2>height="{height}"',
+                        html,
+                    )
+                    replacements[name] = html.encode("utf-8")
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError, ValueError) as err:
+        # ValueError includes an OPF that is not utf-8
+        raise BookMetaError(f"Invalid EPUB: {err}") from err
+    update_zip(file_path, replacements)
+
+
+def _rebuild_mobi_header_record(
+    header_record: bytes, exth_list: List[Tuple[int, bytes]]
+) -> bytes:
+    """
+    Rebuild a MOBI header record with new EXTH records
+
+    :param header_record:
+    :param exth_list:
+    :return:
+    """
+    (mobi_header_length,) = struct.unpack(">I", header_record[20:24])
+    (full_name_offset,) = struct.unpack(">I", header_record[84:88])
+    exth_offset = 16 + mobi_header_length
+    exth_data = b"".join(
+        struct.pack(">II", exth_type, len(value) + 8) + value
+        for exth_type, value in exth_list
+    )
+    exth_block = (
+        b"EXTH" + struct.pack(">II", 12 + len(exth_data), len(exth_list)) + exth_data
+    )
+    exth_block += bytes(-len(exth_block) % 4)  # pad to 4 bytes
+    new_record = bytearray(
+        header_record[:exth_offset] + exth_block + header_record[full_name_offset:]
+    )
+    struct.pack_into(">I", new_record, 84, exth_offset + len(exth_block))
+    (exth_flags,) = struct.unpack(">I", new_record[128:132])
+    struct.pack_into(">I", new_record, 128, exth_flags | 0x40)
+    return bytes(new_record)
+
+
+def write_mobi_meta(
+    file_path: Path,
+    publisher: Optional[str] = None,
+    cover_path: Optional[Path] = None,
+) -> None:
+    """
+    Update the publisher and cover EXTH records and images in a MOBI,
+    including the KF8 header in joint MOBI/KF8 files.
+    MOBI has no series metadata.
+
+    :param file_path:
+    :param publisher:
+    :param cover_path: new cover image
+    :return:
+    """
+    with file_path.open("rb") as f:
+        data = f.read()
+    try:
+        records = read_mobi_records(data)
+        record_data = [data[start:end] for start, end in records]
+        header_indices = [0]
+        exth0 = dict(_read_exth_list(record_data[0]))
+        if EXTH_KF8_BOUNDARY in exth0:
+            (kf8_index,) = struct.unpack(">I", exth0[EXTH_KF8_BOUNDARY][:4])
+            if (
+                0 < kf8_index < len(record_data)
+                and record_data[kf8_index][16:20] == b"MOBI"
+            ):
+                header_indices.append(kf8_index)
+
+        if cover_path:
+            (first_image_index,) = struct.unpack(">I", record_data[0][108:112])
+            for exth_type, max_size in (
+                (EXTH_COVER_OFFSET, None),
+                (EXTH_THUMB_OFFSET, MOBI_THUMBNAIL_SIZE),
+            ):
+                if exth_type not in exth0:
+                    if exth_type == EXTH_COVER_OFFSET:
+                        raise BookMetaError("Unable to find cover image")
+                    continue
+                (image_offset,) = struct.unpack(">I", exth0[exth_type][:4])
+                image_index = first_image_index + image_offset
+                if image_index >= len(record_data):
+                    raise BookMetaError("Invalid cover offset")
+                record_data[image_index] = _image_bytes(cover_path, "JPEG", max_size)
+
+        if publisher is not None:
+            for header_index in header_indices:
+                exth_list = [
+                    (exth_type, value)
+                    for exth_type, value in _read_exth_list(record_data[header_index])
+                    if exth_type != EXTH_PUBLISHER
+                ]
+                exth_list.append((EXTH_PUBLISHER, publisher.encode("utf-8")))
+                record_data[header_index] = _rebuild_mobi_header_record(
+                    record_data[header_index], exth_list
+                )
+    except struct.error as err:
+        raise BookMetaError(f"Invalid MOBI: {err}") from err
+
+    # rebuild the PalmDB with the new record offsets
+    header = bytearray(data[: records[0][0]])
+    offset = records[0][0]
+    for i, record in enumerate(record_data):
+        struct.pack_into(">I", header, 78 + i * 8, offset)
+        offset += len(record)
+    temp_path = file_path.with_name(f"{file_path.name}.tmp")
+    try:
+        with temp_path.open("wb") as f:
+            f.write(bytes(header))
+            for record in record_data:
+                f.write(record)
+        os.replace(temp_path, file_path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+
+def write_meta(
+    file_path: Path,
+    series: Optional[str] = None,
+    series_index: Optional[float] = None,
+    publisher: Optional[str] = None,
+    cover_path: Optional[Path] = None,
+) -> None:
+    """
+    Update a book's metadata and cover in one pass
+
+    :param file_path:
+    :param series:
+    :param series_index:
+    :param publisher:
+    :param cover_path: new cover image
+    :return:
+    """
+    ext = file_path.suffix.lower()
+    if ext == ".epub":
+        return write_epub_meta(file_path, series, series_index, publisher, cover_path)
+    if ext in (".mobi", ".azw", ".azw3"):
+        return write_mobi_meta(file_path, publisher, cover_path)
+    raise BookMetaError(f"Unsupported format: {ext}")
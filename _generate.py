@@ -4,21 +4,25 @@
 # https://opensource.org/licenses/GPL-3.0
 
 import argparse
+import hashlib
 import json
 import logging
 import os
+import queue
 import re
 import shutil
 import subprocess
 import sys
+import threading
 import time
 from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
 from functools import cmp_to_key
-from math import ceil
 from pathlib import Path
 from timeit import default_timer as timer
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from urllib.parse import urlencode, urljoin
 from xml.dom import minidom
 
@@ -26,6 +30,21 @@ import humanize  # type: ignore
 import requests  # type: ignore
 from bleach import linkify
 
+from _artifact_cache import ArtifactCache, file_sha256
+from _budget import RunBudget, get_recipe_priority
+from _calibre_worker import CalibreWorkerError, CalibreWorkerPool
+from _ebook_meta import BookMeta, BookMetaError, read_meta, write_meta
+from _history import (
+    OUTCOME_CACHED,
+    OUTCOME_ERROR,
+    OUTCOME_FAILED,
+    OUTCOME_GENERATED,
+    OUTCOME_LOCAL,
+    OUTCOME_RECOVERED,
+    OUTCOME_TIMEOUT,
+    RecipeHistory,
+    RunRecord,
+)
 from _opds import extension_contenttype_map, init_feed, simple_tag
 from _recipe_utils import Recipe, is_windows, sort_category
 from _recipes import (
@@ -46,16 +65,75 @@ logger.setLevel(logging.INFO)
 
 publish_folder = Path("public")
 meta_folder = Path("meta")
+oeb_folder = Path("oeb")  # intermediate builds for single-fetch mode
 job_log_filename = "job_log.json"
+history_filename = "history.json"
+checkpoint_filename = "checkpoint.jsonl"
 catalog_path = "catalog.xml"
 index_json_filename = "index.json"
 lunr_docs_json_filename = "lunr_docs.json"
 default_retry_wait_interval = 2
+max_retry_wait_interval = 30
+min_recipe_timeout = 60  # for recipes run when the budget is nearly used up
+cache_download_workers = 4
+
+# shared by all the recipes so that the number of concurrent downloads is bounded
+cache_download_executor = ThreadPoolExecutor(
+    max_workers=cache_download_workers, thread_name_prefix="cache-download"
+)
 
 RecipeOutput = namedtuple(
     "RecipeOutput",
     ["recipe", "title", "file", "rename_to", "published_dt", "description", "articles"],
 )
+PipelineContext = namedtuple(
+    "PipelineContext",
+    [
+        "publish_site",
+        "cached",
+        "cache_sess",
+        "artifact_cache",
+        "regenerate_recipes_slugs",
+        "verbose_mode",
+        "single_fetch",
+        "calibre_workers",
+        "budget",
+        "today",
+    ],
+)
+
+
+@dataclass
+class RecipeJob:
+    """Tracks a recipe as it moves through the generation pipeline stages"""
+
+    recipe: Recipe
+    cmd: List[str]  # ebook-convert command to execute the recipe
+    env: Dict[str, str]  # environment for the recipe process
+    source_hash: str = ""  # hash of the recipe source
+    fetch_timeouts: List[int] = field(
+        default_factory=list
+    )  # timeout for each attempt at executing the recipe
+    exit_code: int = 0
+    job_status: str = ""
+    error_status: str = (
+        ""  # set if the recipe failed and should not be processed further
+    )
+    last_run: float = 0
+    fetch_duration: float = 0  # seconds taken by the attempt that completed the fetch
+    oeb_path: Optional[Path] = None  # intermediate build folder
+    source_file_path: Optional[Path] = None
+    title: str = ""
+    pub_date: Optional[datetime] = None
+    comments: List[str] = field(default_factory=list)
+    outputs: List[RecipeOutput] = field(default_factory=list)
+    index_entries: List[Dict] = field(default_factory=list)
+    covers: Dict[str, str] = field(default_factory=dict)
+    output: List[str] = field(default_factory=list)  # captured process output
+    queued_at: float = 0
+    stage_timings: Dict[str, float] = field(default_factory=dict)
+    stage_waits: Dict[str, float] = field(default_factory=dict)
+
 
 # sort categories for display
 # Ignoring mypy error below because of https://github.com/python/mypy/issues/9372
@@ -76,6 +154,14 @@ def _get_env_csv(key: str) -> List[str]:
     return slugs
 
 
+def _get_env_int(key: str, default: int = 0) -> int:
+    # get int format env values
+    try:
+        return int(str(os.environ[key]).strip())
+    except (KeyError, ValueError):
+        return default
+
+
 def _get_env_accounts_info() -> Dict:
     accounts_info = {}
     try:
@@ -95,14 +181,35 @@ def _get_env_accounts_info() -> Dict:
 
 
 # fetch index.json from published site
-def _fetch_cache(site, cache_sess: requests.Session) -> Dict:
+def _fetch_cache(
+    site, cache_sess: requests.Session, artifact_cache: Optional[ArtifactCache] = None
+) -> Dict:
     retry_attempts = 1
     timeout = 15
+    index_url = urljoin(site, index_json_filename)
     for attempt in range(1 + retry_attempts):
-        res = cache_sess.get(urljoin(site, index_json_filename), timeout=timeout)
         try:
+            res = cache_sess.get(
+                index_url,
+                headers=(
+                    artifact_cache.conditional_headers(index_url)
+                    if artifact_cache
+                    else {}
+                ),
+                timeout=timeout,
+            )
+            cached_index_path = (
+                artifact_cache.lookup(index_url) if artifact_cache else None
+            )
+            if res.status_code == 304 and cached_index_path:
+                logger.debug(f"Using {index_json_filename} from the artifact cache")
+                with cached_index_path.open("r", encoding="utf-8") as f:
+                    return json.load(f)
             res.raise_for_status()
-            return res.json()
+            cached = res.json()
+            if artifact_cache:
+                artifact_cache.store_content(index_url, res.content, res.headers)
+            return cached
         except Exception as err:  # noqa, pylint: disable=broad-except
             if attempt < retry_attempts:
                 logger.warning(
@@ -117,12 +224,18 @@ def _fetch_cache(site, cache_sess: requests.Session) -> Dict:
 
 
 def _add_recipe_summary(
-    rec: Recipe, status: str, duration: Optional[timedelta] = None
+    rec: Recipe,
+    status: str,
+    duration: Optional[timedelta] = None,
+    stage_timings: Optional[Dict[str, float]] = None,
 ) -> str:
     duration_str = "0"
     if duration:
         duration_str = humanize.precisedelta(duration)
-    return f"| {rec.name} | {status} | {duration_str} |\n"
+    stages_str = ""
+    if stage_timings:
+        stages_str = ", ".join(f"{k} {v:.1f}s" for k, v in stage_timings.items())
+    return f"| {rec.name} | {status} | {duration_str} | {stages_str} |\n"
 
 
 def _write_opds(generated_output: Dict, recipe_covers: Dict, publish_site: str) -> None:
@@ -280,81 +393,191 @@ def _find_output(folder_path: Path, slug: str, ext: str) -> List[Path]:
     return [r for r in res if slug_match_re.match(r.name)]
 
 
-def _get_cached_files(recipe: Recipe, cached: Dict):
+def _get_cached_files(recipe: Recipe, cached: "Future[Dict]"):
     """
-    Get the list of cached files for a recipe
+    Get the list of cached files for a recipe. Waits for the
+    index of the published site if it is still being fetched.
 
     :param recipe:
-    :param cached:
+    :param cached: index of the published site
     :return:
     """
+    cached_index = cached.result()
     # [TODO] changed from using name to slug, check name to keep backward compat
-    return cached.get(recipe.slug, []) or cached.get(recipe.name, [])
+    return cached_index.get(recipe.slug, []) or cached_index.get(recipe.name, [])
 
 
-def _download_from_cache(
-    recipe: Recipe, cached: Dict, publish_site: str, cache_sess: requests.Session
-) -> bool:
+class IntegrityError(Exception):
+    """A downloaded file does not match its size or hash in the index."""
+
+
+def _verify_file(file_path: Path, size: int = 0, sha256: str = "") -> None:
     """
-    Download a recipe output from the published site
-    :param recipe:
-    :param cached:
-    :param publish_site:
-    :param cache_sess:
+    Check a file against its expected size and sha256
+
+    :param file_path:
+    :param size: not checked if 0
+    :param sha256: not checked if empty
     :return:
     """
-    abort = False
-    cached_files = _get_cached_files(recipe, cached)
-    for cached_item in cached_files:
-        ext = Path(cached_item["filename"]).suffix
-        if ext != f".{recipe.src_ext}" and ext not in [
-            f".{x}" for x in recipe.target_ext
-        ]:
-            continue
+    if size and file_path.stat().st_size != size:
+        raise IntegrityError(
+            f"Size mismatch: expected {size}, got {file_path.stat().st_size}"
+        )
+    if sha256 and file_sha256(file_path) != sha256:
+        raise IntegrityError("SHA-256 mismatch")
+
+
+def _restore_cached_file(
+    artifact_cache: ArtifactCache, url: str, file_path: Path
+) -> bool:
+    """
+    Restore a file from the artifact cache
+
+    :param artifact_cache:
+    :param url:
+    :param file_path:
+    :return: False if the file could not be restored
+    """
+    try:
+        return artifact_cache.restore(url, file_path)
+    except OSError as err:
+        logger.warning(f'Unable to restore "{url}" from the artifact cache: {err}')
+        return False
+
+
+def _download_cached_file(
+    url: str,
+    file_path: Path,
+    cache_sess: requests.Session,
+    retry_attempts: int = 1,
+    artifact_cache: Optional[ArtifactCache] = None,
+    expected_size: int = 0,
+    expected_sha256: str = "",
+) -> bool:
+    """
+    Download a file, resuming a partial download with a Range request on retry.
+    If the file is in the artifact cache and is unchanged, it is linked from there.
+    The file is verified against the size and sha256 from the index if available.
 
-        ebook_url = urljoin(publish_site, cached_item["filename"])
+    :param url:
+    :param file_path:
+    :param cache_sess:
+    :param retry_attempts:
+    :param artifact_cache:
+    :param expected_size:
+    :param expected_sha256:
+    :return: True if successful
+    """
+    part_file_path = file_path.with_name(f"{file_path.name}.part")
+    timeout = 30
+    for attempt in range(1 + retry_attempts):
         try:
-            # see if this fixes the ReadTimeout for large files, e.g. WSJ-print
-            cache_sess.head(ebook_url, timeout=5)
+            headers = {}
+            downloaded = part_file_path.stat().st_size if part_file_path.exists() else 0
+            if downloaded:
+                headers["Range"] = f"bytes={downloaded}-"
+            elif artifact_cache:
+                headers.update(artifact_cache.conditional_headers(url))
+            logger.debug(f'Downloading "{url}"...')
+            ebook_res = cache_sess.get(
+                url, headers=headers, timeout=timeout, stream=True
+            )
+            if ebook_res.status_code == 304:
+                ebook_res.close()
+                if artifact_cache and _restore_cached_file(
+                    artifact_cache, url, file_path
+                ):
+                    logger.debug(f'Restored "{url}" from the artifact cache')
+                    _verify_file(file_path, expected_size, expected_sha256)
+                    return True
+                # the cached copy is gone, e.g. pruned, so download it in full
+                logger.debug(f'"{url}" is no longer in the artifact cache')
+                if artifact_cache:
+                    artifact_cache.discard(url)
+                ebook_res = cache_sess.get(url, timeout=timeout, stream=True)
+            with ebook_res:
+                if ebook_res.status_code == 416:
+                    # partial file is not usable, start over on retry
+                    part_file_path.unlink()
+                ebook_res.raise_for_status()
+                mode = "ab" if downloaded and ebook_res.status_code == 206 else "wb"
+                with part_file_path.open(mode) as f:
+                    for chunk in ebook_res.iter_content(chunk_size=64 * 1024):
+                        f.write(chunk)
+            _verify_file(part_file_path, expected_size, expected_sha256)
+            part_file_path.replace(file_path)
+            if artifact_cache:
+                try:
+                    artifact_cache.store(url, file_path, ebook_res.headers)
+                except OSError as cache_err:
+                    logger.warning(f'Unable to cache "{url}": {cache_err}')
+            return True
         except (
             requests.exceptions.ReadTimeout,
             requests.exceptions.HTTPError,  # it happens
             requests.exceptions.ConnectionError,  # e.g. Connection aborted.
-        ) as head_err:  # noqa
-            logger.warning(
-                f"{head_err.__class__.__name__} sending HEAD request for {ebook_url}"
-            )
-            time.sleep(default_retry_wait_interval)
+            requests.exceptions.ChunkedEncodingError,
+            IntegrityError,
+        ) as err:
+            if isinstance(err, IntegrityError):
+                # start over without the partial download or cached copy
+                logger.warning(f"{err} for {url}")
+                for invalid_file_path in (part_file_path, file_path):
+                    if invalid_file_path.exists():
+                        invalid_file_path.unlink()
+                if artifact_cache:
+                    artifact_cache.discard(url)
+            if attempt < retry_attempts:
+                logger.warning(
+                    f"{err.__class__.__name__} downloading {url}. "
+                    f"Retrying after {default_retry_wait_interval}s..."
+                )
+                timeout += 30
+                time.sleep(default_retry_wait_interval)
+                continue
+            logger.error(f"[!] {err.__class__.__name__} for {url}")
+    if part_file_path.exists():
+        part_file_path.unlink()
+    return False
 
-        timeout = 30
-        for attempt in range(1 + recipe.retry_attempts):
-            try:
-                logger.debug(f'Downloading "{ebook_url}"...')
-                ebook_res = cache_sess.get(ebook_url, timeout=timeout, stream=True)
-                ebook_res.raise_for_status()
-                with publish_folder.joinpath(cached_item["filename"]).open("wb") as f:
-                    shutil.copyfileobj(ebook_res.raw, f)
-                abort = False
-                break
-            except (
-                requests.exceptions.ReadTimeout,
-                requests.exceptions.HTTPError,  # it happens
-                requests.exceptions.ConnectionError,  # e.g. Connection aborted.
-            ) as err:
-                if attempt < recipe.retry_attempts:
-                    logger.warning(
-                        f"{err.__class__.__name__} downloading {ebook_url}. "
-                        f"Retrying after {default_retry_wait_interval}s..."
-                    )
-                    timeout += 30
-                    time.sleep(default_retry_wait_interval)
-                    continue
-                logger.error(f"[!] {err.__class__.__name__} for {ebook_url}")
-                abort = True
-                if ext == f".{recipe.src_ext}":
-                    # if primary format, abort early
-                    return abort
-    return abort
+
+def _download_from_cache(
+    recipe: Recipe,
+    cached: "Future[Dict]",
+    publish_site: str,
+    cache_sess: requests.Session,
+    artifact_cache: Optional[ArtifactCache] = None,
+) -> bool:
+    """
+    Download a recipe output from the published site
+    :param recipe:
+    :param cached:
+    :param publish_site:
+    :param cache_sess:
+    :param artifact_cache:
+    :return: True if any of the downloads failed
+    """
+    cached_files = [
+        cached_item
+        for cached_item in _get_cached_files(recipe, cached)
+        if Path(cached_item["filename"]).suffix
+        in [f".{x}" for x in [recipe.src_ext] + recipe.target_ext]
+    ]
+    futures = [
+        cache_download_executor.submit(
+            _download_cached_file,
+            urljoin(publish_site, cached_item["filename"]),
+            publish_folder.joinpath(cached_item["filename"]),
+            cache_sess,
+            recipe.retry_attempts,
+            artifact_cache,
+            cached_item.get("size", 0),
+            cached_item.get("sha256", ""),
+        )
+        for cached_item in cached_files
+    ]
+    return not all(future.result() for future in futures)
 
 
 def _linkify_attrs(attrs, _=False):
@@ -369,6 +592,1150 @@ def _linkify_attrs(attrs, _=False):
     return attrs
 
 
+def _get_recipe_cmd(
+    recipe: Recipe, accounts_info: Dict, verbose_mode: bool, single_fetch: bool = False
+) -> List[str]:
+    """
+    Build the ebook-convert command to execute a recipe
+
+    :param recipe:
+    :param accounts_info:
+    :param verbose_mode:
+    :param single_fetch: fetch into an intermediate OEB build instead of src_ext
+    :return:
+    """
+    recipe_path = Path(f"{recipe.recipe}.recipe")
+    if single_fetch:
+        # an output path without an extension makes ebook-convert write an OEB folder
+        output_path = oeb_folder.joinpath(recipe.slug)
+    else:
+        output_path = publish_folder.joinpath(f"{recipe.slug}.{recipe.src_ext}")
+    cmd = [
+        "ebook-convert",
+        str(recipe_path),
+        str(output_path),
+    ]
+    try:
+        recipe_account = accounts_info.get(recipe.slug, {})
+        recipe_username = recipe_account.get("username", None)
+        recipe_password = recipe_account.get("password", None)
+        if recipe_username and recipe_password:
+            cmd.extend(
+                [f"--username={recipe_username}", f"--password={recipe_password}"]
+            )
+    except:  # noqa, pylint: disable=bare-except
+        pass
+    # for single_fetch, format-specific options are applied when converting the OEB build
+    if not single_fetch:
+        if recipe.conv_options and recipe.conv_options.get(recipe.src_ext):
+            cmd.extend(recipe.conv_options[recipe.src_ext])
+        customised_css_filename = Path("static", f"{recipe.src_ext}.css")
+        if customised_css_filename.exists():
+            cmd.append(f"--extra-css={str(customised_css_filename)}")
+    if verbose_mode:
+        cmd.append("-vv")
+    return cmd
+
+
+def _get_recipe_source_hash(recipe: Recipe) -> str:
+    """
+    Hash of the recipe source and the shared recipe includes so that
+    changes to how a book is generated can be detected
+
+    :param recipe:
+    :return:
+    """
+    sha256 = hashlib.sha256()
+    for source_path in [Path(f"{recipe.recipe}.recipe")] + sorted(
+        Path("recipes/includes").glob("*.py")
+    ):
+        if source_path.exists():
+            sha256.update(source_path.read_bytes())
+    return sha256.hexdigest()
+
+
+def _get_recipe_env(recipe: Recipe, verbose_mode: bool) -> Dict[str, str]:
+    """
+    Build the environment for a recipe process so that recipes
+    running concurrently don't share os.environ settings
+
+    :param recipe:
+    :param verbose_mode:
+    :return:
+    """
+    env = dict(os.environ)
+    env["newsrack_title_dt_format"] = recipe.title_date_format
+    env["newsrack_title_dts_format"] = recipe.recipe_datetime_format
+    if verbose_mode:
+        # set recipe debug output folder
+        env["recipe_debug_folder"] = str(publish_folder.absolute())
+    return env
+
+
+def _run_calibre_cmd(
+    cmd: List[str],
+    calibre_workers: Optional[CalibreWorkerPool],
+    timeout: Optional[int] = None,
+) -> Tuple[int, str]:
+    """
+    Run an ebook-convert/ebook-meta command with a persistent calibre worker
+    if available, falling back to a new process
+
+    :param cmd:
+    :param calibre_workers:
+    :param timeout:
+    :return: exit code, output
+    """
+    if calibre_workers:
+        try:
+            return calibre_workers.run(cmd, timeout=timeout)
+        except CalibreWorkerError as err:
+            logger.debug(f"Running {cmd[0]} in a new process: {err}")
+    proc = subprocess.run(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout
+    )
+    return proc.returncode, proc.stdout.decode("utf-8", "replace")
+
+
+def _run_cmd(
+    job: RecipeJob,
+    cmd: List[str],
+    calibre_workers: Optional[CalibreWorkerPool] = None,
+    **kwargs,
+) -> int:
+    """
+    Run a command and keep its output with the job so that the logs of
+    recipes being processed concurrently don't interleave
+
+    :param job:
+    :param cmd:
+    :param calibre_workers: run the calibre command with a persistent worker
+    :param kwargs: passed to subprocess.run()
+    :return:
+    """
+    if calibre_workers and "env" not in kwargs:
+        try:
+            exit_code, output = calibre_workers.run(cmd, timeout=kwargs.get("timeout"))
+            job.output.append(output)
+            return exit_code
+        except CalibreWorkerError as err:
+            logger.debug(f"Running {cmd[0]} in a new process: {err}")
+    try:
+        proc = subprocess.run(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **kwargs
+        )
+    except subprocess.TimeoutExpired as timeout_err:
+        if timeout_err.output:
+            job.output.append(timeout_err.output.decode("utf-8", "replace"))
+        raise
+    job.output.append(proc.stdout.decode("utf-8", "replace"))
+    return proc.returncode
+
+
+def _should_run_recipe(
+    recipe: Recipe,
+    get_cached_files: Callable[[], List],
+    regenerate_recipes_slugs: List[str],
+) -> bool:
+    """
+    Check if a recipe should be executed instead of restored from cache
+
+    :param recipe:
+    :param get_cached_files: only called if needed because it may wait
+        for the index of the published site
+    :param regenerate_recipes_slugs:
+    :return:
+    """
+    return bool(
+        # regenerate restriction is not in place and recipe is enabled
+        (recipe.is_enabled() and not regenerate_recipes_slugs)
+        # regenerate restriction is in place and recipe is included
+        or (regenerate_recipes_slugs and recipe.slug in regenerate_recipes_slugs)
+        # not cached (so that we always have a copy available)
+        or not get_cached_files()
+    )
+
+
+def _estimate_recipe_duration(
+    recipe: Recipe, history: RecipeHistory, context: PipelineContext
+) -> float:
+    """
+    Estimate how long a recipe will take from its run history.
+    Recipes without history are assumed to take up to their timeout.
+    Disabled recipes are assumed to have a cached copy so that the
+    estimate does not wait for the index of the published site.
+
+    :param recipe:
+    :param history:
+    :param context:
+    :return: seconds
+    """
+    if _find_output(
+        publish_folder, recipe.slug, recipe.src_ext
+    ) or not _should_run_recipe(recipe, lambda: [{}], context.regenerate_recipes_slugs):
+        return 0
+    estimate = history.estimate(recipe.slug)
+    return recipe.timeout if estimate is None else estimate
+
+
+def _get_fetch_timeouts(recipe: Recipe, history: RecipeHistory) -> List[int]:
+    """
+    Timeouts for each attempt at executing a recipe. The first attempt uses
+    the timeout learnt from the recipe's history, and it is doubled for
+    each retry, up to the recipe's configured timeout.
+
+    :param recipe:
+    :param history:
+    :return:
+    """
+    fetch_timeout = history.fetch_timeout(recipe.slug, recipe.timeout)
+    return [
+        min(fetch_timeout * 2**attempt, recipe.timeout)
+        for attempt in range(recipe.retry_attempts + 1)
+    ]
+
+
+def _get_run_record(job: RecipeJob) -> RunRecord:
+    """
+    Summarise a finished job for the run history
+
+    :param job:
+    :return:
+    """
+    if job.error_status == ":x: Convert Timeout":
+        outcome = OUTCOME_TIMEOUT
+    elif job.error_status:
+        outcome = OUTCOME_FAILED if job.last_run else OUTCOME_ERROR
+    elif job.last_run and job.job_status == ":outbox_tray: From cache":
+        # the recipe had no output and was restored from cache
+        outcome = OUTCOME_RECOVERED
+    elif job.last_run:
+        outcome = OUTCOME_GENERATED
+    elif job.job_status == ":file_folder: From local":
+        outcome = OUTCOME_LOCAL
+    else:
+        outcome = OUTCOME_CACHED
+    book_bytes = 0
+    if job.outputs:
+        book_file_path = publish_folder.joinpath(job.outputs[0].rename_to)
+        if book_file_path.exists():
+            book_bytes = book_file_path.stat().st_size
+    return RunRecord(
+        timestamp=time.time(),
+        duration=round(sum(job.stage_timings.values()), 1),
+        outcome=outcome,
+        articles=len(job.outputs[0].articles) if job.outputs else 0,
+        bytes=book_bytes,
+        fetch=round(job.fetch_duration, 1) if outcome == OUTCOME_GENERATED else 0,
+    )
+
+
+def _get_budget_timeout(timeout: int, context: PipelineContext) -> int:
+    """
+    Limit a recipe's timeout to the time left in the budget
+
+    :param timeout:
+    :param context:
+    :return:
+    """
+    if not context.budget:
+        return timeout
+    return max(min_recipe_timeout, min(timeout, int(context.budget.remaining())))
+
+
+def _run_fetch(job: RecipeJob, context: PipelineContext, start_time: float) -> None:
+    """
+    Execute a recipe, retrying with the job's longer timeouts
+
+    :param job:
+    :param context:
+    :param start_time:
+    :return:
+    """
+    recipe = job.recipe
+    fetch_timeouts = job.fetch_timeouts or [recipe.timeout]
+    for attempt, fetch_timeout in enumerate(fetch_timeouts):
+        attempt_start_time = timer()
+        try:
+            # run recipe
+            job.exit_code = _run_cmd(
+                job,
+                job.cmd,
+                timeout=_get_budget_timeout(fetch_timeout, context),
+                env=job.env,
+            )
+            # excludes the earlier timed out attempts and the waits between them
+            job.fetch_duration = timer() - attempt_start_time
+            break
+        except subprocess.TimeoutExpired:
+            if attempt + 1 < len(fetch_timeouts) and not (
+                context.budget and context.budget.remaining() < min_recipe_timeout
+            ):
+                recipe_elapsed_time = timedelta(seconds=timer() - start_time)
+                wait_interval = min(
+                    default_retry_wait_interval * 2**attempt,
+                    max_retry_wait_interval,
+                )
+                logger.warning(
+                    f"TimeoutExpired fetching '{recipe.name}' "
+                    f"after {humanize.precisedelta(recipe_elapsed_time)}. "
+                    f"Retrying with a timeout of {fetch_timeouts[attempt + 1]}s "
+                    f"after {wait_interval}s..."
+                )
+                time.sleep(wait_interval)
+                continue
+            raise
+
+
+def _fetch_stage(job: RecipeJob, context: PipelineContext) -> None:
+    """
+    Execute a recipe, or restore its output from cache
+
+    :param job:
+    :param context:
+    :return:
+    """
+    recipe = job.recipe
+    recipe_start_time = timer()
+
+    def get_cached_files() -> List:
+        return _get_cached_files(recipe, context.cached)
+
+    if _find_output(publish_folder, recipe.slug, recipe.src_ext):
+        job.job_status = ":file_folder: From local"
+        if context.budget:
+            context.budget.release(recipe.slug)
+    else:
+        # existing file does not exist
+        try:
+            run_recipe = _should_run_recipe(
+                recipe, get_cached_files, context.regenerate_recipes_slugs
+            )
+            over_budget = False
+            if (
+                run_recipe
+                and context.budget
+                and not context.budget.claim(recipe.slug)
+                and get_cached_files()
+            ):
+                # not enough time left, so fall back to the cached copy
+                run_recipe = False
+                over_budget = True
+            if run_recipe:
+                oeb_path = oeb_folder.joinpath(recipe.slug)
+                if context.single_fetch:
+                    # clear any stale intermediate build
+                    shutil.rmtree(oeb_path, ignore_errors=True)
+                    oeb_folder.mkdir(parents=True, exist_ok=True)
+                fetched = False
+                try:
+                    _run_fetch(job, context, recipe_start_time)
+                    fetched = job.exit_code == 0
+                finally:
+                    if context.single_fetch:
+                        if fetched:
+                            job.oeb_path = oeb_path
+                        else:
+                            # failed or timed out, nothing to build from
+                            shutil.rmtree(oeb_path, ignore_errors=True)
+                job.last_run = time.time()
+
+            else:
+                # use cache
+                if context.budget:
+                    # stop setting aside time for the recipe
+                    context.budget.release(recipe.slug)
+                if over_budget:
+                    logger.warning(
+                        f'Using cached copy for "{recipe.name}" '
+                        f"because there is not enough time left in the budget."
+                    )
+                else:
+                    logger.warning(f'Using cached copy for "{recipe.name}".')
+                abort_recipe = _download_from_cache(
+                    recipe,
+                    context.cached,
+                    context.publish_site,
+                    context.cache_sess,
+                    context.artifact_cache,
+                )
+                if abort_recipe:
+                    job.error_status = ":x: Cache Timeout"
+                    return
+                job.job_status = (
+                    ":hourglass: From cache (over budget)"
+                    if over_budget
+                    else ":outbox_tray: From cache"
+                )
+
+        except subprocess.TimeoutExpired:
+            logger.exception(f"[!] TimeoutExpired fetching '{recipe.name}'")
+            job.error_status = ":x: Convert Timeout"
+            return
+
+
+def _build_from_oeb(job: RecipeJob, context: PipelineContext) -> None:
+    """
+    Convert the intermediate OEB build of a recipe into all the
+    required formats concurrently
+
+    :param job:
+    :param context:
+    :return:
+    """
+    recipe = job.recipe
+    oeb_path: Path = job.oeb_path  # type: ignore[assignment]
+    opf_path = next(iter(sorted(oeb_path.glob("*.opf"))), None)
+    if not opf_path:
+        logger.error(f'Unable to find the OEB build for "{recipe.name}": {oeb_path}')
+        shutil.rmtree(oeb_path, ignore_errors=True)
+        return
+
+    def _get_output_path(ext: str) -> Path:
+        return publish_folder.joinpath(f"{recipe.slug}.{ext}")
+
+    def _convert(ext: str) -> int:
+        cmd = ["ebook-convert", str(opf_path), str(_get_output_path(ext))]
+        if recipe.conv_options and recipe.conv_options.get(ext):
+            cmd.extend(recipe.conv_options[ext])
+        customised_css_filename = Path("static", f"{ext}.css")
+        if customised_css_filename.exists():
+            cmd.append(f"--extra-css={str(customised_css_filename)}")
+        if context.verbose_mode:
+            cmd.append("-vv")
+        try:
+            return _run_cmd(job, cmd, context.calibre_workers, timeout=recipe.timeout)
+        except subprocess.TimeoutExpired:
+            logger.exception(f"[!] TimeoutExpired converting '{recipe.name}' to {ext}")
+            return 1
+
+    exts = list(dict.fromkeys([recipe.src_ext] + recipe.target_ext))
+    try:
+        with ThreadPoolExecutor(max_workers=len(exts)) as executor:
+            exit_codes = dict(zip(exts, executor.map(_convert, exts)))
+    finally:
+        shutil.rmtree(oeb_path, ignore_errors=True)
+    for ext, exit_code in exit_codes.items():
+        if exit_code:
+            logger.warning(f'Unable to convert "{recipe.name}" to {ext}: {exit_code}')
+    job.exit_code = exit_codes[recipe.src_ext]
+    for ext, exit_code in exit_codes.items():
+        if exit_code or job.exit_code:
+            # remove the partial output, and the other formats if the recipe failed.
+            # A missing alternative format is converted from the source book
+            # in the formats stage instead.
+            _get_output_path(ext).unlink(missing_ok=True)
+
+
+def _build_stage(job: RecipeJob, context: PipelineContext) -> None:
+    """
+    Build the output formats from the intermediate OEB build if available,
+    and find the source book, falling back to the cached copy.
+
+    :param job:
+    :param context:
+    :return:
+    """
+    recipe = job.recipe
+    if job.oeb_path and not job.exit_code:
+        _build_from_oeb(job, context)
+
+    source_file_paths = sorted(
+        _find_output(publish_folder, recipe.slug, recipe.src_ext)
+    )
+    if not source_file_paths and _get_cached_files(recipe, context.cached):
+        logger.warning(
+            f'Using cached copy for "{recipe.name}" because recipe has no output.'
+        )
+        # try to use cached copy if recipe does not have output
+        # for example FT(Print) has no weekend issue, so we'll try to keep the last issue
+        _ = _download_from_cache(
+            recipe,
+            context.cached,
+            context.publish_site,
+            context.cache_sess,
+            context.artifact_cache,
+        )
+        source_file_paths = sorted(
+            _find_output(publish_folder, recipe.slug, recipe.src_ext)
+        )
+        if source_file_paths:
+            # reset exit_code (not 0 because of failed recipe ebook-convert)
+            job.exit_code = 0
+            job.job_status = ":outbox_tray: From cache"
+
+    if not source_file_paths:
+        logger.error(
+            f"Unable to find source generated: '/{recipe.slug}*.{recipe.src_ext}'"
+        )
+        job.error_status = ":x: No output"
+        return
+
+    if job.exit_code:
+        logger.error(f"ebook-convert exited with the code: {job.exit_code}")
+        job.error_status = ":x: Failed"
+        return
+
+    job.source_file_path = source_file_paths[-1]
+
+
+def _read_book_meta_with_calibre(
+    file_path: Path, calibre_workers: Optional[CalibreWorkerPool] = None
+) -> BookMeta:
+    """
+    Read a book's metadata by parsing the output of calibre's ebook-meta
+
+    :param file_path:
+    :param calibre_workers:
+    :return:
+    """
+    _, meta_out = _run_calibre_cmd(["ebook-meta", str(file_path)], calibre_workers)
+    book_meta = BookMeta()
+    mobj = re.search(
+        r"Published\s+:\s(?P<pub_date>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})",
+        meta_out,
+    )
+    if mobj:
+        book_meta.published = datetime.strptime(
+            mobj.group("pub_date"), "%Y-%m-%dT%H:%M:%S"
+        ).replace(tzinfo=timezone.utc)
+    mobj = re.search(r"Title\s+:\s(?P<title>.+)", meta_out)
+    if mobj:
+        book_meta.title = mobj.group("title")
+    mobj = re.search(r"Comments\s+:\s(?P<comments>.+)", meta_out, re.DOTALL)
+    if mobj:
+        book_meta.comments = mobj.group("comments")
+    return book_meta
+
+
+def _read_book_meta(
+    file_path: Path, calibre_workers: Optional[CalibreWorkerPool] = None
+) -> BookMeta:
+    """
+    Read a book's metadata in-process, falling back to calibre's ebook-meta
+    for formats that are not supported
+
+    :param file_path:
+    :param calibre_workers:
+    :return:
+    """
+    try:
+        return read_meta(file_path)
+    except BookMetaError as err:
+        logger.debug(f'Using ebook-meta for "{file_path}": {err}')
+    return _read_book_meta_with_calibre(file_path, calibre_workers)
+
+
+def _write_book_meta(
+    file_path: Path,
+    series: str,
+    series_index: int,
+    publisher: str,
+    cover_file_path: Optional[Path] = None,
+    calibre_workers: Optional[CalibreWorkerPool] = None,
+) -> None:
+    """
+    Set a book's series, publisher and cover, falling back to ebook-meta
+    if the book can't be updated in-process.
+
+    :param file_path:
+    :param series:
+    :param series_index:
+    :param publisher:
+    :param cover_file_path:
+    :param calibre_workers:
+    :return:
+    """
+    try:
+        write_meta(
+            file_path,
+            series=series,
+            series_index=series_index,
+            publisher=publisher,
+            cover_path=cover_file_path,
+        )
+        return
+    except (BookMetaError, OSError) as err:
+        logger.debug(f'Using ebook-meta for "{file_path}": {err}')
+    meta_cmd = [
+        "ebook-meta",
+        str(file_path),
+        f"--series={series}",
+        f"--index={series_index}",
+        f"--publisher={publisher}",
+    ]
+    if cover_file_path:
+        meta_cmd.append(f"--cover={str(cover_file_path)}")
+    _ = _run_calibre_cmd(meta_cmd, calibre_workers)
+
+
+def _metadata_stage(job: RecipeJob, context: PipelineContext) -> None:
+    """
+    Read the generated book's metadata
+
+    :param job:
+    :param context:
+    :return:
+    """
+    recipe = job.recipe
+    source_file_path: Path = job.source_file_path  # type: ignore[assignment]
+    logger.debug(f'Get book meta info for "{source_file_path}"')
+    book_meta = _read_book_meta(source_file_path, context.calibre_workers)
+    pub_date = book_meta.published or context.today
+    title = book_meta.title
+    rename_file_name = Path(f"{recipe.slug}-{pub_date:%Y-%m-%d}.{recipe.src_ext}")
+
+    comments = []
+    description = ""
+    if book_meta.comments:
+        try:
+            comments = [c.strip() for c in book_meta.comments.split("\n") if c.strip()]
+            description = (
+                f"{comments[0]}"
+                f'<ul><li>{"</li><li>".join(comments[1:-1])}</li></ul>'
+                f"{linkify(comments[-1], callbacks=[_linkify_attrs])}"
+            )
+        except:  # noqa, pylint: disable=bare-except
+            pass
+
+    job.title = title
+    job.pub_date = pub_date
+    job.comments = comments
+    job.outputs.append(
+        RecipeOutput(
+            recipe=recipe,
+            title=title,
+            file=Path(source_file_path.name),
+            rename_to=rename_file_name,
+            published_dt=pub_date,
+            description=description,
+            articles=comments[1:-1],
+        )
+    )
+    job.index_entries.append(
+        {
+            "filename": f"{recipe.slug}-{pub_date:%Y-%m-%d}.{recipe.src_ext}",
+            "published": pub_date.timestamp(),
+        }
+    )
+
+
+def _cover_stage(job: RecipeJob, context: PipelineContext) -> None:
+    """
+    Set the cover and series metadata for a newly generated book
+
+    :param job:
+    :param context:
+    :return:
+    """
+    recipe = job.recipe
+    source_file_path: Path = job.source_file_path  # type: ignore[assignment]
+    pub_date: datetime = job.pub_date  # type: ignore[assignment]
+    pseudo_series_index = pub_date.year * 1000 + pub_date.timetuple().tm_yday
+    # (rename_file_name != source_file_name) checks that it is a newly generated file
+    # so that we don't regenerate the cover needlessly
+    is_new_file = job.outputs[0].rename_to != Path(source_file_path.name)
+    book_file_paths = [source_file_path]
+    if job.oeb_path:
+        # the alternative formats were also built from the OEB build
+        # instead of being converted from the source book
+        book_file_paths.extend(
+            p
+            for p in [
+                publish_folder.joinpath(f"{recipe.slug}.{ext}")
+                for ext in recipe.target_ext
+            ]
+            if p.exists()
+        )
+    if recipe.overwrite_cover and job.title and is_new_file:
+        # customise cover
+        logger.debug(f'Setting cover for "{source_file_path}"')
+        try:
+            cover_file_path = Path(f"{str(source_file_path)}.png")
+            generate_cover(
+                cover_file_path, job.title, recipe.cover_options, logger=logger
+            )
+            for book_file_path in book_file_paths:
+                _write_book_meta(
+                    book_file_path,
+                    recipe.name,
+                    pseudo_series_index,
+                    context.publish_site,
+                    cover_file_path,
+                    context.calibre_workers,
+                )
+            cover_file_path.unlink()
+        except Exception:  # noqa, pylint: disable=broad-except
+            logger.exception("Error generating cover")
+    elif is_new_file:
+        # just set series name
+        for book_file_path in book_file_paths:
+            _write_book_meta(
+                book_file_path,
+                recipe.name,
+                pseudo_series_index,
+                context.publish_site,
+                calibre_workers=context.calibre_workers,
+            )
+
+
+def _formats_stage(job: RecipeJob, context: PipelineContext) -> None:
+    """
+    Convert the generated book into alternative formats
+
+    :param job:
+    :param context:
+    :return:
+    """
+    recipe = job.recipe
+    source_file_path: Path = job.source_file_path  # type: ignore[assignment]
+    pub_date: datetime = job.pub_date  # type: ignore[assignment]
+    pseudo_series_index = pub_date.year * 1000 + pub_date.timetuple().tm_yday
+    comments = job.comments
+    exit_code = 0
+    for ext in recipe.target_ext:
+        target_file_name = Path(f"{recipe.slug}.{ext}")
+        target_file_path = Path(publish_folder, target_file_name)
+
+        cmd = [
+            "ebook-convert",
+            str(source_file_path),
+            str(target_file_path),
+            f"--series={recipe.name}",
+            f"--series-index={pseudo_series_index}",
+            f"--publisher={context.publish_site}",
+        ]
+        if recipe.conv_options and recipe.conv_options.get(ext):
+            cmd.extend(recipe.conv_options[ext])
+
+        customised_css_filename = Path("static", f"{ext}.css")
+        if customised_css_filename.exists():
+            cmd.append(f"--extra-css={str(customised_css_filename)}")
+        if context.verbose_mode:
+            cmd.append("-vv")
+        if not _find_output(publish_folder, recipe.slug, ext):
+            exit_code = _run_cmd(
+                job, cmd, context.calibre_workers, timeout=recipe.timeout
+            )
+
+        if not exit_code:
+            target_file_path = sorted(_find_output(publish_folder, recipe.slug, ext))[
+                -1
+            ]
+            target_file_name = Path(target_file_path.name)
+
+            job.outputs.append(
+                RecipeOutput(
+                    recipe=recipe,
+                    title=job.title,
+                    file=target_file_name,
+                    rename_to=f"{recipe.slug}-{pub_date:%Y-%m-%d}.{ext}",
+                    published_dt=pub_date,
+                    description=comments,
+                    articles=comments[1:-1],
+                )
+            )
+            job.index_entries.append(
+                {
+                    "filename": f"{recipe.slug}-{pub_date:%Y-%m-%d}.{ext}",
+                    "published": pub_date.timestamp(),
+                }
+            )
+
+
+def _add_index_hashes(
+    job: RecipeJob, context: PipelineContext, book_file_path: Path
+) -> None:
+    """
+    Record the size and sha256 of a book in its index entry so that downloads
+    can be verified, and the hash of the recipe source that generated it.
+    A book restored from cache keeps the source hash of the run that generated it.
+
+    :param job:
+    :param context:
+    :param book_file_path:
+    :return:
+    """
+    source_hash = job.source_hash
+    if not job.last_run:
+        source_hash = next(
+            (
+                cached_item.get("source_hash", "")
+                for cached_item in _get_cached_files(job.recipe, context.cached)
+                if cached_item["filename"] == book_file_path.name
+            ),
+            "",
+        )
+    for index_entry in job.index_entries:
+        if index_entry["filename"] == book_file_path.name:
+            index_entry["size"] = book_file_path.stat().st_size
+            index_entry["sha256"] = file_sha256(book_file_path)
+            index_entry["source_hash"] = source_hash
+
+
+def _assets_stage(job: RecipeJob, context: PipelineContext) -> None:
+    """
+    Rename the books to their datestamped names and extract the
+    default cover for the site
+
+    :param job:
+    :param context:
+    :return:
+    """
+    for book in job.outputs:
+        # change filename to datestamped name
+        book_file = publish_folder.joinpath(book.file)
+        book_rename_to = publish_folder.joinpath(book.rename_to)
+        if book.file != book.rename_to:
+            book_file.rename(book_rename_to)
+        _add_index_hashes(job, context, book_rename_to)
+        cover_file_name = Path(f"{book_rename_to.stem}.jpg")
+        cover_file_path = publish_folder.joinpath(cover_file_name)
+        cover_thumbnail_file_name = Path(f"{book_rename_to.stem}.thumb.jpg")
+        cover_thumbnail_file_path = publish_folder.joinpath(cover_thumbnail_file_name)
+        if (not book.recipe.overwrite_cover) and (not cover_file_path.exists()):
+            # only extract default cover not generated by newsrack
+            cover_get_cmd = [
+                "ebook-meta",
+                f"--get-cover={str(cover_file_path)}",
+                str(book_rename_to),
+            ]
+            try:
+                _ = _run_calibre_cmd(cover_get_cmd, context.calibre_workers)
+                temp_cover_file_name = Path(f"{book_rename_to.stem}.temp.jpg")
+                temp_cover_file_path = publish_folder.joinpath(temp_cover_file_name)
+                imagemagick_cmd = [
+                    "convert",
+                    str(cover_file_path),
+                    "-quality",
+                    "70",
+                    "-resize",
+                    "1024x1024>",
+                    "-unsharp",
+                    "0x.5",
+                    "-strip",
+                    str(temp_cover_file_path),
+                ]
+                exit_code = _run_cmd(job, imagemagick_cmd)
+                if exit_code:
+                    logger.warning(
+                        "convert exited with the code: {0!s}".format(exit_code)
+                    )
+                else:
+                    temp_cover_file_path.rename(cover_file_path)
+                imagemagick_cmd = [
+                    "convert",
+                    str(cover_file_path),
+                    "-quality",
+                    "80",
+                    "-thumbnail",
+                    "500x500>",
+                    "-unsharp",
+                    "0x.5",
+                    str(cover_thumbnail_file_path),
+                ]
+                exit_code = _run_cmd(job, imagemagick_cmd)
+                if exit_code:
+                    logger.warning(
+                        "convert (thumbnail) exited with the code: {0!s}".format(
+                            exit_code
+                        )
+                    )
+            except Exception as get_cover_err:  # noqa, pylint: disable=broad-except
+                logger.warning(
+                    "Unable to extract cover for %s: %s",
+                    book.rename_to,
+                    str(get_cover_err),
+                )
+        if (not book.recipe.overwrite_cover) and cover_file_path.exists():
+            job.covers = {
+                "cover": str(cover_file_name),
+                "thumbnail": str(cover_thumbnail_file_name),
+            }
+
+
+# the generation pipeline stages, in order
+# Each stage is (name, stage function, use the fetch concurrency)
+pipeline_stages: List[
+    Tuple[str, Callable[[RecipeJob, PipelineContext], None], bool]
+] = [
+    ("fetch", _fetch_stage, True),
+    ("build", _build_stage, False),
+    ("metadata", _metadata_stage, False),
+    ("cover", _cover_stage, False),
+    ("formats", _formats_stage, False),
+    ("assets", _assets_stage, False),
+]
+
+
+def _write_checkpoint(checkpoint_path: Path, job: RecipeJob) -> None:
+    """
+    Append a finished job to the checkpoint journal
+
+    :param checkpoint_path:
+    :param job:
+    :return:
+    """
+    entry = {
+        "slug": job.recipe.slug,
+        "exit_code": job.exit_code,
+        "job_status": job.job_status,
+        "error_status": job.error_status,
+        "last_run": job.last_run,
+        "fetch_duration": job.fetch_duration,
+        "title": job.title,
+        "outputs": [
+            {
+                "title": o.title,
+                "file": str(o.file),
+                "rename_to": str(o.rename_to),
+                "size": publish_folder.joinpath(o.rename_to).stat().st_size,
+                "published_dt": o.published_dt.timestamp(),
+                "description": o.description,
+                "articles": o.articles,
+            }
+            for o in job.outputs
+        ],
+        "index_entries": job.index_entries,
+        "covers": job.covers,
+        "output": "".join(job.output),
+        "stage_timings": job.stage_timings,
+        "stage_waits": job.stage_waits,
+    }
+    checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+    with checkpoint_path.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def _is_checkpointed_output(output: Dict) -> bool:
+    """
+    Check that the published file is the output recorded in a checkpoint entry,
+    e.g. not missing or left over from an older run
+
+    :param output:
+    :return:
+    """
+    file_path = publish_folder.joinpath(output["rename_to"])
+    if not file_path.exists():
+        return False
+    return "size" not in output or file_path.stat().st_size == output["size"]
+
+
+def _remove_unfinished_outputs(recipe_jobs: Dict[str, RecipeJob]) -> None:
+    """
+    Remove the published books of recipes that are not restored from the
+    checkpoint, e.g. partially written when the run was interrupted, so
+    that they are not mistaken for finished local outputs
+
+    :param recipe_jobs: jobs by slug that will be run again
+    :return:
+    """
+    for job in recipe_jobs.values():
+        recipe = job.recipe
+        for ext in dict.fromkeys([recipe.src_ext] + recipe.target_ext):
+            for file_path in _find_output(publish_folder, recipe.slug, ext):
+                logger.debug(f"Removing unfinished output: {file_path}")
+                file_path.unlink(missing_ok=True)
+
+
+def _load_checkpoint(
+    checkpoint_path: Path, recipe_jobs: Dict[str, RecipeJob]
+) -> List[str]:
+    """
+    Restore the jobs that were successfully completed in an interrupted run
+    from the checkpoint journal. Jobs that failed or with outputs that
+    are missing are not restored so that they are run again.
+
+    :param checkpoint_path:
+    :param recipe_jobs: jobs by slug, updated in place
+    :return: slugs of the restored jobs
+    """
+    restored: List[str] = []
+    try:
+        with checkpoint_path.open("r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return restored
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            # incomplete write when the run was interrupted
+            continue
+        job = recipe_jobs.get(entry["slug"])
+        if not job or entry["error_status"]:
+            continue
+        outputs = [
+            RecipeOutput(
+                recipe=job.recipe,
+                title=o["title"],
+                file=Path(o["file"]),
+                rename_to=o["rename_to"],
+                published_dt=datetime.fromtimestamp(o["published_dt"], tz=timezone.utc),
+                description=o["description"],
+                articles=o["articles"],
+            )
+            for o in entry["outputs"]
+        ]
+        if not all(_is_checkpointed_output(o) for o in entry["outputs"]):
+            continue
+        job.exit_code = entry["exit_code"]
+        job.job_status = entry["job_status"]
+        job.last_run = entry["last_run"]
+        job.fetch_duration = entry.get("fetch_duration", 0)
+        job.title = entry["title"]
+        job.outputs = outputs
+        job.index_entries = entry["index_entries"]
+        job.covers = entry["covers"]
+        job.output = [entry["output"]]
+        job.stage_timings = entry["stage_timings"]
+        job.stage_waits = entry["stage_waits"]
+        restored.append(job.recipe.slug)
+    return restored
+
+
+def _resume_jobs(
+    checkpoint_path: Path, recipe_jobs: Dict[str, RecipeJob], resume: bool
+) -> List[str]:
+    """
+    Restore the jobs completed by an interrupted run, or start over
+
+    :param checkpoint_path:
+    :param recipe_jobs: jobs by slug, updated in place
+    :param resume:
+    :return: slugs of the restored jobs
+    """
+    if not resume:
+        checkpoint_path.unlink(missing_ok=True)
+        return []
+    restored_slugs = _load_checkpoint(checkpoint_path, recipe_jobs)
+    logger.info(f"Resuming with {len(restored_slugs)} recipes already completed")
+    _remove_unfinished_outputs(
+        {s: job for s, job in recipe_jobs.items() if s not in restored_slugs}
+    )
+    return restored_slugs
+
+
+def _run_pipeline(
+    recipe_jobs: List[RecipeJob],
+    context: PipelineContext,
+    fetch_workers: int = 1,
+    on_job_done: Optional[Callable[[RecipeJob], None]] = None,
+) -> None:
+    """
+    Run jobs through the pipeline stages. Each stage has its own worker(s)
+    and the stages are connected by queues so that, for example, the
+    conversion of one recipe's output can run while the next recipe is
+    still being fetched.
+
+    :param recipe_jobs:
+    :param context:
+    :param fetch_workers: number of recipes to fetch concurrently
+    :param on_job_done: called when a job has gone through all the stages
+    :return:
+    """
+    stage_queues: List[queue.Queue] = [queue.Queue() for _ in pipeline_stages]
+
+    def _stage_worker(stage_index: int) -> None:
+        stage_name, stage_fn, _ = pipeline_stages[stage_index]
+        in_queue = stage_queues[stage_index]
+        while True:
+            job: Optional[RecipeJob] = in_queue.get()
+            if job is None:
+                break
+            if not job.error_status:
+                job.stage_waits[stage_name] = timer() - job.queued_at
+                stage_start_time = timer()
+                try:
+                    stage_fn(job, context)
+                except Exception:  # noqa, pylint: disable=broad-except
+                    logger.exception(
+                        f'[!] Error in {stage_name} stage for "{job.recipe.name}"'
+                    )
+                    job.error_status = ":x: Error"
+                job.stage_timings[stage_name] = timer() - stage_start_time
+            if stage_index + 1 < len(stage_queues):
+                job.queued_at = timer()
+                stage_queues[stage_index + 1].put(job)
+            elif on_job_done:
+                try:
+                    on_job_done(job)
+                except Exception:  # noqa, pylint: disable=broad-except
+                    logger.exception(f'[!] Error completing "{job.recipe.name}"')
+
+    for job in recipe_jobs:
+        job.queued_at = timer()
+        stage_queues[0].put(job)
+
+    stage_workers: List[List[threading.Thread]] = []
+    for stage_index, (stage_name, _, is_concurrent) in enumerate(pipeline_stages):
+        workers = [
+            threading.Thread(
+                target=_stage_worker,
+                args=(stage_index,),
+                name=f"{stage_name}-{n}",
+                daemon=True,
+            )
+            for n in range(fetch_workers if is_concurrent else 1)
+        ]
+        for worker in workers:
+            worker.start()
+        stage_workers.append(workers)
+
+    for stage_index, workers in enumerate(stage_workers):
+        # a stage is only closed after the previous stage has finished
+        # so that the sentinels are queued behind all the jobs
+        for _ in workers:
+            stage_queues[stage_index].put(None)
+        for worker in workers:
+            worker.join()
+
+
+def _log_job(job: RecipeJob, restored: bool = False) -> None:
+    """
+    Write the output of a job in its own log group
+
+    :param job:
+    :param restored: restored from the checkpoint of an interrupted run
+    :return:
+    """
+    recipe = job.recipe
+    logger.info(f"::group::{recipe.name}")
+    logger.info(f'{"-" * 20} Executing "{recipe.name}" recipe... {"-" * 30}')
+    if restored:
+        logger.info(f'Restored "{recipe.name}" from checkpoint.')
+    if job.output:
+        sys.stdout.write("".join(job.output))
+        sys.stdout.flush()
+    recipe_elapsed_time = timedelta(seconds=sum(job.stage_timings.values()))
+    logger.info(
+        "Stages: "
+        + ", ".join(
+            f"{stage_name} {job.stage_timings[stage_name]:.1f}s"
+            f" (waited {job.stage_waits.get(stage_name, 0):.1f}s)"
+            for stage_name, _, __ in pipeline_stages
+            if stage_name in job.stage_timings
+        )
+    )
+    logger.info(
+        f'{"=" * 20} "{recipe.name}" recipe took {humanize.precisedelta(recipe_elapsed_time)} {"=" * 20}'
+    )
+    logger.info("::endgroup::")
+
+
+def _on_job_done(checkpoint_path: Path, job: RecipeJob) -> None:
+    """
+    Checkpoint a job and write its output as soon as it is done so that the
+    progress shows in the CI logs, and is kept if the run is cancelled
+
+    :param checkpoint_path:
+    :param job:
+    :return:
+    """
+    _write_checkpoint(checkpoint_path, job)
+    _log_job(job)
+
+
 def run(
     publish_site: str,
     source_url: str,
@@ -377,13 +1744,34 @@ def run(
     run_id: str,
     run_url: str,
     verbose_mode: bool,
+    jobs: int = 1,
+    single_fetch: bool = False,
+    calibre_worker: bool = False,
+    budget_minutes: int = 0,
+    resume: bool = False,
+    artifact_cache_folder: str = "",
+    http_cache_folder: str = "",
+    article_store_folder: str = "",
 ) -> None:
+    budget = RunBudget(budget_minutes * 60, jobs) if budget_minutes else None
+
     # set path to recipe includes in os environ so that recipes can pick it up
     os.environ["recipes_includes"] = str(Path("recipes/includes/").absolute())
+    if http_cache_folder:
+        # recipes cache their http responses here across runs
+        os.environ["newsrack_http_cache_dir"] = str(Path(http_cache_folder).absolute())
+        http_cache_size = _get_env_int("http_cache_size")
+        if http_cache_size:
+            os.environ["newsrack_http_cache_size"] = str(http_cache_size)
+    if article_store_folder:
+        # recipes reuse their processed articles from here across runs
+        os.environ["newsrack_article_store_dir"] = str(
+            Path(article_store_folder).absolute()
+        )
 
     # for GitHub
-    job_summary = """| Recipe | Status | Duration |
-| ------ | ------ | -------- |
+    job_summary = """| Recipe | Status | Duration | Stages |
+| ------ | ------ | -------- | ------ |
 """
     if not publish_site.endswith("/"):
         publish_site += "/"
@@ -394,11 +1782,25 @@ def run(
             job_log = json.load(f)
     except Exception as err:  # noqa, pylint: disable=broad-except
         logger.warning(f"Unable to load job log: {err}")
+    history = RecipeHistory.load(meta_folder.joinpath(history_filename))
 
     today = datetime.utcnow().replace(tzinfo=timezone.utc)
     cache_sess = requests.Session()
-    cached = _fetch_cache(publish_site, cache_sess)
-    index = {}  # type: ignore
+    cache_sess.mount(
+        "https://", requests.adapters.HTTPAdapter(pool_maxsize=cache_download_workers)
+    )
+    cache_sess.mount(
+        "http://", requests.adapters.HTTPAdapter(pool_maxsize=cache_download_workers)
+    )
+    artifact_cache = (
+        ArtifactCache(Path(artifact_cache_folder)) if artifact_cache_folder else None
+    )
+    # the index is only needed when a recipe falls back to the cache,
+    # so fetch it in the background instead of holding up the recipes
+    cached = cache_download_executor.submit(
+        _fetch_cache, publish_site, cache_sess, artifact_cache
+    )
+    index: Dict[str, Any] = {}
     recipe_descriptions = {}
     recipe_covers = {}
     generated: Dict[str, Dict[str, List[RecipeOutput]]] = {}
@@ -407,12 +1809,15 @@ def run(
     skip_recipes_slugs: List[str] = _get_env_csv("skip")
     # run specified recipes in CI
     regenerate_recipes_slugs: List[str] = _get_env_csv("regenerate")
+    # recipes with these tags are prioritised when the budget is tight
+    priority_tags: List[str] = _get_env_csv("priority_tags")
 
     start_time = timer()
 
     accounts_info = _get_env_accounts_info()
 
     recipes: List[Recipe] = custom_recipes or default_recipes
+    queued_recipes: List[Recipe] = []
     for recipe in recipes:
         recipe_path = Path(f"{recipe.recipe}.recipe")
         if not recipe.name:
@@ -439,345 +1844,120 @@ def run(
             except Exception:  # noqa, pylint: disable=broad-except
                 logger.exception("Error getting recipe name")
                 continue
-
-        if recipe_path.exists():
-            os.environ["newsrack_title_dt_format"] = recipe.title_date_format
-            os.environ["newsrack_title_dts_format"] = recipe.recipe_datetime_format
-
-        job_status = ""
         recipe.last_run = job_log.get(recipe.slug, 0)
-        logger.info(f"::group::{recipe.name}")
-
+        queued_recipes.append(recipe)
+
+    recipe_jobs: Dict[str, RecipeJob] = {
+        recipe.slug: RecipeJob(
+            recipe=recipe,
+            cmd=_get_recipe_cmd(recipe, accounts_info, verbose_mode, single_fetch),
+            env=_get_recipe_env(recipe, verbose_mode),
+            source_hash=_get_recipe_source_hash(recipe),
+            fetch_timeouts=_get_fetch_timeouts(recipe, history),
+        )
+        for recipe in queued_recipes
+        if recipe.slug not in skip_recipes_slugs
+    }
+    checkpoint_path = meta_folder.joinpath(checkpoint_filename)
+    restored_slugs = _resume_jobs(checkpoint_path, recipe_jobs, resume)
+    pending_jobs = {
+        slug: job for slug, job in recipe_jobs.items() if slug not in restored_slugs
+    }
+    logger.info(
+        f"Running {len(pending_jobs)} recipes with {jobs} concurrent fetch job(s)"
+    )
+    calibre_workers = CalibreWorkerPool(jobs) if calibre_worker else None
+    context = PipelineContext(
+        publish_site=publish_site,
+        cached=cached,
+        cache_sess=cache_sess,
+        artifact_cache=artifact_cache,
+        regenerate_recipes_slugs=regenerate_recipes_slugs,
+        verbose_mode=verbose_mode,
+        single_fetch=single_fetch,
+        calibre_workers=calibre_workers,
+        budget=budget,
+        today=today,
+    )
+    # start the longest recipes first so that they don't hold up the end of the run
+    estimated_durations = {
+        slug: _estimate_recipe_duration(job.recipe, history, context)
+        for slug, job in pending_jobs.items()
+    }
+    priorities = {
+        slug: get_recipe_priority(
+            job.recipe.category,
+            job.recipe.tags,
+            custom_categories_sort or default_categories_sort,
+            priority_tags,
+        )
+        if budget
+        else 0
+        for slug, job in pending_jobs.items()
+    }
+    if budget:
+        logger.info(
+            f"Running with a budget of {humanize.precisedelta(budget.remaining())}"
+        )
+        for slug in pending_jobs.keys():
+            budget.add(slug, priorities[slug], estimated_durations[slug])
+    ordered_jobs = sorted(
+        pending_jobs.values(),
+        key=lambda j: (priorities[j.recipe.slug], estimated_durations[j.recipe.slug]),
+        reverse=True,
+    )
+    logger.debug(
+        "Run order: "
+        + ", ".join(
+            f"{j.recipe.slug} ({estimated_durations[j.recipe.slug]:.0f}s)"
+            for j in ordered_jobs
+        )
+    )
+    try:
+        _run_pipeline(
+            ordered_jobs,
+            context,
+            fetch_workers=jobs,
+            on_job_done=lambda job: _on_job_done(checkpoint_path, job),
+        )
+    finally:
+        if calibre_workers:
+            calibre_workers.close()
+        if artifact_cache:
+            # the access times of the restored books
+            artifact_cache.save()
+
+    # collect the pipeline results in the original recipe order
+    for recipe in queued_recipes:
         if recipe.slug in skip_recipes_slugs:
+            logger.info(f"::group::{recipe.name}")
             logger.info(f'[!] SKIPPED recipe: "{recipe.slug}"')
             logger.info("::endgroup::")
             job_summary += _add_recipe_summary(recipe, ":arrow_right_hook: Skipped")
             continue
 
-        logger.info(f'{"-" * 20} Executing "{recipe.name}" recipe... {"-" * 30}')
-        recipe_start_time = timer()
+        job = recipe_jobs[recipe.slug]
+        if recipe.slug in restored_slugs:
+            # the other jobs were logged as soon as they were done
+            _log_job(job, restored=True)
+        if job.last_run:
+            job_log[recipe.slug] = job.last_run
+        history.add(recipe.slug, _get_run_record(job))
 
         if recipe.category not in generated:
             generated[recipe.category] = {}
-        generated[recipe.category][recipe.name] = []
-        index[recipe.slug] = []
-
-        source_file_name = Path(f"{recipe.slug}.{recipe.src_ext}")
-        source_file_path = publish_folder.joinpath(source_file_name)
-        cmd = [
-            "ebook-convert",
-            str(recipe_path),
-            str(source_file_path),
-        ]
-        try:
-            recipe_account = accounts_info.get(recipe.slug, {})
-            recipe_username = recipe_account.get("username", None)
-            recipe_password = recipe_account.get("password", None)
-            if recipe_username and recipe_password:
-                cmd.extend(
-                    [f"--username={recipe_username}", f"--password={recipe_password}"]
-                )
-        except:  # noqa, pylint: disable=bare-except
-            pass
-        if recipe.conv_options and recipe.conv_options.get(recipe.src_ext):
-            cmd.extend(recipe.conv_options[recipe.src_ext])
-        customised_css_filename = Path("static", f"{recipe.src_ext}.css")
-        if customised_css_filename.exists():
-            cmd.append(f"--extra-css={str(customised_css_filename)}")
-        if verbose_mode:
-            cmd.append("-vv")
-
-        exit_code = 0
-
-        # set recipe debug output folder
-        if verbose_mode:
-            os.environ["recipe_debug_folder"] = str(publish_folder.absolute())
-
-        cached_files = _get_cached_files(recipe, cached)
-
-        if not _find_output(publish_folder, recipe.slug, recipe.src_ext):
-            # existing file does not exist
-            try:
-                if (
-                    # regenerate restriction is not in place and recipe is enabled
-                    (recipe.is_enabled() and not regenerate_recipes_slugs)
-                    # regenerate restriction is in place and recipe is included
-                    or (
-                        regenerate_recipes_slugs
-                        and recipe.slug in regenerate_recipes_slugs
-                    )
-                    # not cached (so that we always have a copy available)
-                    or not cached_files
-                ):
-                    original_recipe_timeout = recipe.timeout
-                    for attempt in range(recipe.retry_attempts + 1):
-                        try:
-                            # run recipe
-                            exit_code = subprocess.call(
-                                cmd,
-                                timeout=recipe.timeout,
-                                stdout=sys.stdout,
-                                stderr=sys.stderr,
-                            )
-                            break
-                        except subprocess.TimeoutExpired:
-                            if attempt < recipe.retry_attempts:
-                                recipe_elapsed_time = timedelta(
-                                    seconds=timer() - recipe_start_time
-                                )
-                                wait_interval = ceil(recipe.timeout / 100)
-                                logger.warning(
-                                    f"TimeoutExpired fetching '{recipe.name}' "
-                                    f"after {humanize.precisedelta(recipe_elapsed_time)}. "
-                                    f"Retrying after {wait_interval}s..."
-                                )
-                                # increase recipe timeout by 10% on retry but up to a max of 20min
-                                recipe.timeout = max(int(1.1 * recipe.timeout), 20 * 60)
-                                time.sleep(max(min(wait_interval, 2), 10))
-                                continue
-                            raise
-                        finally:
-                            # it's not used anymore, but restore original timeout
-                            # value just in case
-                            recipe.timeout = original_recipe_timeout
-
-                    job_log[recipe.slug] = time.time()
-
-                else:
-                    # use cache
-                    logger.warning(f'Using cached copy for "{recipe.name}".')
-                    abort_recipe = _download_from_cache(
-                        recipe, cached, publish_site, cache_sess
-                    )
-                    if not abort_recipe:
-                        job_status = ":outbox_tray: From cache"
-                    else:
-                        recipe_elapsed_time = timedelta(
-                            seconds=timer() - recipe_start_time
-                        )
-                        logger.info(
-                            f'{"=" * 10} "{recipe.name}" recipe took {humanize.precisedelta(recipe_elapsed_time)} {"=" * 20}'
-                        )
-                        logger.info("::endgroup::")
-                        job_summary += _add_recipe_summary(
-                            recipe, ":x: Cache Timeout", recipe_elapsed_time
-                        )
-                        continue
-
-            except subprocess.TimeoutExpired:
-                logger.exception(f"[!] TimeoutExpired fetching '{recipe.name}'")
-                recipe_elapsed_time = timedelta(seconds=timer() - recipe_start_time)
-                logger.info(
-                    f'{"=" * 10} "{recipe.name}" recipe took {humanize.precisedelta(recipe_elapsed_time)} {"=" * 20}'
-                )
-                logger.info("::endgroup::")
-                job_summary += _add_recipe_summary(
-                    recipe, ":x: Convert Timeout", recipe_elapsed_time
-                )
-                continue
-        else:
-            job_status = ":file_folder: From local"
-
-        # unset debug folder
-        if os.environ.get("recipe_debug_folder", ""):
-            del os.environ["recipe_debug_folder"]
-
-        source_file_paths = sorted(
-            _find_output(publish_folder, recipe.slug, recipe.src_ext)
+        generated[recipe.category][recipe.name] = job.outputs
+        index[recipe.slug] = job.index_entries
+        if job.covers:
+            recipe_covers[recipe.slug] = job.covers
+
+        recipe_elapsed_time = timedelta(seconds=sum(job.stage_timings.values()))
+        job_summary += _add_recipe_summary(
+            recipe,
+            job.error_status or job.job_status or ":white_check_mark: Completed",
+            recipe_elapsed_time,
+            job.stage_timings,
         )
-        if cached_files and not source_file_paths:
-            logger.warning(
-                f'Using cached copy for "{recipe.name}" because recipe has no output.'
-            )
-            # try to use cached copy if recipe does not have output
-            # for example FT(Print) has no weekend issue, so we'll try to keep the last issue
-            _ = _download_from_cache(recipe, cached, publish_site, cache_sess)
-            source_file_paths = sorted(
-                _find_output(publish_folder, recipe.slug, recipe.src_ext)
-            )
-            if source_file_paths:
-                exit_code = (
-                    0  # reset exit_code (not 0 because of failed recipe ebook-convert)
-                )
-                job_status = ":outbox_tray: From cache"
-
-        if not source_file_paths:
-            logger.error(
-                f"Unable to find source generated: '/{recipe.slug}*.{recipe.src_ext}'"
-            )
-            recipe_elapsed_time = timedelta(seconds=timer() - recipe_start_time)
-            logger.info(
-                f'{"=" * 20} "{recipe.name}" recipe took {humanize.precisedelta(recipe_elapsed_time)} {"=" * 20}'
-            )
-            logger.info("::endgroup::")
-            job_summary += _add_recipe_summary(
-                recipe, ":x: No output", recipe_elapsed_time
-            )
-            continue
-
-        source_file_path = source_file_paths[-1]
-        source_file_name = Path(source_file_path.name)
-        if not exit_code:
-            logger.debug(f'Get book meta info for "{source_file_path}"')
-            proc = subprocess.Popen(
-                ["ebook-meta", str(source_file_path)], stdout=subprocess.PIPE
-            )
-            meta_out = proc.stdout.read().decode("utf-8")  # type: ignore
-            mobj = re.search(
-                r"Published\s+:\s(?P<pub_date>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})",
-                meta_out,
-            )
-            pub_date = today
-            if mobj:
-                pub_date = datetime.strptime(
-                    mobj.group("pub_date"), "%Y-%m-%dT%H:%M:%S"
-                ).replace(tzinfo=timezone.utc)
-            title = ""
-            mobj = re.search(r"Title\s+:\s(?P<title>.+)", meta_out)
-            if mobj:
-                title = mobj.group("title")
-            rename_file_name = Path(
-                f"{recipe.slug}-{pub_date:%Y-%m-%d}.{recipe.src_ext}"
-            )
-
-            comments = []
-            description = ""
-            mobj = re.search(r"Comments\s+:\s(?P<comments>.+)", meta_out, re.DOTALL)
-            if mobj:
-                try:
-                    comments = [
-                        c.strip()
-                        for c in mobj.group("comments").split("\n")
-                        if c.strip()
-                    ]
-                    description = (
-                        f"{comments[0]}"
-                        f'<ul><li>{"</li><li>".join(comments[1:-1])}</li></ul>'
-                        f"{linkify(comments[-1], callbacks=[_linkify_attrs])}"
-                    )
-                except:  # noqa, pylint: disable=bare-except
-                    pass
-
-            generated[recipe.category][recipe.name].append(
-                RecipeOutput(
-                    recipe=recipe,
-                    title=title,
-                    file=source_file_name,
-                    rename_to=rename_file_name,
-                    published_dt=pub_date,
-                    description=description,
-                    articles=comments[1:-1],
-                )
-            )
-
-            pseudo_series_index = pub_date.year * 1000 + pub_date.timetuple().tm_yday
-            # (rename_file_name != source_file_name) checks that it is a newly generated file
-            # so that we don't regenerate the cover needlessly
-            if (
-                recipe.overwrite_cover
-                and title
-                and rename_file_name != source_file_name
-            ):
-                # customise cover
-                logger.debug(f'Setting cover for "{source_file_path}"')
-                try:
-                    cover_file_path = Path(f"{str(source_file_path)}.png")
-                    generate_cover(
-                        cover_file_path, title, recipe.cover_options, logger=logger
-                    )
-                    cover_cmd = [
-                        "ebook-meta",
-                        str(source_file_path),
-                        f"--cover={str(cover_file_path)}",
-                        f"--series={recipe.name}",
-                        f"--index={pseudo_series_index}",
-                        f"--publisher={publish_site}",
-                    ]
-                    _ = subprocess.call(cover_cmd, stdout=subprocess.PIPE)
-                    cover_file_path.unlink()
-                except Exception:  # noqa, pylint: disable=broad-except
-                    logger.exception("Error generating cover")
-            elif rename_file_name != source_file_name:
-                # just set series name
-                series_cmd = [
-                    "ebook-meta",
-                    str(source_file_path),
-                    f"--series={recipe.name}",
-                    f"--index={pseudo_series_index}",
-                    f"--publisher={publish_site}",
-                ]
-                _ = subprocess.call(series_cmd, stdout=subprocess.PIPE)
-
-            index[recipe.slug].append(
-                {
-                    "filename": f"{recipe.slug}-{pub_date:%Y-%m-%d}.{recipe.src_ext}",
-                    "published": pub_date.timestamp(),
-                }
-            )
-
-            # convert generate book into alternative formats
-            for ext in recipe.target_ext:
-                target_file_name = Path(f"{recipe.slug}.{ext}")
-                target_file_path = Path(publish_folder, target_file_name)
-
-                cmd = [
-                    "ebook-convert",
-                    str(source_file_path),
-                    str(target_file_path),
-                    f"--series={recipe.name}",
-                    f"--series-index={pseudo_series_index}",
-                    f"--publisher={publish_site}",
-                ]
-                if recipe.conv_options and recipe.conv_options.get(ext):
-                    cmd.extend(recipe.conv_options[ext])
-
-                customised_css_filename = Path("static", f"{ext}.css")
-                if customised_css_filename.exists():
-                    cmd.append(f"--extra-css={str(customised_css_filename)}")
-                if verbose_mode:
-                    cmd.append("-vv")
-                if not _find_output(publish_folder, recipe.slug, ext):
-                    exit_code = subprocess.call(
-                        cmd,
-                        timeout=recipe.timeout,
-                        stdout=sys.stdout,
-                        stderr=sys.stderr,
-                    )
-
-                if not exit_code:
-                    target_file_path = sorted(
-                        _find_output(publish_folder, recipe.slug, ext)
-                    )[-1]
-                    target_file_name = Path(target_file_path.name)
-
-                    generated[recipe.category][recipe.name].append(
-                        RecipeOutput(
-                            recipe=recipe,
-                            title=title,
-                            file=target_file_name,
-                            rename_to=f"{recipe.slug}-{pub_date:%Y-%m-%d}.{ext}",
-                            published_dt=pub_date,
-                            description=comments,
-                            articles=comments[1:-1],
-                        )
-                    )
-                    index[recipe.slug].append(
-                        {
-                            "filename": f"{recipe.slug}-{pub_date:%Y-%m-%d}.{ext}",
-                            "published": pub_date.timestamp(),
-                        }
-                    )
-
-            recipe_elapsed_time = timedelta(seconds=timer() - recipe_start_time)
-            logger.info(
-                f'{"=" * 20} "{recipe.name}" recipe took {humanize.precisedelta(recipe_elapsed_time)} {"=" * 20}'
-            )
-            logger.info("::endgroup::")
-            job_summary += _add_recipe_summary(
-                recipe,
-                job_status or ":white_check_mark: Completed",
-                recipe_elapsed_time,
-            )
 
     static_assets_start_time = timer()
     # generate index.html
@@ -802,81 +1982,8 @@ def run(
             )
             book_links = []
             for book in books:
-                # change filename to datestamped name
                 book_file = publish_folder.joinpath(book.file)
                 book_rename_to = publish_folder.joinpath(book.rename_to)
-                if book.file != book.rename_to:
-                    book_file.rename(book_rename_to)
-                cover_file_name = Path(f"{book_rename_to.stem}.jpg")
-                cover_file_path = publish_folder.joinpath(cover_file_name)
-                cover_thumbnail_file_name = Path(f"{book_rename_to.stem}.thumb.jpg")
-                cover_thumbnail_file_path = publish_folder.joinpath(
-                    cover_thumbnail_file_name
-                )
-                if (not book.recipe.overwrite_cover) and (not cover_file_path.exists()):
-                    # only extract default cover not generated by newsrack
-                    cover_get_cmd = [
-                        "ebook-meta",
-                        f"--get-cover={str(cover_file_path)}",
-                        str(book_rename_to),
-                    ]
-                    try:
-                        _ = subprocess.call(cover_get_cmd, stdout=subprocess.PIPE)
-                        temp_cover_file_name = Path(f"{book_rename_to.stem}.temp.jpg")
-                        temp_cover_file_path = publish_folder.joinpath(
-                            temp_cover_file_name
-                        )
-                        imagemagick_cmd = [
-                            "convert",
-                            str(cover_file_path),
-                            "-quality",
-                            "70",
-                            "-resize",
-                            "1024x1024>",
-                            "-unsharp",
-                            "0x.5",
-                            "-strip",
-                            str(temp_cover_file_path),
-                        ]
-                        exit_code = subprocess.call(imagemagick_cmd)
-                        if exit_code:
-                            logger.warning(
-                                "convert exited with the code: {0!s}".format(exit_code)
-                            )
-                        else:
-                            temp_cover_file_path.rename(cover_file_path)
-                        imagemagick_cmd = [
-                            "convert",
-                            str(cover_file_path),
-                            "-quality",
-                            "80",
-                            "-thumbnail",
-                            "500x500>",
-                            "-unsharp",
-                            "0x.5",
-                            str(cover_thumbnail_file_path),
-                        ]
-                        exit_code = subprocess.call(imagemagick_cmd)
-                        if exit_code:
-                            logger.warning(
-                                "convert (thumbnail) exited with the code: {0!s}".format(
-                                    exit_code
-                                )
-                            )
-                    except (
-                        Exception  # noqa, pylint: disable=broad-except
-                    ) as get_cover_err:
-                        logger.warning(
-                            "Unable to extract cover for %s: %s",
-                            book.rename_to,
-                            str(get_cover_err),
-                        )
-                if (not book.recipe.overwrite_cover) and cover_file_path.exists():
-                    recipe_covers[book.recipe.slug] = {
-                        "cover": str(cover_file_name),
-                        "thumbnail": str(cover_thumbnail_file_name),
-                    }
-
                 file_size = book_rename_to.stat().st_size
                 book_ext = book_file.suffix
                 reader_link = ""
@@ -960,6 +2067,7 @@ def run(
         meta_folder.mkdir(parents=True, exist_ok=True)
     with meta_folder.joinpath(job_log_filename).open("w", encoding="utf-8") as f:
         json.dump(job_log, f, indent=0)
+    history.save(meta_folder.joinpath(history_filename))
 
     site_css = "static/site.css"
     if os.path.exists("static/custom.css"):
@@ -1026,6 +2134,13 @@ def run(
     with open("job_summary.md", "w", encoding="utf-8") as f:
         f.write(job_summary)
 
+    # the run has completed, so there is nothing to resume
+    if checkpoint_path.exists():
+        checkpoint_path.unlink()
+
+    if artifact_cache:
+        artifact_cache.prune()
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -1042,6 +2157,86 @@ if __name__ == "__main__":
         action="store_true",
         help="Enable more verbose messages for debugging",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=int,
+        default=0,
+        help="Number of recipes to execute concurrently. Can also be set with the jobs env var.",
+    )
+    parser.add_argument(
+        "--single-fetch",
+        dest="single_fetch",
+        action="store_true",
+        help=(
+            "Fetch recipes once into an intermediate OEB build and convert it into "
+            "all the formats required. Can also be set with the single_fetch env var."
+        ),
+    )
+    parser.add_argument(
+        "--calibre-worker",
+        dest="calibre_worker",
+        action="store_true",
+        help=(
+            "Run conversions and metadata commands with persistent calibre-debug "
+            "workers instead of a new calibre process each time. "
+            "Can also be set with the calibre_worker env var."
+        ),
+    )
+    parser.add_argument(
+        "--budget",
+        dest="budget",
+        type=int,
+        default=0,
+        help=(
+            "Time limit in minutes. Lower priority recipes are restored from cache "
+            "instead of being executed when they may not finish in time. "
+            "Can also be set with the budget env var."
+        ),
+    )
+    parser.add_argument(
+        "--resume",
+        dest="resume",
+        action="store_true",
+        help=(
+            "Resume an interrupted run, skipping the recipes that were "
+            "already completed. Can also be set with the resume env var."
+        ),
+    )
+    parser.add_argument(
+        "--artifact-cache",
+        dest="artifact_cache",
+        type=str,
+        default="",
+        help=(
+            "Folder for a persistent local cache of the books restored from the "
+            "published site, e.g. on self-hosted runners. "
+            "Can also be set with the artifact_cache env var."
+        ),
+    )
+    parser.add_argument(
+        "--http-cache",
+        dest="http_cache",
+        type=str,
+        default="",
+        help=(
+            "Folder for caching the recipes' http responses across runs. "
+            "The size limit in MB can be set with the http_cache_size env var. "
+            "Can also be set with the http_cache env var."
+        ),
+    )
+    parser.add_argument(
+        "--article-store",
+        dest="article_store",
+        type=str,
+        default="",
+        help=(
+            "Folder for keeping the recipes' processed articles across runs "
+            "so that unchanged articles are not downloaded again. "
+            "Can also be set with the article_store env var."
+        ),
+    )
     args = parser.parse_args()
 
     try:
@@ -1053,6 +2248,28 @@ if __name__ == "__main__":
     if verbose:
         logger.setLevel(logging.DEBUG)
 
+    jobs = args.jobs or _get_env_int("jobs", 1)
+
+    try:
+        single_fetch = str(os.environ["single_fetch"]).strip().lower() == "true"
+    except (KeyError, ValueError):
+        single_fetch = False
+    single_fetch = single_fetch or args.single_fetch
+
+    try:
+        calibre_worker = str(os.environ["calibre_worker"]).strip().lower() == "true"
+    except (KeyError, ValueError):
+        calibre_worker = False
+    calibre_worker = calibre_worker or args.calibre_worker
+
+    budget_minutes = args.budget or _get_env_int("budget", 0)
+
+    try:
+        resume = str(os.environ["resume"]).strip().lower() == "true"
+    except (KeyError, ValueError):
+        resume = False
+    resume = resume or args.resume
+
     run(
         args.publish_site,
         args.repo_url,
@@ -1061,4 +2278,12 @@ if __name__ == "__main__":
         args.run_id,
         args.run_url,
         verbose,
+        max(1, jobs),
+        single_fetch,
+        calibre_worker,
+        max(0, budget_minutes),
+        resume,
+        args.artifact_cache or os.environ.get("artifact_cache", ""),
+        args.http_cache or os.environ.get("http_cache", ""),
+        args.article_store or os.environ.get("article_store", ""),
     )
@@ -0,0 +1,156 @@
+# Copyright (c) 2022 https://github.com/ping/
+#
+# This software is released under the GNU General Public License v3.0
+# https://opensource.org/licenses/GPL-3.0
+
+# Rolling history of recipe runs used to estimate how long a recipe will take
+import json
+import logging
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__file__)
+
+# outcomes
+OUTCOME_GENERATED = "generated"  # recipe was executed successfully
+OUTCOME_FAILED = "failed"  # recipe was executed but failed
+OUTCOME_TIMEOUT = "timeout"  # recipe was executed but timed out
+OUTCOME_CACHED = "cached"  # restored from cache
+OUTCOME_LOCAL = "local"  # already available locally
+OUTCOME_ERROR = "error"  # failed without executing the recipe
+OUTCOME_RECOVERED = "recovered"  # recipe was executed but restored from cache
+
+# outcomes where the duration reflects the cost of executing the recipe
+EXECUTED_OUTCOMES = (OUTCOME_GENERATED, OUTCOME_FAILED, OUTCOME_TIMEOUT)
+
+default_max_records = 30
+
+# adaptive timeouts
+timeout_min_samples = 5  # minimum number of successful runs needed
+timeout_margin = 0.5  # proportion of the p95 fetch duration added as margin
+timeout_min_seconds = 3 * 60
+
+
+@dataclass
+class RunRecord:
+    """A recipe run"""
+
+    timestamp: float  # unix timestamp
+    duration: float  # seconds
+    outcome: str
+    articles: int = 0
+    bytes: int = 0  # size of the generated book
+    fetch: float = 0  # seconds taken to execute the recipe
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """
+    Percentile with linear interpolation between the closest ranks
+
+    :param values:
+    :param pct: 0-100
+    :return:
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+class RecipeHistory:
+    """Run records by recipe slug, keeping only the most recent records"""
+
+    def __init__(
+        self,
+        records: Optional[Dict[str, List[RunRecord]]] = None,
+        max_records: int = default_max_records,
+    ):
+        self.records: Dict[str, List[RunRecord]] = records or {}
+        self.max_records = max_records
+
+    @classmethod
+    def load(cls, file_path: Path, **kwargs) -> "RecipeHistory":
+        """
+        Load the history from a json file. Invalid records are ignored.
+
+        :param file_path:
+        :param kwargs: passed to RecipeHistory()
+        :return:
+        """
+        records: Dict[str, List[RunRecord]] = {}
+        try:
+            with file_path.open("r", encoding="utf-8") as f:
+                for slug, slug_records in json.load(f).items():
+                    records[slug] = [RunRecord(**r) for r in slug_records]
+        except FileNotFoundError:
+            pass
+        except Exception as err:  # noqa, pylint: disable=broad-except
+            logger.warning(f"Unable to load recipe history: {err}")
+            records = {}
+        return cls(records, **kwargs)
+
+    def save(self, file_path: Path) -> None:
+        with file_path.open("w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    slug: [asdict(r) for r in slug_records]
+                    for slug, slug_records in self.records.items()
+                },
+                f,
+                indent=0,
+            )
+
+    def add(self, slug: str, record: RunRecord) -> None:
+        slug_records = self.records.setdefault(slug, [])
+        slug_records.append(record)
+        del slug_records[: -self.max_records]
+
+    def durations(self, slug: str) -> List[float]:
+        """
+        Durations of the recent runs where the recipe was executed
+
+        :param slug:
+        :return:
+        """
+        return [
+            r.duration
+            for r in self.records.get(slug, [])
+            if r.outcome in EXECUTED_OUTCOMES
+        ]
+
+    def estimate(self, slug: str, pct: float = 50) -> Optional[float]:
+        """
+        Estimated duration of a recipe from its recent runs, e.g.
+        pct=50 for the typical duration, pct=95 for a pessimistic one
+
+        :param slug:
+        :param pct:
+        :return: None if there is no history
+        """
+        return percentile(self.durations(slug), pct)
+
+    def fetch_timeout(self, slug: str, max_timeout: int) -> int:
+        """
+        Timeout for executing a recipe derived from the p95 of its recent
+        successful fetch durations plus a margin, but not more than the
+        configured max_timeout
+
+        :param slug:
+        :param max_timeout: the recipe's configured timeout
+        :return:
+        """
+        fetch_durations = [
+            r.fetch
+            for r in self.records.get(slug, [])
+            if r.outcome == OUTCOME_GENERATED and r.fetch
+        ]
+        if len(fetch_durations) < timeout_min_samples:
+            return max_timeout
+        p95 = percentile(fetch_durations, 95) or 0
+        return int(
+            min(max_timeout, max(timeout_min_seconds, p95 * (1 + timeout_margin)))
+        )
@@ -0,0 +1,341 @@
+# Copyright (c) 2022 https://github.com/ping/
+#
+# This software is released under the GNU General Public License v3.0
+# https://opensource.org/licenses/GPL-3.0
+
+# Incremental deploy of the generated site. Files are compared by their sha256
+# against the manifest of the previous deploy so that only the files that were
+# added or changed are uploaded, and the files that are no longer generated are deleted.
+import argparse
+import json
+import logging
+import mimetypes
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import urlparse
+
+from _artifact_cache import file_sha256
+from _opds import extension_contenttype_map
+
+logger = logging.getLogger(__file__)
+ch = logging.StreamHandler(sys.stdout)
+ch.setLevel(logging.DEBUG)
+logger.addHandler(ch)
+logger.setLevel(logging.INFO)
+
+publish_folder = Path("public")
+manifest_filename = "manifest.json"
+default_upload_workers = 8
+multipart_threshold = 8 * 1024 * 1024
+multipart_chunksize = 8 * 1024 * 1024
+
+# same types for the books as in the OPDS feeds
+content_types = {
+    **extension_contenttype_map,
+    ".xml": "application/xml",
+    ".json": "application/json",
+}
+
+
+class PublishDelta(NamedTuple):
+    added: List[str]
+    changed: List[str]
+    removed: List[str]
+    manifest: Dict[str, Dict]  # relative path to sha256 and size
+
+
+class PublishError(Exception):
+    """The upload target is not usable."""
+
+
+def build_manifest(folder: Path) -> Dict[str, Dict]:
+    """
+    Size and sha256 of every file in a folder
+
+    :param folder:
+    :return: relative posix path to {"sha256", "size"}
+    """
+    manifest = {}
+    for file_path in sorted(folder.rglob("*")):
+        if not file_path.is_file():
+            continue
+        rel_path = file_path.relative_to(folder).as_posix()
+        if rel_path == manifest_filename:
+            continue
+        manifest[rel_path] = {
+            "sha256": file_sha256(file_path),
+            "size": file_path.stat().st_size,
+        }
+    return manifest
+
+
+def compare_manifests(
+    manifest: Dict[str, Dict], previous_manifest: Dict[str, Dict]
+) -> PublishDelta:
+    """
+    Compare a manifest against the manifest of the previous deploy
+
+    :param manifest:
+    :param previous_manifest:
+    :return:
+    """
+    added = sorted(set(manifest).difference(previous_manifest))
+    changed = sorted(
+        rel_path
+        for rel_path in set(manifest).intersection(previous_manifest)
+        if manifest[rel_path].get("sha256") != previous_manifest[rel_path].get("sha256")
+    )
+    removed = sorted(set(previous_manifest).difference(manifest))
+    return PublishDelta(added, changed, removed, manifest)
+
+
+def get_content_type(rel_path: str) -> str:
+    suffix = Path(rel_path).suffix.lower()
+    return (
+        content_types.get(suffix)
+        or mimetypes.guess_type(rel_path)[0]
+        or "application/octet-stream"
+    )
+
+
+class FileSystemBackend:
+    """Deploys to a local folder, e.g. for testing or a locally served site"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def get(self, rel_path: str) -> Optional[bytes]:
+        try:
+            return self.root.joinpath(rel_path).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, rel_path: str, file_path: Path) -> None:
+        dest = self.root.joinpath(rel_path)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        temp_dest = dest.with_name(f"{dest.name}.tmp")
+        shutil.copyfile(file_path, temp_dest)
+        os.replace(temp_dest, dest)
+
+    def delete(self, rel_path: str) -> None:
+        try:
+            self.root.joinpath(rel_path).unlink()
+        except FileNotFoundError:
+            pass
+
+
+class S3Backend:
+    """
+    Deploys to an S3-compatible bucket, e.g. AWS S3, Cloudflare R2 or MinIO.
+    Requires boto3. Credentials are read by boto3 from the usual
+    AWS_ACCESS_KEY_ID/AWS_SECRET_ACCESS_KEY env vars.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        workers: int = default_upload_workers,
+    ):
+        try:
+            import boto3  # type: ignore
+            from boto3.s3.transfer import TransferConfig  # type: ignore
+        except ImportError as err:
+            raise PublishError("boto3 is required to deploy to S3") from err
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None)
+        # large files are uploaded in parts concurrently
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=workers,
+        )
+
+    def _key(self, rel_path: str) -> str:
+        return f"{self.prefix}/{rel_path}" if self.prefix else rel_path
+
+    def get(self, rel_path: str) -> Optional[bytes]:
+        try:
+            res = self.client.get_object(Bucket=self.bucket, Key=self._key(rel_path))
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return res["Body"].read()
+
+    def put(self, rel_path: str, file_path: Path) -> None:
+        self.client.upload_file(
+            str(file_path),
+            self.bucket,
+            self._key(rel_path),
+            ExtraArgs={"ContentType": get_content_type(rel_path)},
+            Config=self.transfer_config,
+        )
+
+    def delete(self, rel_path: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(rel_path))
+
+
+def get_backend(
+    target: str,
+    endpoint_url: Optional[str] = None,
+    workers: int = default_upload_workers,
+):
+    """
+    Backend for a target, e.g. ``s3://bucket/prefix`` or a local folder
+
+    :param target:
+    :param endpoint_url: for S3-compatible services other than AWS
+    :param workers:
+    :return:
+    """
+    parsed = urlparse(target)
+    if parsed.scheme == "s3":
+        return S3Backend(parsed.netloc, parsed.path, endpoint_url, workers)
+    if parsed.scheme == "file":
+        return FileSystemBackend(Path(parsed.path))
+    if not parsed.scheme:
+        return FileSystemBackend(Path(target))
+    raise PublishError(f"Unsupported target: {target}")
+
+
+def get_delta(folder: Path, backend) -> PublishDelta:
+    """
+    Compare a folder against the manifest of the previous deploy to the backend.
+    If there is no previous manifest, all the files are new.
+
+    :param folder:
+    :param backend:
+    :return:
+    """
+    previous_manifest: Dict[str, Dict] = {}
+    try:
+        previous_manifest_content = backend.get(manifest_filename)
+        if previous_manifest_content:
+            previous_manifest = json.loads(previous_manifest_content)
+    except ValueError as err:
+        logger.warning(f"Unable to load the previous {manifest_filename}: {err}")
+    return compare_manifests(build_manifest(folder), previous_manifest)
+
+
+def upload(
+    folder: Path,
+    delta: PublishDelta,
+    backend,
+    workers: int = default_upload_workers,
+) -> None:
+    """
+    Upload the added and changed files, then the manifest, and finally
+    delete the removed files so that the deployed site is never missing
+    a file that is still referenced.
+
+    :param folder:
+    :param delta:
+    :param backend:
+    :param workers:
+    :return:
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for rel_path in executor.map(
+            lambda p: backend.put(p, folder.joinpath(p)) or p,
+            delta.added + delta.changed,
+        ):
+            logger.debug(f"Uploaded {rel_path}")
+
+    manifest_path = folder.joinpath(manifest_filename)
+    with manifest_path.open("w", encoding="utf-8") as f:
+        json.dump(delta.manifest, f, indent=0)
+    backend.put(manifest_filename, manifest_path)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for rel_path in executor.map(
+            lambda p: backend.delete(p) or p,
+            delta.removed,
+        ):
+            logger.debug(f"Deleted {rel_path}")
+
+
+def run(
+    target: str,
+    folder: Path = publish_folder,
+    endpoint_url: Optional[str] = None,
+    workers: int = default_upload_workers,
+    dry_run: bool = False,
+) -> PublishDelta:
+    backend = get_backend(target, endpoint_url, workers)
+    delta = get_delta(folder, backend)
+    upload_size = sum(delta.manifest[p]["size"] for p in delta.added + delta.changed)
+    logger.info(
+        f"{len(delta.added)} added, {len(delta.changed)} changed, "
+        f"{len(delta.removed)} removed, "
+        f"{len(delta.manifest) - len(delta.added) - len(delta.changed)} unchanged. "
+        f"Uploading {upload_size:,} bytes."
+    )
+    if not dry_run:
+        upload(folder, delta, backend, workers)
+    return delta
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "target",
+        type=str,
+        help="Deployment target, e.g. s3://bucket/prefix or a folder",
+    )
+    parser.add_argument(
+        "--folder",
+        dest="folder",
+        type=str,
+        default=str(publish_folder),
+        help="Folder to deploy",
+    )
+    parser.add_argument(
+        "--endpoint-url",
+        dest="endpoint_url",
+        type=str,
+        default="",
+        help="Endpoint for S3-compatible services, e.g. http://localhost:9000 for MinIO",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        type=int,
+        default=default_upload_workers,
+        help="Number of concurrent uploads",
+    )
+    parser.add_argument(
+        "--dry-run",
+        dest="dry_run",
+        action="store_true",
+        help="Show the changes without uploading",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        dest="verbose",
+        action="store_true",
+        help="Enable more verbose messages for debugging",
+    )
+    args = parser.parse_args()
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+
+    try:
+        run(
+            args.target,
+            Path(args.folder),
+            args.endpoint_url or os.environ.get("publish_endpoint_url", ""),
+            max(1, args.workers),
+            args.dry_run,
+        )
+    except PublishError as err:
+        logger.error(str(err))
+        sys.exit(1)
@@ -3,26 +3,29 @@
 # This software is released under the GNU General Public License v3.0
 # https://opensource.org/licenses/GPL-3.0
 
-# This is a vanilla calibre recipe, not recommended for newsrack use because
-# Bloomberg blocks non-residential IPs
+# Not recommended for newsrack use because Bloomberg blocks non-residential IPs
 
 import json
+import os
 import random
 import re
+import sys
 import time
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from urllib.parse import urlparse
 
+# custom include to share code between recipes
+sys.path.append(os.environ["recipes_includes"])
+from recipes_shared import BasicNewsrackRecipe
+
 from calibre import browser, iswindows, random_user_agent
 from calibre.ebooks.BeautifulSoup import BeautifulSoup
 from calibre.utils.date import parse_date
 from calibre.web.feeds.news import BasicNewsRecipe
 
-blocked_path_re = re.compile(r"/tosv.*.html")
-
 
-class BloombergNews(BasicNewsRecipe):
+class BloombergNews(BasicNewsrackRecipe, BasicNewsRecipe):
     title = "Bloomberg News"
     __author__ = "ping"
     description = (
@@ -38,6 +41,7 @@ class BloombergNews(BasicNewsRecipe):
     compress_news_images = True
     timeout = 20
     date_format = "%I:%M%p, %-d %b, %Y" if iswindows else "%-I:%M%p, %-d %b, %Y"
+    timefmt = BasicNewsRecipe.timefmt  # keep the date in the title
     requires_version = (6, 24, 0)  # cos we're using get_url_specific_delay()
 
     # NOTES: Bot detection kicks in really easily so either:
@@ -51,7 +55,9 @@ class BloombergNews(BasicNewsRecipe):
     max_articles_per_feed = 15
 
     compress_news_images_auto_size = 8
-    bot_blocked = False
+    # abort as soon as we are redirected to the bot challenge page
+    blocked_url_re = re.compile(r"/tosv.*\.html")
+    block_threshold = 1
     download_count = 0
 
     remove_attributes = ["style", "height", "width", "align"]
@@ -125,10 +131,7 @@ class BloombergNews(BasicNewsRecipe):
             # so we'll have to implement the delay here
             time.sleep(random.choice(self.delay_range))
 
-        if self.bot_blocked:
-            self.log.warn(f"Block detected. Skipping {target_url}")
-            # Abort article without making actual request
-            self.abort_article(f"Block detected. Skipped {target_url}")
+        host = urlparse(target_url).hostname or ""
         br = browser()
         br.addheaders = [
             ("referer", "https://www.google.com/"),
@@ -138,27 +141,12 @@ class BloombergNews(BasicNewsRecipe):
             ),
             ("accept-language", "en,en-US;q=0.5"),
             ("connection", "keep-alive"),
-            ("host", urlparse(target_url).hostname),
+            ("host", host),
             ("upgrade-insecure-requests", "1"),
             ("user-agent", random_user_agent(allow_ie=False)),
         ]
         br.set_handle_redirect(False)
-        try:
-            res = br.open_novisit(*args, **kwargs)
-            return res
-        except Exception as e:
-            is_redirected_to_challenge = False
-            if hasattr(e, "hdrs"):
-                is_redirected_to_challenge = blocked_path_re.match(
-                    urlparse(e.hdrs.get("location") or "").path
-                )
-            if is_redirected_to_challenge or (hasattr(e, "code") and e.code == 307):
-                self.bot_blocked = True
-                err_msg = f"Blocked by bot detection: {target_url}"
-                self.log.warn(err_msg)
-                self.abort_recipe_processing(err_msg)
-                self.abort_article(err_msg)
-            raise
+        return self.guard_requests(br.open_novisit, host)(*args, **kwargs)
 
     open = open_novisit
 
@@ -2,9 +2,7 @@
 
 import json
 import os
-import random
 import sys
-import time
 from datetime import timezone, datetime, timedelta
 from http.cookiejar import Cookie
 from os.path import splitext
@@ -12,7 +10,12 @@ from urllib.parse import urlparse
 
 # custom include to share code between recipes
 sys.path.append(os.environ["recipes_includes"])
-from recipes_shared import BasicNewsrackRecipe, format_title
+from recipes_shared import (
+    BasicNewsrackRecipe,
+    RateLimit,
+    format_title,
+    get_request_url,
+)
 
 from calibre import replace_entities
 from calibre.ebooks.BeautifulSoup import NavigableString, Tag
@@ -241,7 +244,8 @@ class EighteenFortyThree(BasicNewsrackRecipe, BasicNewsRecipe):
     ]
     keep_only_tags = [dict(name="article", id=lambda x: not x)]
     remove_attributes = ["data-reactid", "width", "height"]
-    # economist.com has started throttling with HTTP 429
+    # economist.com has started throttling with HTTP 429,
+    # which guard_requests() retries after the Retry-After
     delay = 0
     simultaneous_downloads = 1
 
@@ -288,14 +292,20 @@ class EighteenFortyThree(BasicNewsrackRecipe, BasicNewsRecipe):
     def clone_browser(self, *args, **kwargs):
         return self.get_browser()
 
-    def open_novisit(self, *args, **kwargs):
-        target_url = args[0]
-        p, ext = splitext(urlparse(target_url).path)
+    def get_rate_limit(self, url):
+        p, ext = splitext(urlparse(url).path)
         if not ext:
             # not an asset, e.g. .png .jpg
-            time.sleep(random.choice([r for r in range(1, 3)]))
+            return RateLimit(interval=1, jitter=1)
+        return None
+
+    def open_novisit(self, *args, **kwargs):
+        def throttled_open(*a, **kw):
+            with self.throttle(a[0]):
+                return self._br.open_novisit(*a, **kw)
 
-        return self._br.open_novisit(*args, **kwargs)
+        host = urlparse(get_request_url(args[0])).hostname or ""
+        return self.guard_requests(throttled_open, host)(*args, **kwargs)
 
     open = open_novisit
 
@@ -10,13 +10,16 @@ import json
 import os
 import sys
 from datetime import timezone
-from html import unescape
 
 # custom include to share code between recipes
 sys.path.append(os.environ["recipes_includes"])
-from recipes_shared import WordPressNewsrackRecipe, format_title, get_date_format
+from recipes_shared import (
+    WordPressNewsrackRecipe,
+    format_title,
+    get_date_format,
+    html_to_text,
+)
 
-from calibre.ptempfile import PersistentTemporaryDirectory, PersistentTemporaryFile
 from calibre.web.feeds.news import BasicNewsRecipe
 
 _name = "FiveThirtyEight"
@@ -29,6 +32,8 @@ class FiveThirtyEight(WordPressNewsrackRecipe, BasicNewsRecipe):
     __author__ = "ping"
 
     oldest_article = 14
+    wp_fields = ["date", "modified_gmt", "link", "title", "content", "espn_verticals"]
+    wp_embeds = ["wp:term"]
     max_articles_per_feed = 10
     masthead_url = "https://upload.wikimedia.org/wikipedia/commons/thumb/1/13/FiveThirtyEight_Logo.svg/1024px-FiveThirtyEight_Logo.svg.png"
 
@@ -68,7 +73,6 @@ class FiveThirtyEight(WordPressNewsrackRecipe, BasicNewsRecipe):
     def parse_index(self):
         br = self.get_browser()
         articles = {}
-        self.temp_dir = PersistentTemporaryDirectory()
 
         for feed_name, feed_url in self.feeds:
             custom_params = {
@@ -96,8 +100,7 @@ class FiveThirtyEight(WordPressNewsrackRecipe, BasicNewsRecipe):
                 if section_name not in articles:
                     articles[section_name] = []
 
-                with PersistentTemporaryFile(suffix=".json", dir=self.temp_dir) as f:
-                    f.write(json.dumps(p).encode("utf-8"))
+                article_url = self.pack_article(json.dumps(p))
 
                 verticals = []
                 if p.get("espn_verticals"):
@@ -116,10 +119,10 @@ class FiveThirtyEight(WordPressNewsrackRecipe, BasicNewsRecipe):
 
                 articles[section_name].append(
                     {
-                        "title": unescape(p["title"]["rendered"]) or "Untitled",
-                        "url": "file://" + f.name,
+                        "title": html_to_text(p["title"]["rendered"]) or "Untitled",
+                        "url": article_url,
                         "date": f"{post_date:{get_date_format()}}",
-                        "description": unescape(" / ".join(verticals)),
+                        "description": html_to_text(" / ".join(verticals)),
                     }
                 )
         return articles.items()
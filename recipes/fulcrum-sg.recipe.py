@@ -9,7 +9,11 @@ import sys
 
 # custom include to share code between recipes
 sys.path.append(os.environ["recipes_includes"])
-from recipes_shared import WordPressNewsrackRecipe, get_datetime_format
+from recipes_shared import (
+    WP_LEAN_FIELDS,
+    WordPressNewsrackRecipe,
+    get_datetime_format,
+)
 
 from calibre.web.feeds.news import BasicNewsRecipe
 
@@ -30,6 +34,8 @@ class FulcrumSg(WordPressNewsrackRecipe, BasicNewsRecipe):
     masthead_url = "https://i0.wp.com/fulcrum.sg/wp-content/uploads/logo.png"
 
     oldest_article = 30  # days
+    wp_fields = WP_LEAN_FIELDS + ["commentaries_author"]
+    wp_embeds = ["author", "wp:term", "wp:featuredmedia"]
     compress_news_images_auto_size = 10
     reverse_article_order = False
 
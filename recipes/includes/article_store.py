@@ -0,0 +1,121 @@
+# Copyright (c) 2022 https://github.com/ping/
+#
+# This software is released under the GNU General Public License v3.0
+# https://opensource.org/licenses/GPL-3.0
+
+# On-disk store of already processed articles so that articles that have not
+# been updated since a previous run are not downloaded and processed again
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Optional
+
+from http_cache import normalize_url
+
+DEFAULT_MAX_AGE = 14 * 24 * 60 * 60  # seconds since an entry was last used
+ENTRY_FILENAME = "entry.txt"  # relative path of the article html in the entry
+# local references to files outside the article folder, e.g. an image shared with another article
+EXTERNAL_REF_RE = re.compile(r"""(?:src|href)\s*=\s*["']\.\./""", re.IGNORECASE)
+
+
+class ArticleStore(object):
+    """
+    Each entry is a copy of the article folder written by calibre's fetcher,
+    i.e. the processed html and its localised images, keyed by the article url
+    and an update marker, e.g. the post's modified date.
+    """
+
+    def __init__(self, store_dir: str, max_age: int = DEFAULT_MAX_AGE):
+        self.store_dir = store_dir
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _path(self, url: str, marker: str) -> str:
+        key = hashlib.sha256(
+            f"{normalize_url(url)}\n{marker}".encode("utf-8")
+        ).hexdigest()
+        return os.path.join(self.store_dir, key[:2], key)
+
+    def get(self, url: str, marker: str, dest_dir: str) -> Optional[str]:
+        """
+        Restore a stored article into dest_dir
+
+        :param url:
+        :param marker:
+        :param dest_dir: the article folder
+        :return: path to the restored html, or None if not stored
+        """
+        path = self._path(url, marker)
+        try:
+            with open(os.path.join(path, ENTRY_FILENAME), "r", encoding="utf-8") as f:
+                html_rel_path = f.read().strip()
+            shutil.copytree(
+                path,
+                dest_dir,
+                ignore=shutil.ignore_patterns(ENTRY_FILENAME),
+                dirs_exist_ok=True,
+            )
+            os.utime(path)  # most recently used
+        except OSError:
+            return None
+        html_path = os.path.join(dest_dir, html_rel_path)
+        if not os.path.exists(html_path):
+            return None
+        return html_path
+
+    def put(self, url: str, marker: str, article_dir: str, html_path: str) -> bool:
+        """
+        Store a processed article
+
+        :param url:
+        :param marker:
+        :param article_dir: the article folder
+        :param html_path: path to the article html
+        :return: True if stored
+        """
+        html_rel_path = os.path.relpath(html_path, article_dir)
+        if html_rel_path.startswith(os.pardir):
+            return False
+        for file_name in os.listdir(article_dir):
+            if not file_name.lower().endswith((".html", ".xhtml")):
+                continue
+            with open(os.path.join(article_dir, file_name), "r", encoding="utf-8") as f:
+                if EXTERNAL_REF_RE.search(f.read()):
+                    # cannot be restored without the other article's files
+                    return False
+
+        path = self._path(url, marker)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copytree(article_dir, temp_path, dirs_exist_ok=True)
+        with open(os.path.join(temp_path, ENTRY_FILENAME), "w", encoding="utf-8") as f:
+            f.write(html_rel_path)
+        with self.lock:
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(temp_path, path)
+        return True
+
+    def prune(self) -> int:
+        """
+        Remove the entries that have not been used for more than max_age
+
+        :return: number of entries removed
+        """
+        cutoff = time.time() - self.max_age
+        removed = 0
+        for shard in os.scandir(self.store_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    if entry.stat().st_mtime >= cutoff:
+                        continue
+                except FileNotFoundError:
+                    continue
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        return removed
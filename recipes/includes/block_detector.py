@@ -0,0 +1,250 @@
+# Copyright (c) 2022 https://github.com/ping/
+#
+# This software is released under the GNU General Public License v3.0
+# https://opensource.org/licenses/GPL-3.0
+
+# Detect when a site is blocking or throttling the recipe so that
+# further requests to it fail fast instead of running into timeouts
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from os.path import splitext
+from typing import Dict, NamedTuple, Optional, Pattern
+from urllib.error import URLError
+from urllib.parse import urlsplit
+
+RESPONSE_OK = "ok"
+RESPONSE_BLOCKED = "blocked"  # e.g. bot detection, won't change during the run
+RESPONSE_THROTTLED = "throttled"  # too many requests, can be retried later
+RESPONSE_TRANSIENT = "transient"  # server errors and network failures
+
+BLOCKED_CODES = (403, 451)
+THROTTLED_CODES = (429,)
+TRANSIENT_CODES = (500, 502, 503, 504, 520, 521, 522, 523, 524)
+# network errors that say nothing about whether the host is blocking,
+# e.g. a reset or refused connection, or a timeout
+TRANSIENT_ERRORS = (ConnectionError, socket.timeout, TimeoutError)
+# images and other page assets, which are often hotlink protected
+# or served from a CDN, and so don't reflect how the host treats the recipe
+ASSET_EXTENSIONS = (
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+    ".webp",
+    ".avif",
+    ".svg",
+    ".ico",
+    ".css",
+    ".js",
+    ".woff",
+    ".woff2",
+    ".ttf",
+    ".mp3",
+    ".mp4",
+)
+
+
+class ResponseVerdict(NamedTuple):
+    kind: str
+    retry_after: float = 0  # seconds
+
+
+class HostUnavailableError(Exception):
+    """Requests to the host are failing fast because it is blocking or failing"""
+
+
+def get_retry_after(headers) -> float:
+    """
+    Parse the Retry-After header
+
+    :param headers:
+    :return: seconds, 0 if not available
+    """
+    value = (headers.get("Retry-After") or "").strip() if headers else ""
+    if not value:
+        return 0
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return 0
+    return max(0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def classify_response(
+    code: int,
+    headers=None,
+    url: str = "",
+    blocked_url_re: Optional[Pattern] = None,
+) -> ResponseVerdict:
+    """
+    Classify a response by its status code, headers and url
+
+    :param code:
+    :param headers:
+    :param url: final url or redirect location
+    :param blocked_url_re: matches the url of the site's bot challenge page
+    :return:
+    """
+    location = (headers.get("Location") or "") if headers else ""
+    if blocked_url_re and any(u and blocked_url_re.search(u) for u in (url, location)):
+        return ResponseVerdict(RESPONSE_BLOCKED)
+    if headers and (headers.get("cf-mitigated") or "").lower() == "challenge":
+        # cloudflare challenge page
+        return ResponseVerdict(RESPONSE_BLOCKED)
+    if code in BLOCKED_CODES:
+        return ResponseVerdict(RESPONSE_BLOCKED)
+    retry_after = get_retry_after(headers)
+    if code in THROTTLED_CODES or (code == 503 and retry_after):
+        return ResponseVerdict(RESPONSE_THROTTLED, retry_after)
+    if code in TRANSIENT_CODES:
+        return ResponseVerdict(RESPONSE_TRANSIENT, retry_after)
+    return ResponseVerdict(RESPONSE_OK)
+
+
+def classify_error(
+    err: Exception, blocked_url_re: Optional[Pattern] = None
+) -> Optional[ResponseVerdict]:
+    """
+    Classify a request error
+
+    :param err:
+    :param blocked_url_re: matches the url of the site's bot challenge page
+    :return: None if the error is not from the request, e.g. an aborted article
+    """
+    code = getattr(err, "code", None)
+    if isinstance(code, int):
+        # urllib/mechanize HTTPError
+        headers = getattr(err, "hdrs", None) or getattr(err, "headers", None)
+        verdict = classify_response(
+            code, headers, getattr(err, "filename", "") or "", blocked_url_re
+        )
+        if verdict.kind != RESPONSE_OK:
+            return verdict
+        # other 4xx, e.g. a missing page
+        return None
+    reason: BaseException = err
+    if isinstance(err, URLError) and isinstance(err.reason, BaseException):
+        reason = err.reason
+    if isinstance(reason, TRANSIENT_ERRORS):
+        return ResponseVerdict(RESPONSE_TRANSIENT)
+    # other errors, e.g. a failed name lookup or an invalid response,
+    # are left to the recipe
+    return None
+
+
+def is_asset_url(url: str) -> bool:
+    """
+    Whether the url is for a page asset, e.g. an image, by its extension
+
+    :param url:
+    :return:
+    """
+    return splitext(urlsplit(url).path)[1].lower() in ASSET_EXTENSIONS
+
+
+class HostState(object):
+    def __init__(self):
+        self.blocked = 0  # consecutive blocked responses
+        self.failures = 0  # consecutive throttled or transient responses
+        self.is_blocked = False
+        self.open_until = 0.0  # circuit is open, i.e. fail fast, until then
+        self.resume_at = 0.0  # throttled until then
+
+
+class CircuitBreaker(object):
+    """
+    Per-host circuit breaker shared by calibre's download threads.
+
+    - ``block_threshold`` consecutive blocked responses from a host block it
+      for the rest of the run.
+    - ``failure_threshold`` consecutive throttled or transient responses open
+      the circuit for ``cooldown`` seconds (or the Retry-After). After that,
+      one more failure opens it again.
+    - A throttled response delays the next requests to the host by its
+      Retry-After, up to ``max_retry_after`` seconds.
+
+    Requests to a blocked host or while the circuit is open
+    raise HostUnavailableError in before_request().
+    """
+
+    def __init__(
+        self,
+        block_threshold: int = 3,
+        failure_threshold: int = 5,
+        cooldown: float = 60,
+        max_retry_after: float = 60,
+    ):
+        self.block_threshold = block_threshold
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_retry_after = max_retry_after
+        self.lock = threading.Lock()
+        self.hosts: Dict[str, HostState] = {}
+
+    def _get_state(self, host: str) -> HostState:
+        state = self.hosts.get(host)
+        if not state:
+            state = self.hosts[host] = HostState()
+        return state
+
+    def is_blocked(self, host: str) -> bool:
+        with self.lock:
+            return self._get_state(host).is_blocked
+
+    def before_request(self, host: str) -> None:
+        """
+        Wait until a request to the host is allowed
+
+        :param host:
+        :return:
+        """
+        with self.lock:
+            state = self._get_state(host)
+            now = time.monotonic()
+            if state.is_blocked:
+                raise HostUnavailableError(f"{host} is blocking requests")
+            if state.open_until > now:
+                raise HostUnavailableError(
+                    f"{host} is failing, retrying in {state.open_until - now:.0f}s"
+                )
+            wait = state.resume_at - now
+        if wait > self.max_retry_after:
+            raise HostUnavailableError(f"{host} is throttling for {wait:.0f}s")
+        if wait > 0:
+            time.sleep(wait)
+
+    def record(self, host: str, verdict: ResponseVerdict) -> bool:
+        """
+        Record the result of a request to the host
+
+        :param host:
+        :param verdict:
+        :return: True if the host is now blocked
+        """
+        with self.lock:
+            state = self._get_state(host)
+            now = time.monotonic()
+            if verdict.kind == RESPONSE_OK:
+                state.blocked = state.failures = 0
+                return False
+            if verdict.kind == RESPONSE_BLOCKED:
+                state.blocked += 1
+                if not state.is_blocked and state.blocked >= self.block_threshold:
+                    state.is_blocked = True
+                    return True
+                return False
+
+            state.blocked = 0
+            state.failures += 1
+            if verdict.retry_after:
+                state.resume_at = max(state.resume_at, now + verdict.retry_after)
+            if state.failures >= self.failure_threshold:
+                state.open_until = now + max(self.cooldown, verdict.retry_after)
+                # allow one request after the cooldown before opening again
+                state.failures = self.failure_threshold - 1
+            return False
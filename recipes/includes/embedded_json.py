@@ -0,0 +1,189 @@
+# Copyright (c) 2022 https://github.com/ping/
+#
+# This software is released under the GNU General Public License v3.0
+# https://opensource.org/licenses/GPL-3.0
+
+# Extract the json embedded in a page's <script> elements without
+# parsing the whole page into a DOM
+import json
+import re
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, Optional, Pattern, Tuple
+
+SCRIPT_START_RE = re.compile(r"<script\b([^>]*)>", re.IGNORECASE)
+SCRIPT_END_RE = re.compile(r"</script\s*>", re.IGNORECASE)
+ATTR_RE = re.compile(
+    r"""([^\s"'=<>/]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+)))?"""
+)
+WHITESPACE_RE = re.compile(r"\s*")
+# JS values that are not valid json, outside of strings
+JS_UNDEFINED_RE = re.compile(r'("[^"\\]*(?:\\.[^"\\]*)*")|(?<=[:\[,])(\s*)undefined\b')
+
+# strict=False allows raw control characters such as newlines in strings
+json_decoder = json.JSONDecoder(strict=False)
+
+
+@lru_cache(maxsize=32)
+def compile_prefix(prefix_expr: str) -> Pattern:
+    return re.compile(prefix_expr)
+
+
+def parse_attrs(attrs_html: str) -> Dict[str, str]:
+    attrs: Dict[str, str] = {}
+    for m in ATTR_RE.finditer(attrs_html):
+        value = next((v for v in m.group(2, 3, 4) if v is not None), "")
+        attrs.setdefault(m.group(1).lower(), value)
+    return attrs
+
+
+def match_attrs(attrs: Dict[str, str], expected: Optional[Dict]) -> bool:
+    """
+    Match element attributes like BeautifulSoup's find_all(attrs=...), i.e.
+    True/False for whether the attribute is present, or the value
+    as a string, a compiled regex or a list of strings
+
+    :param attrs:
+    :param expected:
+    :return:
+    """
+    for name, expected_value in (expected or {}).items():
+        value = attrs.get(name)
+        if expected_value is True:
+            if value is None:
+                return False
+        elif expected_value is False or expected_value is None:
+            if value is not None:
+                return False
+        elif value is None:
+            return False
+        elif hasattr(expected_value, "search"):
+            if not expected_value.search(value):
+                return False
+        elif isinstance(expected_value, (list, tuple, set)):
+            if value not in expected_value:
+                return False
+        elif value != expected_value:
+            return False
+    return True
+
+
+def iter_scripts(html: str, attrs: Optional[Dict] = None) -> Iterator[Tuple[int, int]]:
+    """
+    Find the <script> elements in a html document
+
+    :param html:
+    :param attrs: filter, see match_attrs()
+    :return: start and end offsets of the script contents in html
+    """
+    pos = 0
+    while True:
+        start_match = SCRIPT_START_RE.search(html, pos)
+        if not start_match:
+            return
+        end_match = SCRIPT_END_RE.search(html, start_match.end())
+        if not end_match:
+            return
+        pos = end_match.end()
+        if match_attrs(parse_attrs(start_match.group(1)), attrs):
+            yield start_match.end(), end_match.start()
+
+
+def decode_json(text: str, start: int = 0, end: Optional[int] = None) -> Any:
+    """
+    Decode the json value at text[start:end], ignoring anything after it, e.g.
+    a trailing semicolon. Tolerates raw newlines in strings and JS ``undefined``.
+
+    :param text:
+    :param start:
+    :param end:
+    :return:
+    """
+    if end is None:
+        end = len(text)
+    start = WHITESPACE_RE.match(text, start).end()  # type: ignore[union-attr]
+    try:
+        value, value_end = json_decoder.raw_decode(text, start)
+        if value_end <= end:
+            return value
+    except json.JSONDecodeError as err:
+        if not text.startswith("undefined", err.pos):
+            raise
+    # only copy the script for the less common JS-isms
+    script_js = JS_UNDEFINED_RE.sub(
+        lambda m: m.group(1) or f"{m.group(2)}null", text[start:end]
+    )
+    return json_decoder.raw_decode(script_js)[0]
+
+
+def decode_script(
+    text: str, prefix_expr: str = "", start: int = 0, end: Optional[int] = None
+) -> Any:
+    """
+    Decode the json in a script's js, e.g. ``window.__STATE__ = {...};``
+
+    :param text:
+    :param prefix_expr: regex for the js before the json, e.g. ``window.__STATE__\\s*=\\s*``
+    :param start: start of the script in text
+    :param end: end of the script in text
+    :return: None if the script is empty or does not start with prefix_expr
+    """
+    if end is None:
+        end = len(text)
+    start = WHITESPACE_RE.match(text, start).end()  # type: ignore[union-attr]
+    if start >= end:
+        return None
+    if prefix_expr:
+        prefix_match = compile_prefix(prefix_expr).match(text, start, end)
+        if not prefix_match:
+            return None
+        start = prefix_match.end()
+    return decode_json(text, start, end)
+
+
+def get_script_json(
+    html: str,
+    prefix_expr: str = "",
+    attrs=None,
+    on_error: Optional[Callable[[json.JSONDecodeError, str], None]] = None,
+) -> Any:
+    """
+    Decode the json in the first matching script element
+
+    :param html:
+    :param prefix_expr: regex for the js before the json, e.g. ``window.__STATE__\\s*=\\s*``
+    :param attrs: filter, see match_attrs()
+    :param on_error: called with the error and the script instead of raising,
+        and the next matching script is tried
+    :return: None if not found
+    """
+    for start, end in iter_scripts(html, {"src": False} if attrs is None else attrs):
+        try:
+            data = decode_script(html, prefix_expr, start, end)
+        except json.JSONDecodeError as err:
+            if not on_error:
+                raise
+            on_error(err, html[start:end])
+            continue
+        if data is not None:
+            return data
+    return None
+
+
+def get_ld_json(html: str, filter_fn: Callable, attrs=None) -> Any:
+    """
+    Decode the first LD-JSON script element that matches filter_fn
+
+    :param html:
+    :param filter_fn:
+    :param attrs: filter, see match_attrs()
+    :return: None if not found
+    """
+    for start, end in iter_scripts(
+        html, {"type": "application/ld+json"} if attrs is None else attrs
+    ):
+        if WHITESPACE_RE.match(html, start).end() >= end:  # type: ignore[union-attr]
+            continue
+        data = decode_json(html, start, end)
+        if filter_fn(data):
+            return data
+    return None
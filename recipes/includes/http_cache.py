@@ -0,0 +1,352 @@
+# Copyright (c) 2022 https://github.com/ping/
+#
+# This software is released under the GNU General Public License v3.0
+# https://opensource.org/licenses/GPL-3.0
+
+# On-disk HTTP cache for recipe requests so that pages and images
+# downloaded in a previous run are not downloaded again
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from http.client import HTTPMessage
+from io import BytesIO
+from typing import Callable, Dict, Optional, Tuple
+from urllib.error import HTTPError
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+try:
+    from mechanize import Request  # provided by calibre
+except ImportError:
+    from urllib.request import Request  # type: ignore[assignment]
+
+DEFAULT_MAX_SIZE = 200 * 1024 * 1024
+CACHEABLE_CODES = (200, 203)
+EVICT_TO = 0.9  # proportion of the max size to evict down to
+IGNORED_HEADERS = ("set-cookie", "content-encoding", "content-length")
+# bodies are stored decoded, so they don't vary with the request's accepted encodings
+IGNORED_VARY_HEADERS = ("accept-encoding",)
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize a url for use as a cache key, i.e. lowercase scheme and host,
+    no default port, sorted query parameters and no fragment
+
+    :param url:
+    :return:
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        netloc = f"{netloc}:{parts.port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+def parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    directives: Dict[str, Optional[str]] = {}
+    for directive in value.split(","):
+        name, _, arg = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+
+def get_freshness_lifetime(headers) -> Optional[float]:
+    """
+    How long a response can be used without revalidating it
+
+    :param headers:
+    :return: seconds, or None if the response must not be stored
+    """
+    cache_control = parse_cache_control(headers.get("Cache-Control") or "")
+    if "no-store" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        return 0
+    if cache_control.get("max-age"):
+        try:
+            return max(0, int(cache_control["max-age"] or 0))
+        except ValueError:
+            return 0
+    if headers.get("Expires"):
+        try:
+            expires = parsedate_to_datetime(headers["Expires"])
+            date = (
+                parsedate_to_datetime(headers["Date"])
+                if headers.get("Date")
+                else datetime.now(timezone.utc)
+            )
+            return max(0, (expires - date).total_seconds())
+        except (TypeError, ValueError, IndexError):
+            return 0
+    return 0
+
+
+def is_shareable(headers) -> bool:
+    """
+    Whether a response can be served for any request to its url. The key is
+    only the url, so responses that set cookies or that vary with the request
+    headers, e.g. Cookie or Authorization, are not stored.
+
+    :param headers:
+    :return:
+    """
+    if headers.get("Set-Cookie"):
+        return False
+    get_all = getattr(headers, "get_all", None)
+    vary_values = (get_all("Vary") if get_all else [headers.get("Vary")]) or []
+    vary = {
+        name.strip().lower()
+        for value in vary_values
+        if value
+        for name in value.split(",")
+        if name.strip()
+    }
+    return vary.issubset(IGNORED_VARY_HEADERS)
+
+
+class BufferedResponse(object):
+    """
+    Response with the body read into memory, with the subset
+    of the mechanize response interface used by calibre
+    """
+
+    def __init__(
+        self, url: str, code: int, msg: str, headers: HTTPMessage, body: bytes
+    ):
+        self.url = url
+        self.code = self.status = code
+        self.msg = msg
+        self.headers = headers
+        self._fp = BytesIO(body)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._fp.read(size)
+
+    def info(self) -> HTTPMessage:
+        return self.headers
+
+    def geturl(self) -> str:
+        return self.url
+
+    def getcode(self) -> int:
+        return self.code
+
+    def close(self) -> None:
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class HttpCache(object):
+    """
+    Responses are stored zlib-compressed, one file per url, with the metadata
+    as a json line before the body. The least recently used entries are
+    evicted when the cache is over max_size.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.size = sum(size for _, size, _ in self._entries())
+
+    def _path(self, url: str) -> str:
+        key = hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}.cache")
+
+    def _entries(self):
+        for root, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                if not file_name.endswith(".cache"):
+                    continue
+                path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def get(self, url: str) -> Optional[Tuple[Dict, bytes]]:
+        """
+        Get a cached response
+
+        :param url:
+        :return: metadata, body
+        """
+        path = self._path(url)
+        try:
+            with open(path, "rb") as f:
+                data = zlib.decompress(f.read())
+            meta_json, _, body = data.partition(b"\n")
+            meta = json.loads(meta_json)
+            os.utime(path)  # most recently used
+        except (OSError, ValueError, zlib.error):
+            return None
+        if meta.get("url") != normalize_url(url):
+            return None
+        return meta, body
+
+    def put(self, url: str, meta: Dict, body: bytes) -> None:
+        """
+        Store a response
+
+        :param url:
+        :param meta:
+        :param body:
+        :return:
+        """
+        meta["url"] = normalize_url(url)
+        data = zlib.compress(json.dumps(meta).encode("utf-8") + b"\n" + body)
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            previous_size = os.path.getsize(path)
+        except OSError:
+            previous_size = 0
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self.lock:
+            self.size += len(data) - previous_size
+            over_size = self.size > self.max_size
+        if over_size:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used entries until the cache is below max_size
+
+        :return:
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size * EVICT_TO:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self.lock:
+            self.size = total
+
+    def open(
+        self,
+        open_func: Callable,
+        url_or_request,
+        *args,
+        forced_ttl: Optional[int] = None,
+        **kwargs,
+    ):
+        """
+        Open a url through the cache. Only GET requests for a url string are cached,
+        and only responses that don't set cookies or vary with the request headers.
+        Stale entries are revalidated with their ETag/Last-Modified.
+
+        :param open_func: e.g. br.open_novisit
+        :param url_or_request:
+        :param args: passed to open_func
+        :param forced_ttl: seconds to use a response for regardless of its headers
+        :param kwargs: passed to open_func
+        :return:
+        """
+        if (
+            not isinstance(url_or_request, str)
+            or (args and args[0] is not None)
+            or kwargs.get("data") is not None
+        ):
+            return open_func(url_or_request, *args, **kwargs)
+
+        url = url_or_request
+        now = time.time()
+        cached = self.get(url)
+        if cached:
+            meta, body = cached
+            if meta.get("expires", 0) > now:
+                return self._response(meta, body)
+            validators = {}
+            if meta.get("etag"):
+                validators["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                validators["If-Modified-Since"] = meta["last_modified"]
+            if validators:
+                url_or_request = Request(url, headers=validators)
+
+        try:
+            res = open_func(url_or_request, *args, **kwargs)
+        except HTTPError as err:
+            if not (cached and err.code == 304):
+                raise
+            meta, body = cached
+            lifetime = (
+                forced_ttl
+                if forced_ttl is not None
+                else get_freshness_lifetime(err.headers or {})
+            )
+            meta["expires"] = now + (lifetime or 0)
+            self.put(url, meta, body)
+            return self._response(meta, body)
+
+        try:
+            body = res.read()
+        finally:
+            res.close()
+        code = res.getcode() or 200
+        headers = res.info()
+        lifetime = (
+            forced_ttl if forced_ttl is not None else get_freshness_lifetime(headers)
+        )
+        if (
+            code in CACHEABLE_CODES
+            and lifetime is not None
+            and (lifetime > 0 or headers.get("ETag") or headers.get("Last-Modified"))
+            and is_shareable(headers)
+        ):
+            self.put(
+                url,
+                {
+                    "final_url": res.geturl(),
+                    "code": code,
+                    "msg": getattr(res, "msg", "OK"),
+                    "headers": [
+                        [k, v]
+                        for k, v in headers.items()
+                        if k.lower() not in IGNORED_HEADERS
+                    ],
+                    "etag": headers.get("ETag", ""),
+                    "last_modified": headers.get("Last-Modified", ""),
+                    "expires": now + lifetime,
+                },
+                body,
+            )
+        return BufferedResponse(
+            res.geturl(), code, getattr(res, "msg", "OK"), headers, body
+        )
+
+    @staticmethod
+    def _response(meta: Dict, body: bytes) -> BufferedResponse:
+        headers = HTTPMessage()
+        for k, v in meta.get("headers", []):
+            headers[k] = v
+        return BufferedResponse(
+            meta.get("final_url") or meta["url"],
+            meta.get("code", 200),
+            meta.get("msg", "OK"),
+            headers,
+            body,
+        )
@@ -1,13 +1,24 @@
 import json
 import os
-import random
-import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import closing
+from typing import Dict, Iterable, Optional, Set
 from urllib.parse import urlparse
 
-from calibre import browser
 from calibre.ebooks.BeautifulSoup import BeautifulSoup
 
-from recipes_shared import BasicNewsrackRecipe, get_date_format
+from recipes_shared import (
+    GOOGLEBOT_USER_AGENT,
+    BasicNewsrackRecipe,
+    BufferedResponse,
+    CookielessOpener,
+    RateLimit,
+    get_date_format,
+    get_request_url,
+)
+
+WAYBACK_CACHED_HOST = "www.nytimes.com"
 
 
 class NYTRecipe(BasicNewsrackRecipe):
@@ -17,9 +28,20 @@ class NYTRecipe(BasicNewsrackRecipe):
     ignore_duplicate_articles = {"title", "url"}
 
     delay = 0
-    simultaneous_downloads = 1
-    delay_range = list(range(2, 5))
-    bot_blocked = False
+    # articles are throttled by rate_limits so that images can be fetched concurrently
+    simultaneous_downloads = 4
+    # 2-4s between requests, except for the static assets
+    default_rate_limit = RateLimit(interval=2, jitter=2, concurrency=1)
+    rate_limits = {"static01.nyt.com": None, "mwcm.nyt.com": None}
+    # switch to the wayback cache as soon as the site blocks, see on_host_blocked()
+    block_threshold = 1
+    abort_on_block = False
+    # once blocked, the remaining articles are fetched from the wayback cache
+    # concurrently with this many requests at a time
+    wayback_concurrency = 4
+    wayback_timeout = 3 * 60
+    _wayback_lock = threading.Lock()
+    _wayback_executor: Optional[ThreadPoolExecutor] = None
 
     # The NYT occassionally returns bogus articles for some reason just in case
     # it is because of cookies, dont store cookies
@@ -45,47 +67,105 @@ class NYTRecipe(BasicNewsrackRecipe):
             headers={"User-Agent": "calibre", "Content-Type": "application/json"},
         )
         if br is None:
-            br = browser()
+            br = CookielessOpener()
         br.set_handle_gzip(True)
-        return br.open_novisit(rq, timeout=3 * 60)
+        return br.open_novisit(rq, timeout=self.wayback_timeout)
+
+    def _fetch_from_wayback(self, url: str) -> BufferedResponse:
+        with closing(self.open_from_wayback(url)) as res:
+            return BufferedResponse(
+                res.geturl(),
+                res.getcode() or 200,
+                getattr(res, "msg", "OK"),
+                res.info(),
+                res.read(),
+            )
+
+    def prefetch_from_wayback(self, urls: Iterable[str]) -> None:
+        """
+        Send a batch of urls to the wayback cache. The responses are
+        kept in memory until they are opened with open_novisit().
+
+        :param urls:
+        :return:
+        """
+        with self._wayback_lock:
+            if not self._wayback_executor:
+                self._wayback_executor = ThreadPoolExecutor(
+                    max_workers=max(1, self.wayback_concurrency)
+                )
+                self._wayback_responses: Dict[str, Future] = {}
+                self._wayback_requested: Set[str] = set()
+            for url in urls:
+                if url not in self._wayback_requested:
+                    self._wayback_requested.add(url)
+                    self._wayback_responses[url] = self._wayback_executor.submit(
+                        self._fetch_from_wayback, url
+                    )
+
+    def open_from_wayback_batch(self, url: str) -> BufferedResponse:
+        """
+        Open a url from the wayback cache, sending the remaining
+        articles that have not been downloaded yet in the same batch
+
+        :param url:
+        :return:
+        """
+        urls = [url]
+        for feed in getattr(self, "feed_objects", None) or []:
+            for article in feed.articles:
+                if (
+                    not getattr(article, "downloaded", False)
+                    and urlparse(article.url).netloc == WAYBACK_CACHED_HOST
+                ):
+                    urls.append(article.url)
+        self.prefetch_from_wayback(urls)
+        with self._wayback_lock:
+            # each response can be read only once, so a retry is fetched again
+            future = self._wayback_responses.pop(url, None)
+        if not future:
+            return self._fetch_from_wayback(url)
+        return future.result()
+
+    def cleanup(self) -> None:
+        if self._wayback_executor:
+            self._wayback_executor.shutdown(wait=False, cancel_futures=True)
+        super().cleanup()
+
+    def on_host_blocked(self, host: str, url: str) -> None:
+        if host == WAYBACK_CACHED_HOST:
+            self.log.warn(f"Blocked by bot detection. Fetching from wayback cache: {url}")  # type: ignore[attr-defined]
+            return
+        # the wayback cache does not support other hosts, so give up
+        err_msg = f"Blocked by bot detection: {url}"
+        self.log.warning(err_msg)  # type: ignore[attr-defined]
+        self.abort_recipe_processing(err_msg)  # type: ignore[attr-defined]
 
     def open_novisit(self, *args, **kwargs):
-        target_url = args[0]
-        is_wayback_cached = urlparse(target_url).netloc == "www.nytimes.com"
+        target_url = get_request_url(args[0])
+        # don't use wayback for static assets because these are not blocked currently
+        # and the wayback cache does not support them anyway
+        is_wayback_cached = urlparse(target_url).netloc == WAYBACK_CACHED_HOST
+        breaker = self.get_circuit_breaker()
 
-        if is_wayback_cached and self.bot_blocked:
-            # don't use wayback for static assets because these are not blocked currently
-            # and the wayback cache does not support them anyway
+        if is_wayback_cached and breaker.is_blocked(WAYBACK_CACHED_HOST):
             self.log.warn(f"Block detected. Fetching from wayback cache: {target_url}")
-            return self.open_from_wayback(target_url)
+            return self.open_from_wayback_batch(target_url)
 
-        if urlparse(target_url).hostname not in ("static01.nyt.com", "mwcm.nyt.com"):
-            # we could have used the new get_url_specific_delay() but
-            # wayback requests don't need to be delayed
-            sleep_interval = random.choice(self.delay_range)
-            self.log.debug(f"Sleeping {sleep_interval}s before fetching {target_url}")
-            time.sleep(sleep_interval)
+        # we could have used the new get_url_specific_delay() but
+        # wayback requests don't need to be delayed
+        br = CookielessOpener([("User-agent", GOOGLEBOT_USER_AGENT)])
 
-        br = browser(
-            user_agent="Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)"
-        )
-        try:
-            return br.open_novisit(*args, **kwargs)
-        except Exception as e:
-            if hasattr(e, "code") and e.code == 403:
-                self.bot_blocked = True
-                self.delay = 0  # I don't think this makes a difference but oh well
-                if is_wayback_cached:
-                    self.log.warn(
-                        f"Blocked by bot detection. Fetching from wayback cache: {target_url}"
-                    )
-                    return self.open_from_wayback(target_url)
+        def throttled_open(*a, **kw):
+            with self.throttle(a[0]):
+                return br.open_novisit(*a, **kw)
 
-                # if static asset is also blocked, give up
-                err_msg = f"Blocked by bot detection: {target_url}"
-                self.log.warning(err_msg)
-                self.abort_recipe_processing(err_msg)
-                self.abort_article(err_msg)
+        try:
+            return self.open_url(throttled_open, *args, **kwargs)
+        except Exception:
+            if is_wayback_cached and breaker.is_blocked(WAYBACK_CACHED_HOST):
+                # blocked by this request
+                return self.open_from_wayback_batch(target_url)
             raise
 
     open = open_novisit
@@ -290,8 +370,7 @@ class NYTRecipe(BasicNewsrackRecipe):
         return str(soup)
 
     def preprocess_raw_html(self, raw_html, url):
-        soup = BeautifulSoup(raw_html)
-        info = self.get_script_json(soup, r"window.__preloadedData\s*=\s*")
+        info = self.get_script_json(raw_html, r"window.__preloadedData\s*=\s*")
         if not info:
             if os.environ.get("recipe_debug_folder", ""):
                 recipe_folder = os.path.join(
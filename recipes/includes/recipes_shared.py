@@ -1,21 +1,50 @@
+import http.client
 import json
 import os
+import random
 import re
 import shutil
+import socket
+import ssl
+import threading
 import time
 import warnings
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from datetime import datetime, timedelta, timezone
 from html import unescape
-from typing import Optional, Dict, List, Callable
-from urllib.parse import urlencode
+from io import BytesIO
+from typing import Optional, Dict, List, Callable, Tuple, NamedTuple, Union, Pattern
+from urllib.error import HTTPError
+from urllib.parse import urlencode, urljoin, urlsplit
+from urllib.request import getproxies
 
-from calibre import browser
+from calibre import browser, random_user_agent
 from calibre.constants import iswindows
 from calibre.ebooks.BeautifulSoup import BeautifulSoup
-from calibre.ptempfile import PersistentTemporaryDirectory, PersistentTemporaryFile
+from calibre.ptempfile import PersistentTemporaryDirectory
 from calibre.utils.browser import Browser
 from calibre.web.feeds import Feed
 
+import embedded_json
+from article_store import ArticleStore
+from block_detector import (
+    RESPONSE_BLOCKED,
+    RESPONSE_THROTTLED,
+    CircuitBreaker,
+    HostUnavailableError,
+    classify_error,
+    classify_response,
+    is_asset_url,
+)
+from http_cache import DEFAULT_MAX_SIZE, BufferedResponse, HttpCache
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+
 
 def get_date_format() -> str:
     try:
@@ -79,10 +108,23 @@ def format_title(feed_name: str, post_date: datetime) -> str:
 
 
 COMMA_SEP_RE = re.compile(r"\s*,\s*")
+HTML_TAG_RE = re.compile(r"<[A-Za-z/!][^>]*>")
 SPACE_SEP_RE = re.compile(r"\s+")
 NON_NUMERIC_RE = re.compile(r"[^\d]+")
 
 
+def html_to_text(html: str) -> str:
+    """
+    Strip the tags from a short html fragment, e.g. a post title,
+    without the overhead of parsing it
+
+    :param html:
+    :return:
+    """
+    # unescape after removing the tags so that escaped brackets are kept as text
+    return unescape(HTML_TAG_RE.sub("", html))
+
+
 def extract_from_img_srcset(srcset: str, max_width=0):
     sources = [s.strip() for s in COMMA_SEP_RE.split(srcset) if s.strip()]
     if len(sources) == 1:
@@ -109,6 +151,223 @@ def extract_from_img_srcset(srcset: str, max_width=0):
     return parsed_sources[-1][0]
 
 
+class RateLimit(NamedTuple):
+    """Limits for the requests to a host"""
+
+    interval: float = 0  # average seconds between requests
+    burst: int = 1  # requests that can be made without waiting
+    jitter: float = 0  # max random seconds added to each throttled request
+    concurrency: int = 0  # max concurrent requests, 0 for no limit
+
+
+class TokenBucket(object):
+    def __init__(self, rate_limit: RateLimit):
+        self.rate_limit = rate_limit
+        self.tokens = float(max(1, rate_limit.burst))
+        self.updated = time.monotonic()
+        self.active = 0
+        self.condition = threading.Condition()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate_limit.interval > 0:
+            self.tokens = min(
+                max(1, self.rate_limit.burst),
+                self.tokens + (now - self.updated) / self.rate_limit.interval,
+            )
+        else:
+            self.tokens = max(1, self.rate_limit.burst)
+        self.updated = now
+
+    def acquire(self) -> None:
+        with self.condition:
+            while True:
+                if self.rate_limit.concurrency and (
+                    self.active >= self.rate_limit.concurrency
+                ):
+                    self.condition.wait()
+                    continue
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.active += 1
+                    break
+                self.condition.wait((1 - self.tokens) * self.rate_limit.interval)
+        if self.rate_limit.jitter:
+            time.sleep(random.uniform(0, self.rate_limit.jitter))
+
+    def release(self) -> None:
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def update(self, rate_limit: RateLimit) -> None:
+        """
+        Change the limit in place so that the requests in progress
+        still count towards the new concurrency limit
+
+        :param rate_limit:
+        :return:
+        """
+        with self.condition:
+            if rate_limit == self.rate_limit:
+                return
+            self._refill()
+            self.rate_limit = rate_limit
+            self.tokens = min(self.tokens, float(max(1, rate_limit.burst)))
+            self.condition.notify_all()
+
+
+class RateLimiter(object):
+    """Token buckets by host, shared by calibre's download threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    @contextmanager
+    def limit(self, host: str, rate_limit: RateLimit):
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if not bucket:
+                bucket = self.buckets[host] = TokenBucket(rate_limit)
+        bucket.update(rate_limit)
+        bucket.acquire()
+        try:
+            yield
+        finally:
+            bucket.release()
+
+
+rate_limiter = RateLimiter()
+
+
+_http_cache: Optional[HttpCache] = None
+_http_cache_lock = threading.Lock()
+
+
+def get_http_cache() -> Optional[HttpCache]:
+    """
+    The HTTP cache shared by the recipe's requests, if the
+    ``newsrack_http_cache_dir`` env var is set
+
+    :return:
+    """
+    global _http_cache
+    cache_dir = os.environ.get("newsrack_http_cache_dir")
+    if not cache_dir:
+        return None
+    with _http_cache_lock:
+        if not _http_cache:
+            try:
+                max_size = int(os.environ["newsrack_http_cache_size"]) * 1024 * 1024
+            except (KeyError, ValueError):
+                max_size = DEFAULT_MAX_SIZE
+            _http_cache = HttpCache(cache_dir, max_size)
+    return _http_cache
+
+
+_circuit_breaker_lock = threading.Lock()
+
+_article_store: Optional[ArticleStore] = None
+_article_store_lock = threading.Lock()
+
+
+def get_article_store() -> Optional[ArticleStore]:
+    """
+    The store of processed articles shared by the recipes, if the
+    ``newsrack_article_store_dir`` env var is set
+
+    :return:
+    """
+    global _article_store
+    store_dir = os.environ.get("newsrack_article_store_dir")
+    if not store_dir:
+        return None
+    with _article_store_lock:
+        if not _article_store:
+            _article_store = ArticleStore(store_dir)
+            _article_store.prune()
+    return _article_store
+
+
+ARTICLE_URL_SCHEME = "newsrack-article"
+
+
+class PackedArticles(object):
+    """
+    The raw content of the articles that a recipe synthesizes, e.g. from API json,
+    appended to a single in-memory buffer with an offset index. The articles are
+    served to calibre's fetcher through the recipe's browser with
+    ``newsrack-article:`` urls instead of one temp file per article.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._buffer = bytearray()
+        self._index: Dict[str, Tuple[int, int]] = {}
+
+    def add(self, content: Union[str, bytes]) -> str:
+        """
+        Add an article
+
+        :param content:
+        :return: url for the article
+        """
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        with self.lock:
+            url = f"{ARTICLE_URL_SCHEME}://packed/{len(self._index)}"
+            self._index[url] = (len(self._buffer), len(content))
+            self._buffer.extend(content)
+        return url
+
+    def get(self, url: str) -> Optional[bytes]:
+        with self.lock:
+            if url not in self._index:
+                return None
+            offset, size = self._index[url]
+            return bytes(self._buffer[offset : offset + size])
+
+    def open(self, url: str) -> BufferedResponse:
+        content = self.get(url)
+        if content is None:
+            raise HTTPError(url, 404, "Not Found", http.client.HTTPMessage(), None)
+        return BufferedResponse(url, 200, "OK", http.client.HTTPMessage(), content)
+
+
+class RecipeBrowser(object):
+    """
+    Wraps a calibre browser so that its requests go through the recipe,
+    i.e. for packed articles and the HTTP cache
+    """
+
+    def __init__(self, br, recipe):
+        object.__setattr__(self, "_br", br)
+        object.__setattr__(self, "_recipe", recipe)
+
+    def __getattr__(self, name):
+        return getattr(self._br, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._br, name, value)
+
+    def open_novisit(self, *args, **kwargs):
+        return self._recipe.open_url(self._br.open_novisit, *args, **kwargs)
+
+    def open(self, *args, **kwargs):
+        return self._recipe.open_url(self._br.open, *args, **kwargs)
+
+    def clone_browser(self, *args, **kwargs):
+        return RecipeBrowser(self._br.clone_browser(*args, **kwargs), self._recipe)
+
+
+def get_request_url(url_or_request) -> str:
+    if hasattr(url_or_request, "get_full_url"):
+        return url_or_request.get_full_url()
+    return url_or_request
+
+
 class BasicNewsrackRecipe(object):
     encoding = "utf-8"
     remove_javascript = True
@@ -126,6 +385,28 @@ class BasicNewsrackRecipe(object):
     pub_date: Optional[datetime] = None  # custom publication date
     temp_dir: Optional[PersistentTemporaryDirectory] = None
 
+    # request throttling by hostname (or a parent domain), None for no limit
+    rate_limits: Dict[str, Optional[RateLimit]] = {}
+    default_rate_limit: Optional[RateLimit] = None  # for other hosts
+
+    # cache responses across runs if the newsrack_http_cache_dir env var is set
+    use_http_cache = True
+    # seconds to reuse a cached response for, regardless of its caching headers
+    http_cache_ttl: Optional[int] = None
+    # reuse processed articles from previous runs if the newsrack_article_store_dir
+    # env var is set, for articles with an update marker from set_article_marker()
+    use_article_store = True
+    # requests to a host fail fast once it is blocking or keeps failing, see CircuitBreaker
+    use_circuit_breaker = True
+    # domains of the pages guarded by the circuit breaker, e.g. ["example.com"],
+    # defaults to the hosts of the index and the articles
+    circuit_breaker_domains: List[str] = []
+    block_threshold = 3  # consecutive blocked responses before a host is blocking
+    blocked_url_re: Optional[Pattern] = None  # url of the site's bot challenge page
+    # abort the recipe once a host is blocking instead of only failing its requests,
+    # or override on_host_blocked() to degrade, e.g. switch to another source
+    abort_on_block = True
+
     def publication_date(self) -> Optional[datetime]:
         return self.pub_date
 
@@ -146,64 +427,328 @@ class BasicNewsrackRecipe(object):
         """
         return parse_date(date_string, tz_info, as_utc, **kwargs)
 
+    def get_browser(self, *args, **kwargs):
+        return RecipeBrowser(super().get_browser(*args, **kwargs), self)
+
+    @classmethod
+    def customises_browser(cls) -> bool:
+        """
+        Whether a subclass overrides get_browser(), e.g. to log in
+
+        :return:
+        """
+        for klass in cls.__mro__:
+            if "get_browser" in vars(klass):
+                return klass is not BasicNewsrackRecipe
+        return False
+
+    def clone_browser(self, br):
+        # calibre uses a new default browser for each article and index page
+        # if get_browser() is its base implementation, and a clone of the
+        # recipe's browser otherwise. get_browser() is overridden above to wrap
+        # the browser, so keep the new default browser for the recipes that
+        # don't customise it.
+        if not self.customises_browser():
+            return self.get_browser()
+        return super().clone_browser(br)  # type: ignore[misc]
+
+    def pack_article(self, content: Union[str, bytes]) -> str:
+        """
+        Keep the raw content of an article synthesized by the recipe, e.g. API json,
+        for calibre to fetch and process with preprocess_raw_html() as usual
+
+        :param content:
+        :return: url for the article, to be returned by parse_index()
+        """
+        if not hasattr(self, "_packed_articles"):
+            self._packed_articles = PackedArticles()
+        return self._packed_articles.add(content)
+
+    def open_url(self, open_func: Callable, *args, **kwargs):
+        """
+        Open a url with open_func, serving packed articles from memory
+        and other urls through the HTTP cache if it is enabled
+
+        :param open_func: e.g. br.open_novisit
+        :param args:
+        :param kwargs:
+        :return:
+        """
+        url = get_request_url(args[0]) if args else ""
+        if isinstance(url, str) and url.startswith(f"{ARTICLE_URL_SCHEME}:"):
+            packed_articles = (
+                getattr(self, "_packed_articles", None) or PackedArticles()
+            )
+            return packed_articles.open(url)
+
+        host = urlsplit(url).hostname if isinstance(url, str) else ""
+        if self.use_circuit_breaker and host:
+            open_func = self.guard_requests(open_func, host)
+
+        http_cache = get_http_cache() if self.use_http_cache else None
+        if not http_cache:
+            return open_func(*args, **kwargs)
+        return http_cache.open(
+            open_func, *args, forced_ttl=self.http_cache_ttl, **kwargs
+        )
+
+    def get_circuit_breaker(self) -> CircuitBreaker:
+        with _circuit_breaker_lock:
+            if not hasattr(self, "_circuit_breaker"):
+                self._circuit_breaker = CircuitBreaker(
+                    block_threshold=self.block_threshold
+                )
+        return self._circuit_breaker
+
+    def is_guarded_url(self, url: str) -> bool:
+        """
+        Whether requests to the url count towards the circuit breaker. Only pages
+        are counted, i.e. the index and the articles, not images and other assets
+        that may be served from a CDN.
+
+        :param url:
+        :return:
+        """
+        if not self.use_circuit_breaker or is_asset_url(url):
+            return False
+        host = (urlsplit(url).hostname or "").lower()
+        if not host:
+            return False
+        if self.circuit_breaker_domains:
+            return any(
+                host == domain or host.endswith(f".{domain}")
+                for domain in self.circuit_breaker_domains
+            )
+        feeds = getattr(self, "feed_objects", None)
+        if not feeds:
+            # still building the index
+            return True
+        with _circuit_breaker_lock:
+            if not hasattr(self, "_article_hosts"):
+                self._article_hosts = {
+                    (urlsplit(a.url or "").hostname or "").lower()
+                    for f in feeds
+                    for a in f.articles
+                }
+        return host in self._article_hosts
+
+    def on_host_blocked(self, host: str, url: str) -> None:
+        """
+        Called once when a host is detected to be blocking the recipe.
+        Further requests to the host fail fast with HostUnavailableError.
+        Override to degrade differently, e.g. switch to another source.
+
+        :param host:
+        :param url:
+        :return:
+        """
+        err_msg = f"Blocked by {host}: {url}"
+        self.log.warning(err_msg)  # type: ignore[attr-defined]
+        if self.abort_on_block:
+            self.abort_recipe_processing(err_msg)  # type: ignore[attr-defined]
+
+    def guard_requests(self, open_func: Callable, host: str) -> Callable:
+        """
+        Wrap open_func so that its responses are classified by the circuit breaker
+        if use_circuit_breaker is set, for the urls from is_guarded_url().
+        A throttled request is retried once after its Retry-After.
+
+        :param open_func: e.g. br.open_novisit
+        :param host:
+        :return:
+        """
+        breaker = self.get_circuit_breaker()
+
+        def guarded_open(*args, **kwargs):
+            url = get_request_url(args[0])
+            if not self.is_guarded_url(url):
+                return open_func(*args, **kwargs)
+            retried = False
+            while True:
+                try:
+                    breaker.before_request(host)
+                except HostUnavailableError as err:
+                    if self.abort_on_block and breaker.is_blocked(host):
+                        self.abort_recipe_processing(str(err))  # type: ignore[attr-defined]
+                    raise
+                try:
+                    res = open_func(*args, **kwargs)
+                except Exception as err:
+                    verdict = classify_error(err, self.blocked_url_re)
+                    if not verdict:
+                        raise
+                    if breaker.record(host, verdict):
+                        self.on_host_blocked(host, url)
+                    if (
+                        verdict.kind == RESPONSE_THROTTLED
+                        and not retried
+                        and 0 < verdict.retry_after <= breaker.max_retry_after
+                    ):
+                        retried = True
+                        continue
+                    raise
+
+                verdict = classify_response(
+                    res.getcode() or 200, res.info(), res.geturl(), self.blocked_url_re
+                )
+                if breaker.record(host, verdict):
+                    self.on_host_blocked(host, url)
+                if verdict.kind == RESPONSE_BLOCKED:
+                    # e.g. redirected to a challenge page
+                    res.close()
+                    raise HTTPError(url, 403, "Blocked", res.info(), None)
+                return res
+
+        return guarded_open
+
+    def set_article_marker(self, url: str, marker: str, store_url: str = "") -> None:
+        """
+        Record an update marker for an article so that it is reused from the
+        article store until the marker changes, e.g. the post's modified date
+
+        :param url: the article url as returned by parse_index()
+        :param marker:
+        :param store_url: the article's permanent url if url is not, e.g. a temp file
+        :return:
+        """
+        if not hasattr(self, "_article_markers"):
+            self._article_markers: Dict[str, Tuple[str, str]] = {}
+        self._article_markers[url] = (store_url or url, marker)
+
+    def fetch_article(self, url, dir, f, a, num_of_feeds):
+        article_store = get_article_store() if self.use_article_store else None
+        store_url, marker = getattr(self, "_article_markers", {}).get(url, ("", ""))
+        if not (article_store and marker):
+            return super().fetch_article(url, dir, f, a, num_of_feeds)
+        # recipes process the same url differently
+        marker = f"{type(self).__name__}:{marker}"
+
+        html_path = article_store.get(store_url, marker, dir)
+        if html_path:
+            self.log.debug(f"Restored from article store: {store_url}")  # type: ignore[attr-defined]
+            self.populate_restored_article(html_path, f, a)
+            return html_path, [html_path], []
+        res, paths, failures = super().fetch_article(url, dir, f, a, num_of_feeds)
+        if not failures:
+            try:
+                article_store.put(store_url, marker, dir, res)
+            except OSError as err:
+                self.log.warning(f"Unable to store {store_url}: {err}")  # type: ignore[attr-defined]
+        return res, paths, failures
+
+    def populate_restored_article(self, html_path: str, f: int, a: int) -> None:
+        """
+        Call populate_article_metadata() for an article restored from the article
+        store, which calibre only does when it processes a fetched article,
+        e.g. so that the WP recipes replace the api url with the og link
+
+        :param html_path: the restored article html
+        :param f: feed index
+        :param a: article index
+        :return:
+        """
+        try:
+            article = self.feed_objects[f].articles[a]  # type: ignore[attr-defined]
+        except (AttributeError, IndexError):
+            self.log.warning(f"Unable to find the article for {html_path}")  # type: ignore[attr-defined]
+            return
+        with open(html_path, "r", encoding="utf-8") as html_f:
+            soup = BeautifulSoup(html_f.read())
+        self.populate_article_metadata(article, soup, True)  # type: ignore[attr-defined]
+
+    def get_rate_limit(self, url: str) -> Optional[RateLimit]:
+        """
+        Rate limit for a url. Override for limits that don't depend on the host only.
+
+        :param url:
+        :return:
+        """
+        domain_parts = (urlsplit(url).hostname or "").split(".")
+        for i in range(len(domain_parts)):
+            domain = ".".join(domain_parts[i:])
+            if domain in self.rate_limits:
+                return self.rate_limits[domain]
+        return self.default_rate_limit
+
+    def throttle(self, url_or_request):
+        """
+        Context manager that waits until a request to the url is allowed
+        by the rate limit for its host, e.g.::
+
+            with self.throttle(url):
+                return br.open_novisit(url)
+
+        :param url_or_request:
+        :return:
+        """
+        url = get_request_url(url_or_request)
+        rate_limit = self.get_rate_limit(url)
+        if not rate_limit:
+            return nullcontext()
+        return rate_limiter.limit(urlsplit(url).hostname or "", rate_limit)
+
     def cleanup(self) -> None:
         if self.temp_dir:
             self.log("Deleting temp files...")  # type: ignore[attr-defined]
             shutil.rmtree(self.temp_dir)
 
-    def get_ld_json(self, soup: BeautifulSoup, filter_fn: Callable, attrs=None) -> Dict:
+    def get_ld_json(
+        self, soup: Union[BeautifulSoup, str], filter_fn: Callable, attrs=None
+    ) -> Dict:
         """
-        Get the script element containing the LD-JSON content
+        Get the script element containing the LD-JSON content.
+        Pass the raw html instead of a soup to skip parsing the whole page.
 
-        :param soup:
+        :param soup: soup or raw html
         :param filter_fn:
         :param attrs:
         :return:
         """
+        if isinstance(soup, str):
+            return embedded_json.get_ld_json(soup, filter_fn, attrs) or {}
         if attrs is None:
             attrs = {"type": "application/ld+json"}
         for script_json in soup.find_all("script", attrs=attrs):
             if not script_json.contents:
                 continue
-            data = json.loads(script_json.contents[0])
+            data = embedded_json.decode_json(script_json.contents[0])
             if filter_fn(data):
                 return data
         return {}
 
     def get_script_json(
-        self, soup: BeautifulSoup, prefix_expr: str, attrs=None
+        self, soup: Union[BeautifulSoup, str], prefix_expr: str, attrs=None
     ) -> Dict:
         """
-        Converts a script element's json content into a dict object
+        Converts a script element's json content into a dict object.
+        Pass the raw html instead of a soup to skip parsing the whole page.
 
-        :param soup:
+        :param soup: soup or raw html
         :param prefix_expr:
         :param attrs:
         :return:
         """
+
+        def on_error(err: Exception, script_js: str) -> None:
+            self.log.exception("Unable to parse script as json")  # type: ignore[attr-defined]
+            self.log.debug(script_js)  # type: ignore[attr-defined]
+
+        if isinstance(soup, str):
+            return (
+                embedded_json.get_script_json(soup, prefix_expr, attrs, on_error) or {}
+            )
         if attrs is None:
             attrs = {"src": False}
-        prefix_expr_re = re.compile(prefix_expr) if prefix_expr else None
         for script in soup.find_all("script", attrs):
             if not script.contents:
                 continue
-            script_js = script.contents[0].strip()
-            if prefix_expr and not prefix_expr_re.match(script_js):
-                continue
-            if prefix_expr:
-                script_js = prefix_expr_re.sub("", script_js)
-            if script_js.endswith(";"):
-                script_js = script_js[:-1]
-            script_js = script_js.replace(":undefined", ":null")
             try:
-                return json.loads(script_js)
-            except json.JSONDecodeError:
-                # sometimes this borks because of a stray '\n', e.g. scmp
-                try:
-                    return json.loads(script_js.replace("\n", " "))
-                except json.JSONDecodeError:
-                    self.log.exception("Unable to parse script as json")
-                    self.log.debug(script.contents[0])
+                data = embedded_json.decode_script(script.contents[0], prefix_expr)
+            except json.JSONDecodeError as err:
+                on_error(err, script.contents[0])
+                continue
+            if data is not None:
+                return data
         return {}
 
     def extract_from_img_srcset(self, srcset: str, max_width=0):
@@ -289,6 +834,250 @@ class BasicNewsrackRecipe(object):
         return new_feeds
 
 
+GOOGLEBOT_USER_AGENT = (
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)"
+)
+DEFAULT_USER_AGENT = random_user_agent(allow_ie=False)
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 10
+MAX_IDLE_CONNECTIONS_PER_HOST = 8
+DNS_CACHE_TTL = 5 * 60
+# safe to send again if a reused connection fails, the server may have acted on the first one
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class PooledHTTPConnection(http.client.HTTPConnection):
+    """Connects with the dns results cached by the pool"""
+
+    pool: Optional["ConnectionPool"] = None
+
+    def connect(self):
+        if not self.pool:
+            return super().connect()
+        self.sock = self.pool.connect(
+            self.host, self.port, self.timeout, self.source_address
+        )
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class PooledHTTPSConnection(http.client.HTTPSConnection, PooledHTTPConnection):
+    # HTTPSConnection.connect() wraps the socket from PooledHTTPConnection.connect()
+    pass
+
+
+class ConnectionPool(object):
+    """
+    Keep-alive connections by host, shared by calibre's download threads.
+    A connection is only used by one request at a time.
+    """
+
+    def __init__(self, max_idle_per_host: int = MAX_IDLE_CONNECTIONS_PER_HOST):
+        self.max_idle_per_host = max_idle_per_host
+        self.lock = threading.Lock()
+        self.idle: Dict[Tuple[str, str, int], List[http.client.HTTPConnection]] = {}
+        self.dns_cache: Dict[Tuple[str, int], Tuple[float, List]] = {}
+        self.ssl_context = ssl.create_default_context()
+
+    def resolve(self, host: str, port: int) -> List:
+        now = time.monotonic()
+        with self.lock:
+            expires, addresses = self.dns_cache.get((host, port), (0, []))
+        if expires > now:
+            return addresses
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        with self.lock:
+            self.dns_cache[(host, port)] = (now + DNS_CACHE_TTL, addresses)
+        return addresses
+
+    def connect(self, host: str, port: int, timeout, source_address=None):
+        last_err: Optional[OSError] = None
+        for *_, sockaddr in self.resolve(host, port):
+            try:
+                return socket.create_connection(sockaddr[:2], timeout, source_address)
+            except OSError as err:
+                last_err = err
+        raise last_err or OSError(f"Unable to resolve {host}")
+
+    def _acquire(
+        self, key: Tuple[str, str, int], timeout
+    ) -> Tuple[http.client.HTTPConnection, bool]:
+        with self.lock:
+            idle = self.idle.get(key)
+            conn = idle.pop() if idle else None
+        if conn:
+            conn.timeout = timeout
+            if conn.sock:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        scheme, host, port = key
+        new_conn: PooledHTTPConnection
+        if scheme == "https":
+            new_conn = PooledHTTPSConnection(
+                host, port, timeout=timeout, context=self.ssl_context
+            )
+        else:
+            new_conn = PooledHTTPConnection(host, port, timeout=timeout)
+        new_conn.pool = self
+        return new_conn, False
+
+    def _release(
+        self, key: Tuple[str, str, int], conn: http.client.HTTPConnection
+    ) -> None:
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def request(
+        self, method: str, url: str, headers: Dict[str, str], body=None, timeout=None
+    ) -> Tuple[int, str, http.client.HTTPMessage, bytes]:
+        """
+        Send a request on a pooled connection
+
+        :param method:
+        :param url:
+        :param headers:
+        :param body:
+        :param timeout:
+        :return: status code, reason, headers, body
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported url: {url}")
+        key = (
+            scheme,
+            parts.hostname or "",
+            parts.port or (443 if scheme == "https" else 80),
+        )
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        while True:
+            conn, reused = self._acquire(key, timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                res = conn.getresponse()
+                data = res.read()
+            except (ConnectionError, http.client.BadStatusLine):
+                conn.close()
+                if reused and method.upper() in IDEMPOTENT_METHODS:
+                    # the server closed the idle connection, retry on a new one
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            if res.will_close:
+                conn.close()
+            else:
+                self._release(key, conn)
+            return res.status, res.reason, res.headers, data
+
+
+connection_pool = ConnectionPool()
+
+
+def decode_content(headers: http.client.HTTPMessage, body: bytes) -> bytes:
+    content_encoding = (headers.get("Content-Encoding") or "").strip().lower()
+    if not content_encoding or content_encoding == "identity":
+        return body
+    if content_encoding in ("gzip", "x-gzip"):
+        body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    elif content_encoding == "deflate":
+        try:
+            body = zlib.decompress(body)
+        except zlib.error:
+            body = zlib.decompress(body, -zlib.MAX_WBITS)  # raw deflate
+    elif content_encoding == "br" and brotli:
+        body = brotli.decompress(body)
+    else:
+        return body
+    del headers["Content-Encoding"]
+    return body
+
+
+class CookielessOpener(object):
+    """
+    Drop-in for the subset of calibre's browser used by the recipes, i.e.
+    ``open_novisit()``, ``addheaders`` and ``set_handle_redirect()``.
+    Requests are sent without cookies over the shared connection pool,
+    with gzip/brotli compression negotiated.
+    """
+
+    def __init__(
+        self,
+        addheaders: Optional[List[Tuple[str, str]]] = None,
+        handle_redirect: bool = True,
+        pool: ConnectionPool = connection_pool,
+    ):
+        self.addheaders = (
+            list(addheaders)
+            if addheaders is not None
+            else [("User-agent", DEFAULT_USER_AGENT)]
+        )
+        self.handle_redirect = handle_redirect
+        self.pool = pool
+
+    def set_handle_redirect(self, handle: bool) -> None:
+        self.handle_redirect = handle
+
+    def set_handle_gzip(self, handle: bool) -> None:
+        # compressed responses are always accepted and decoded
+        pass
+
+    def open_novisit(self, url_or_request, data=None, timeout=None):
+        if getproxies():
+            # calibre's browser handles the proxy settings
+            br = browser()
+            br.addheaders = self.addheaders
+            br.set_handle_redirect(self.handle_redirect)
+            br.set_handle_gzip(True)
+            return br.open_novisit(url_or_request, data=data, timeout=timeout)
+
+        headers = {k.lower(): (k, v) for k, v in self.addheaders}
+        url = get_request_url(url_or_request)
+        if url is not url_or_request:
+            # a mechanize/urllib Request
+            headers.update(
+                {k.lower(): (k, v) for k, v in url_or_request.header_items()}
+            )
+            data = data if data is not None else getattr(url_or_request, "data", None)
+            method = url_or_request.get_method()
+        else:
+            method = "POST" if data is not None else "GET"
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if "accept-encoding" not in headers:
+            headers["accept-encoding"] = (
+                "Accept-Encoding",
+                "gzip, deflate, br" if brotli else "gzip, deflate",
+            )
+        if timeout is None or not isinstance(timeout, (int, float)):
+            timeout = socket.getdefaulttimeout()
+
+        for _ in range(MAX_REDIRECTS + 1):
+            code, msg, res_headers, body = self.pool.request(
+                method, url, dict(headers.values()), data, timeout
+            )
+            body = decode_content(res_headers, body)
+            if code in REDIRECT_CODES and self.handle_redirect:
+                location = res_headers.get("Location")
+                if location:
+                    url = urljoin(url, location)
+                    if code == 303 or (code in (301, 302) and method == "POST"):
+                        method, data = "GET", None
+                        headers.pop("content-type", None)
+                        headers.pop("content-length", None)
+                    continue
+            if code >= 300:
+                raise HTTPError(url, code, msg, res_headers, BytesIO(body))
+            return BufferedResponse(url, code, msg, res_headers, body)
+        raise HTTPError(url, code, "Too many redirects", res_headers, BytesIO(body))
+
+    open = open_novisit
+
+
 class BasicCookielessNewsrackRecipe(BasicNewsrackRecipe):
     """
     The basic recipe extended to not send cookies. This is meant for news
@@ -304,26 +1093,48 @@ class BasicCookielessNewsrackRecipe(BasicNewsrackRecipe):
         return self.get_browser()
 
     def open_novisit(self, *args, **kwargs):
-        br = browser()
+        br = CookielessOpener()
         if self.request_as_gbot:
             br.addheaders = [
-                (
-                    "User-agent",
-                    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
-                ),
+                ("User-agent", GOOGLEBOT_USER_AGENT),
                 ("Referer", "https://www.google.com/"),
                 ("X-Forwarded-For", "66.249.66.1"),
             ]
-        br.set_handle_gzip(True)
-        return br.open_novisit(*args, **kwargs)
+
+        def throttled_open(*a, **kw):
+            with self.throttle(a[0]):
+                return br.open_novisit(*a, **kw)
+
+        return self.open_url(throttled_open, *args, **kwargs)
 
     open = open_novisit
 
 
+# post fields used by WordPressNewsrackRecipe.get_articles() and the WP recipes
+WP_LEAN_FIELDS = [
+    "id",
+    "date",
+    "modified_gmt",
+    "link",
+    "title",
+    "excerpt",
+    "content",
+    "featured_media",
+    "categories",
+    "tags",
+]
+
+
 class WordPressNewsrackRecipe(BasicNewsrackRecipe):
     use_embedded_content = False
     auto_cleanup = False  # don't clean up because it messes up the embed code and sometimes ruins the og-link logic
     is_wordpresscom = False
+    wp_concurrent_pages = 4  # max pages of posts requested concurrently
+    # lean fetch profile: request only these post fields, e.g. WP_LEAN_FIELDS,
+    # empty for the full post objects
+    wp_fields: List[str] = []
+    # request only these embedded resources, e.g. ["author", "wp:term"], empty for all
+    wp_embeds: List[str] = []
 
     @staticmethod
     def parse_datetime(date_string, wordpresscom=False) -> datetime:
@@ -391,11 +1202,55 @@ class WordPressNewsrackRecipe(BasicNewsrackRecipe):
         if og_link:
             article.url = og_link["data-og-link"]
 
+    def _get_posts_page(
+        self, feed_url: str, params: Dict, br: Browser
+    ) -> Tuple[List, int]:
+        """
+        Get a page of posts from WP
+
+        :param feed_url: WP posts endpoint
+        :param params:
+        :param br: browser instance
+        :return: posts, total number of pages (0 if unknown)
+        """
+        endpoint = f"{feed_url}?{urlencode(params)}"
+        self.log.debug(f"Fetching {endpoint} ...")  # type: ignore[attr-defined]
+        res = br.open_novisit(endpoint, timeout=self.timeout)
+        posts_json_raw_bytes = res.read()
+        posts_json: Dict = {}
+        try:
+            # utf-8-sig also decodes responses with a BOM, which some sites send
+            posts_json_raw = posts_json_raw_bytes.decode("utf-8-sig")
+            if self.is_wordpresscom:
+                posts_json = json.loads(posts_json_raw)
+                retrieved_posts = posts_json.get("posts", [])
+            else:
+                retrieved_posts = json.loads(posts_json_raw)
+        except json.decoder.JSONDecodeError as json_err:
+            self.log.warning(f"Error decoding json: {json_err}")  # type: ignore[attr-defined]
+            raise
+
+        total_pages = 0
+        try:
+            headers = res.info()
+            if headers.get("x-wp-totalpages"):
+                total_pages = int(headers["x-wp-totalpages"])
+            elif self.is_wordpresscom and posts_json.get("found"):
+                per_page = int(params.get("number") or 20)
+                total_pages = -(-int(posts_json["found"]) // per_page)
+        except:  # noqa: E722
+            # can't parse headers for page info
+            # rely on HTTP 400 to detect paging break
+            pass
+        return retrieved_posts, total_pages
+
     def get_posts(
         self, feed_url: str, oldest_article: int, custom_params: Dict, br: Browser
     ) -> list:
         """
-        Get posts from WP
+        Get posts from WP. Once the first page reports the total number of pages,
+        the remaining pages are fetched concurrently.
+
         :param feed_url: WP posts endpoint
         :param oldest_article: in days
         :param custom_params: overwrite default params
@@ -403,8 +1258,7 @@ class WordPressNewsrackRecipe(BasicNewsrackRecipe):
         :return:
         """
         per_page = 100
-        page = 1
-        posts = []
+        posts: List = []
 
         cutoff_date = datetime.today().replace(
             hour=0, minute=0, second=0, microsecond=0
@@ -413,7 +1267,7 @@ class WordPressNewsrackRecipe(BasicNewsrackRecipe):
         if not custom_params:
             custom_params = {}
 
-        while True:
+        def get_params(page: int) -> Dict:
             if self.is_wordpresscom:
                 params = {
                     "page": page,
@@ -426,57 +1280,62 @@ class WordPressNewsrackRecipe(BasicNewsrackRecipe):
                     "page": page,
                     "per_page": per_page,
                     "after": cutoff_date.isoformat(),
-                    "_embed": "1",
+                    "_embed": ",".join(self.wp_embeds) or "1",
                     "_": int(time.time() * 1000),
                 }
             params.update(custom_params)
             # clear out None values to allow custom_params to unset default params
             for k in [k for k in params.keys() if params[k] is None]:
                 del params[k]
-
-            endpoint = f"{feed_url}?{urlencode(params)}"
-            self.log.debug(f"Fetching {endpoint} ...")  # type: ignore[attr-defined]
-            retrieved_posts = []
+            if self.wp_fields:
+                if self.is_wordpresscom:
+                    params.setdefault("fields", ",".join(self.wp_fields))
+                elif "_fields" not in params:
+                    fields = list(self.wp_fields)
+                    if "_embed" in params:
+                        # required for the embedded resources
+                        fields.extend(["_links", "_embedded"])
+                    params["_fields"] = ",".join(fields)
+            return params
+
+        def get_page(page: int) -> Tuple[List, int]:
+            # calibre's browser is not thread-safe
+            page_br = (
+                br.clone_browser() if page > 1 and hasattr(br, "clone_browser") else br
+            )
             try:
-                res = br.open_novisit(endpoint, timeout=self.timeout)
-                posts_json_raw_bytes = res.read()
-                encodings = ["utf-8", "utf-8-sig"]
-                for i, encoding in enumerate(encodings, start=1):
-                    try:
-                        posts_json_raw = posts_json_raw_bytes.decode(encoding)
-                        if self.is_wordpresscom:
-                            retrieved_posts = json.loads(posts_json_raw).get(
-                                "posts", []
-                            )
-                        else:
-                            retrieved_posts = json.loads(posts_json_raw)
-                        break
-                    except json.decoder.JSONDecodeError as json_err:
-                        self.log.warning(f"Error decoding json: {json_err}")
-                        if i < len(encodings):
-                            continue
-                        raise
-
-                if not retrieved_posts:
-                    break
-                posts.extend(retrieved_posts)
-                try:
-                    # abort early to save one extra request
-                    headers = res.info()
-                    if headers.get("x-wp-totalpages"):
-                        wp_totalpages = int(headers["x-wp-totalpages"])
-                        if wp_totalpages == page:
-                            break
-                except:
-                    # do nothing else if we can't parse headers for page info
-                    # rely on HTTP 400 to detect paging break
-                    pass
-                page += 1
+                return self._get_posts_page(feed_url, get_params(page), page_br)
             except json.decoder.JSONDecodeError:
                 raise
             except Exception as err:  # HTTP 400
-                self.log.warning(f"Error encountered while fetching posts: {err}")
+                self.log.warning(  # type: ignore[attr-defined]
+                    f"Error encountered while fetching posts: {err}"
+                )
+                return [], 0
+
+        page = 1
+        while True:
+            retrieved_posts, total_pages = get_page(page)
+            if not retrieved_posts:
+                break
+            posts.extend(retrieved_posts)
+            if total_pages:
+                # abort early to save one extra request
+                if total_pages > page:
+                    with ThreadPoolExecutor(
+                        max_workers=min(
+                            total_pages - page, max(1, self.wp_concurrent_pages)
+                        )
+                    ) as executor:
+                        for retrieved_posts, _ in executor.map(
+                            get_page, range(page + 1, total_pages + 1)
+                        ):
+                            if not retrieved_posts:
+                                # same as the sequential paging break
+                                break
+                            posts.extend(retrieved_posts)
                 break
+            page += 1
 
         return posts
 
@@ -504,7 +1363,6 @@ class WordPressNewsrackRecipe(BasicNewsrackRecipe):
         """
         posts = self.get_posts(feed_url, oldest_article, custom_params, br)
 
-        self.temp_dir = PersistentTemporaryDirectory()
         latest_post_date = None
         for p in posts:
             if self.is_wordpresscom:
@@ -532,25 +1390,25 @@ class WordPressNewsrackRecipe(BasicNewsrackRecipe):
             else:
                 section_name = feed_name
 
-            with PersistentTemporaryFile(suffix=".json", dir=self.temp_dir) as f:
-                f.write(json.dumps(p).encode("utf-8"))
-                articles.setdefault(section_name, []).append(
-                    {
-                        "title": BeautifulSoup(
-                            unescape(
-                                p["title"]
-                                if self.is_wordpresscom
-                                else p["title"]["rendered"]
-                            )
-                        ).get_text()
-                        or "Untitled",
-                        "url": "file://" + f.name,
-                        "date": f"{post_date:{get_date_format()}}",
-                        "description": unescape(
-                            p["excerpt"]
-                            if self.is_wordpresscom
-                            else p["excerpt"]["rendered"]
-                        ),
-                    }
-                )
+            article_url = self.pack_article(json.dumps(p))
+            self.set_article_marker(
+                article_url,
+                p["modified"] if self.is_wordpresscom else p["modified_gmt"],
+                p.get("link") or p.get("URL") or "",
+            )
+            articles.setdefault(section_name, []).append(
+                {
+                    "title": html_to_text(
+                        p["title"] if self.is_wordpresscom else p["title"]["rendered"]
+                    )
+                    or "Untitled",
+                    "url": article_url,
+                    "date": f"{post_date:{get_date_format()}}",
+                    "description": unescape(
+                        p["excerpt"]
+                        if self.is_wordpresscom
+                        else p["excerpt"]["rendered"]
+                    ),
+                }
+            )
         return articles
@@ -9,7 +9,11 @@ import sys
 
 # custom include to share code between recipes
 sys.path.append(os.environ["recipes_includes"])
-from recipes_shared import WordPressNewsrackRecipe, get_datetime_format
+from recipes_shared import (
+    WP_LEAN_FIELDS,
+    WordPressNewsrackRecipe,
+    get_datetime_format,
+)
 
 from calibre.web.feeds.news import BasicNewsRecipe
 
@@ -32,6 +36,8 @@ class LitHub(WordPressNewsrackRecipe, BasicNewsRecipe):
     compress_news_images_auto_size = 10
 
     oldest_article = 7  # days
+    wp_fields = WP_LEAN_FIELDS
+    wp_embeds = ["author", "wp:term", "wp:featuredmedia"]
 
     remove_tags = [
         dict(name=["script", "noscript", "style"]),
@@ -156,8 +156,7 @@ class SCMP(BasicNewsrackRecipe, BasicNewsRecipe):
         ele.append(self.soup(child_html))
 
     def preprocess_raw_html(self, raw_html, url):
-        soup = self.soup(raw_html)
-        article = self.get_script_json(soup, r"window.__APOLLO_STATE__\s*=\s*")
+        article = self.get_script_json(raw_html, r"window.__APOLLO_STATE__\s*=\s*")
         if not article:
             if os.environ.get("recipe_debug_folder", ""):
                 recipe_folder = os.path.join(os.environ["recipe_debug_folder"], "scmp")
@@ -12,7 +12,6 @@ from datetime import timedelta, timezone
 sys.path.append(os.environ["recipes_includes"])
 from recipes_shared import BasicNewsrackRecipe, get_date_format
 
-from calibre.ptempfile import PersistentTemporaryDirectory, PersistentTemporaryFile
 from calibre.web.feeds.news import BasicNewsRecipe
 
 _name = "TIME"
@@ -109,10 +108,8 @@ class TimeMagazine(BasicNewsrackRecipe, BasicNewsRecipe):
         self.cover_url = issue.get("hero", {}).get("src", {}).get("large_2x")
         self.title = f'{_name}: {issue["title"]}'
         articles = []
-        self.temp_dir = PersistentTemporaryDirectory()
         for article in issue["articles"]:
-            with PersistentTemporaryFile(suffix=".json", dir=self.temp_dir) as f:
-                f.write(json.dumps(article).encode("utf-8"))
+            article_url = self.pack_article(json.dumps(article))
             description = article.get("excerpt") or ""
             section = article.get("section", {}).get("name", "")
             if section:
@@ -120,7 +117,7 @@ class TimeMagazine(BasicNewsrackRecipe, BasicNewsRecipe):
             articles.append(
                 {
                     "title": article["friendly_title"],
-                    "url": "file://" + f.name,
+                    "url": article_url,
                     "description": description,
                 }
             )
@@ -179,8 +179,7 @@ class TheWashingtonPostPrint(BasicNewsrackRecipe, BasicNewsRecipe):
                 self.log.debug(json.dumps(c))
 
     def preprocess_raw_html(self, raw_html, url):
-        soup = self.soup(raw_html)
-        data = self.get_script_json(soup, "", {"id": "__NEXT_DATA__", "src": False})
+        data = self.get_script_json(raw_html, "", {"id": "__NEXT_DATA__", "src": False})
         content = data.get("props", {}).get("pageProps", {}).get("globalContent", {})
         if not content:
             # E.g. interactive articles
@@ -194,8 +194,7 @@ class TheWashingtonPost(BasicNewsrackRecipe, BasicNewsRecipe):
             self.log.warning(err_msg)
             self.abort_article(err_msg)
 
-        soup = self.soup(raw_html)
-        data = self.get_script_json(soup, "", {"id": "__NEXT_DATA__", "src": False})
+        data = self.get_script_json(raw_html, "", {"id": "__NEXT_DATA__", "src": False})
         content = data.get("props", {}).get("pageProps", {}).get("globalContent", {})
         if not content:
             # E.g. interactive articles
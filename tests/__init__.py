@@ -1,2 +1,14 @@
 # flake8: noqa
 from .tests_recipe_utils import RecipeUtilsTests
+from .tests_ebook_meta import EbookMetaTests
+from .tests_calibre_worker import CalibreWorkerTests
+from .tests_history import HistoryTests
+from .tests_budget import BudgetTests
+from .tests_artifact_cache import ArtifactCacheTests
+from .tests_publish import PublishTests
+from .tests_http_cache import HttpCacheTests
+from .tests_article_store import ArticleStoreTests
+from .tests_block_detector import BlockDetectorTests
+from .tests_embedded_json import EmbeddedJsonTests
+from .tests_generate import GenerateTests
+from .tests_recipes_shared import RecipesSharedTests
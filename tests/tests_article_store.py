@@ -0,0 +1,64 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.joinpath("recipes", "includes")))
+from article_store import ArticleStore  # noqa: E402
+
+
+class ArticleStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = ArticleStore(os.path.join(self.temp_dir.name, "store"))
+        self.url = "https://example.com/2023/01/article/"
+        self.article_dir = Path(self.temp_dir.name, "article_0")
+        self.article_dir.joinpath("images").mkdir(parents=True)
+        self.html_path = self.article_dir.joinpath("index.html")
+        self.html_path.write_text(
+            '<html><body><img src="images/img1.jpg"></body></html>', encoding="utf-8"
+        )
+        self.article_dir.joinpath("images", "img1.jpg").write_bytes(b"jpeg")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_put_get(self):
+        marker = "2023-01-01T00:00:00"
+        self.assertTrue(
+            self.store.put(self.url, marker, str(self.article_dir), str(self.html_path))
+        )
+        dest_dir = Path(self.temp_dir.name, "article_1")
+        dest_dir.mkdir()
+        html_path = self.store.get(self.url, marker, str(dest_dir))
+        self.assertEqual(html_path, str(dest_dir.joinpath("index.html")))
+        self.assertEqual(Path(html_path).read_text(), self.html_path.read_text())
+        self.assertEqual(dest_dir.joinpath("images", "img1.jpg").read_bytes(), b"jpeg")
+        self.assertEqual(sorted(os.listdir(dest_dir)), ["images", "index.html"])
+
+        # an updated article is not reused
+        self.assertIsNone(
+            self.store.get(self.url, "2023-01-02T00:00:00", str(dest_dir))
+        )
+
+    def test_external_references(self):
+        self.html_path.write_text(
+            '<html><body><img src="../article_1/images/img1.jpg"></body></html>',
+            encoding="utf-8",
+        )
+        self.assertFalse(
+            self.store.put(self.url, "1", str(self.article_dir), str(self.html_path))
+        )
+        self.assertIsNone(self.store.get(self.url, "1", self.temp_dir.name))
+
+    def test_prune(self):
+        self.store.put(self.url, "1", str(self.article_dir), str(self.html_path))
+        self.store.put(self.url, "2", str(self.article_dir), str(self.html_path))
+        old_path = self.store._path(self.url, "1")
+        old_time = time.time() - self.store.max_age - 60
+        os.utime(old_path, (old_time, old_time))
+        self.assertEqual(self.store.prune(), 1)
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(self.store._path(self.url, "2")))
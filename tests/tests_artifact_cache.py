@@ -0,0 +1,128 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import _artifact_cache
+from _artifact_cache import ArtifactCache, file_sha256
+
+
+class ArtifactCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.folder = Path(self.temp_dir.name)
+        self.cache = ArtifactCache(self.folder.joinpath("cache"))
+        self.url = "https://example.com/example-2026-10-17.epub"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_store_restore(self):
+        self.assertIsNone(self.cache.lookup(self.url))
+        self.assertEqual(self.cache.conditional_headers(self.url), {})
+        self.assertFalse(self.cache.restore(self.url, self.folder.joinpath("x")))
+
+        downloaded = self.folder.joinpath("example-2026-10-17.epub")
+        downloaded.write_bytes(b"example")
+        object_path = self.cache.store(
+            self.url,
+            downloaded,
+            {"ETag": '"abc"', "Last-Modified": "Sat, 17 Oct 2026 00:00:00 GMT"},
+        )
+        self.assertEqual(object_path.name, file_sha256(downloaded))
+        self.assertEqual(self.cache.lookup(self.url), object_path)
+        self.assertEqual(
+            self.cache.conditional_headers(self.url),
+            {
+                "If-None-Match": '"abc"',
+                "If-Modified-Since": "Sat, 17 Oct 2026 00:00:00 GMT",
+            },
+        )
+
+        # entries are persisted
+        cache = ArtifactCache(self.folder.joinpath("cache"))
+        restored = self.folder.joinpath("restored.epub")
+        self.assertTrue(cache.restore(self.url, restored))
+        self.assertEqual(restored.read_bytes(), b"example")
+        # cached copies are read-only
+        self.assertEqual(object_path.stat().st_mode & 0o222, 0)
+
+    def test_store_content(self):
+        index_url = "https://example.com/index.json"
+        object_path = self.cache.store_content(index_url, b"{}", {})
+        self.assertEqual(object_path.read_bytes(), b"{}")
+        self.assertEqual(self.cache.conditional_headers(index_url), {})
+        self.assertEqual(list(self.folder.joinpath("cache").glob("*.download")), [])
+
+    def test_prune(self):
+        downloaded = self.folder.joinpath("example.epub")
+        downloaded.write_bytes(b"example")
+        object_path = self.cache.store(self.url, downloaded, {})
+        self.cache.prune()
+        self.assertTrue(object_path.exists())
+        self.cache.entries[self.url]["accessed"] = time.time() - 30 * 24 * 60 * 60
+        self.cache.prune()
+        self.assertFalse(object_path.exists())
+        self.assertIsNone(self.cache.lookup(self.url))
+
+    def test_no_temp_files(self):
+        downloaded = self.folder.joinpath("example.epub")
+        downloaded.write_bytes(b"example")
+        self.cache.store(self.url, downloaded, {})
+        self.cache.store(self.url, downloaded, {})
+        self.cache.restore(self.url, downloaded)
+        self.assertEqual(list(self.folder.rglob("*.tmp")), [])
+
+    def test_discard(self):
+        downloaded = self.folder.joinpath("example.epub")
+        downloaded.write_bytes(b"example")
+        self.cache.store(self.url, downloaded, {"ETag": '"abc"'})
+        self.cache.discard(self.url)
+        self.assertIsNone(self.cache.lookup(self.url))
+        self.assertEqual(self.cache.conditional_headers(self.url), {})
+        self.assertNotIn(self.url, ArtifactCache(self.folder.joinpath("cache")).entries)
+
+    def test_restored_files(self):
+        downloaded = self.folder.joinpath("example.epub")
+        downloaded.write_bytes(b"example")
+        object_path = self.cache.store(self.url, downloaded, {})
+        restored = self.folder.joinpath("restored.epub")
+        for fcntl in (_artifact_cache.fcntl, None):
+            # also without reflink support, e.g. on ext4 or Windows
+            with mock.patch.object(_artifact_cache, "fcntl", fcntl):
+                self.assertTrue(self.cache.restore(self.url, restored))
+                self.assertEqual(restored.read_bytes(), b"example")
+                # a book that is going to be updated in place is not a hardlink
+                self.assertTrue(self.cache.restore(self.url, restored, writable=True))
+            self.assertEqual(restored.stat().st_nlink, 1)
+            for file_path in (downloaded, restored):
+                with file_path.open("r+b") as f:
+                    f.write(b"updated")
+                self.assertEqual(file_path.read_bytes(), b"updated")
+            self.assertEqual(object_path.read_bytes(), b"example")
+            downloaded.write_bytes(b"example")
+
+        with mock.patch.object(_artifact_cache, "fcntl", None):
+            self.cache.restore(self.url, restored)
+        # linked instead of copied
+        self.assertTrue(os.path.samefile(restored, object_path))
+
+    def test_restore_saves_entries_once(self):
+        downloaded = self.folder.joinpath("example.epub")
+        downloaded.write_bytes(b"example")
+        self.cache.store(self.url, downloaded, {})
+        with mock.patch.object(self.cache, "_save") as save:
+            for _ in range(3):
+                self.cache.restore(self.url, self.folder.joinpath("restored.epub"))
+            save.assert_not_called()
+        accessed = self.cache.entries[self.url]["accessed"]
+        self.cache.save()
+        self.assertEqual(
+            ArtifactCache(self.folder.joinpath("cache")).entries[self.url]["accessed"],
+            accessed,
+        )
+        with mock.patch.object(self.cache, "_save") as save:
+            self.cache.save()
+            save.assert_not_called()
@@ -0,0 +1,120 @@
+import re
+import socket
+import sys
+import time
+import unittest
+from pathlib import Path
+from urllib.error import HTTPError, URLError
+
+sys.path.append(str(Path(__file__).parent.parent.joinpath("recipes", "includes")))
+from block_detector import (  # noqa: E402
+    RESPONSE_BLOCKED,
+    RESPONSE_OK,
+    RESPONSE_THROTTLED,
+    RESPONSE_TRANSIENT,
+    CircuitBreaker,
+    HostUnavailableError,
+    ResponseVerdict,
+    classify_error,
+    classify_response,
+    is_asset_url,
+)
+from .utils import make_headers  # noqa: E402
+
+
+class BlockDetectorTests(unittest.TestCase):
+    def test_classify_response(self):
+        self.assertEqual(classify_response(200).kind, RESPONSE_OK)
+        self.assertEqual(classify_response(403).kind, RESPONSE_BLOCKED)
+        self.assertEqual(
+            classify_response(429, make_headers(Retry_After="5")),
+            ResponseVerdict(RESPONSE_THROTTLED, 5),
+        )
+        self.assertEqual(classify_response(503).kind, RESPONSE_TRANSIENT)
+        self.assertEqual(
+            classify_response(503, make_headers(Retry_After="5")).kind,
+            RESPONSE_THROTTLED,
+        )
+        self.assertEqual(
+            classify_response(200, make_headers(cf_mitigated="challenge")).kind,
+            RESPONSE_BLOCKED,
+        )
+        blocked_url_re = re.compile(r"/tosv.*\.html")
+        self.assertEqual(
+            classify_response(
+                307, make_headers(Location="https://example.com/tosv2.html")
+            ).kind,
+            RESPONSE_OK,
+        )
+        self.assertEqual(
+            classify_response(
+                307,
+                make_headers(Location="https://example.com/tosv2.html"),
+                blocked_url_re=blocked_url_re,
+            ).kind,
+            RESPONSE_BLOCKED,
+        )
+
+    def test_classify_error(self):
+        url = "https://example.com/"
+        self.assertEqual(
+            classify_error(HTTPError(url, 403, "", make_headers(), None)).kind,
+            RESPONSE_BLOCKED,
+        )
+        self.assertIsNone(classify_error(HTTPError(url, 404, "", make_headers(), None)))
+        self.assertEqual(
+            classify_error(URLError(ConnectionRefusedError())).kind, RESPONSE_TRANSIENT
+        )
+        self.assertEqual(
+            classify_error(ConnectionResetError()).kind, RESPONSE_TRANSIENT
+        )
+        self.assertEqual(classify_error(socket.timeout()).kind, RESPONSE_TRANSIENT)
+        # not connection errors or timeouts
+        self.assertIsNone(classify_error(URLError(socket.gaierror())))
+        self.assertIsNone(classify_error(URLError("unknown url type")))
+        self.assertIsNone(classify_error(PermissionError()))
+        self.assertIsNone(classify_error(ValueError("not a request error")))
+
+    def test_asset_url(self):
+        self.assertTrue(is_asset_url("https://cdn.example.com/img/photo.JPG?w=600"))
+        self.assertTrue(is_asset_url("https://example.com/static/site.css"))
+        self.assertFalse(is_asset_url("https://example.com/2022/10/01/article"))
+        self.assertFalse(is_asset_url("https://example.com/article.html"))
+
+    def test_blocked(self):
+        breaker = CircuitBreaker(block_threshold=2)
+        blocked = ResponseVerdict(RESPONSE_BLOCKED)
+        self.assertFalse(breaker.record("a.com", blocked))
+        breaker.record("a.com", ResponseVerdict(RESPONSE_OK))  # resets
+        self.assertFalse(breaker.record("a.com", blocked))
+        self.assertTrue(breaker.record("a.com", blocked))
+        self.assertFalse(breaker.record("a.com", blocked))  # only reported once
+        with self.assertRaises(HostUnavailableError):
+            breaker.before_request("a.com")
+        breaker.before_request("b.com")
+
+    def test_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, cooldown=0.1)
+        transient = ResponseVerdict(RESPONSE_TRANSIENT)
+        breaker.record("a.com", transient)
+        breaker.before_request("a.com")
+        breaker.record("a.com", transient)
+        with self.assertRaises(HostUnavailableError):
+            breaker.before_request("a.com")
+        time.sleep(0.15)
+        breaker.before_request("a.com")
+        # fails again after one more failure
+        breaker.record("a.com", transient)
+        with self.assertRaises(HostUnavailableError):
+            breaker.before_request("a.com")
+
+    def test_throttled(self):
+        breaker = CircuitBreaker(max_retry_after=1)
+        breaker.record("a.com", ResponseVerdict(RESPONSE_THROTTLED, 0.2))
+        start = time.monotonic()
+        breaker.before_request("a.com")
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+        breaker.record("b.com", ResponseVerdict(RESPONSE_THROTTLED, 30))
+        with self.assertRaises(HostUnavailableError):
+            breaker.before_request("b.com")
@@ -0,0 +1,59 @@
+import unittest
+
+from _budget import RunBudget, get_recipe_priority
+
+
+class BudgetTests(unittest.TestCase):
+    def test_get_recipe_priority(self):
+        categories_sort = ["News", "Magazines"]
+        self.assertEqual(get_recipe_priority("News", [], categories_sort), 2)
+        self.assertEqual(get_recipe_priority("Magazines", [], categories_sort), 1)
+        self.assertEqual(get_recipe_priority("Books", [], categories_sort), 0)
+        self.assertEqual(
+            get_recipe_priority("Books", ["science"], categories_sort, ["science"]),
+            3,
+        )
+        self.assertEqual(
+            get_recipe_priority("News", ["science"], categories_sort, ["science"]),
+            5,
+        )
+
+    def test_claim(self):
+        budget = RunBudget(1000, workers=2, reserve_seconds=0)
+        budget.add("news1", 2, 600)
+        budget.add("news2", 2, 600)
+        budget.add("magazine", 1, 300)
+        budget.add("cached", 0, 0)
+        # time is set aside for news2 but not the lower priority recipes
+        self.assertTrue(budget.claim("news1"))
+        self.assertTrue(budget.claim("news2"))
+        self.assertTrue(budget.claim("magazine"))
+        self.assertTrue(budget.claim("unknown"))
+
+        budget = RunBudget(1000, workers=1, reserve_seconds=0)
+        budget.add("news1", 2, 600)
+        budget.add("news2", 2, 300)
+        budget.add("magazine", 1, 300)
+        # 600s is reserved for the pending news1
+        self.assertFalse(budget.claim("magazine"))
+        self.assertTrue(budget.claim("news1"))
+
+    def test_reserve(self):
+        budget = RunBudget(600, reserve_seconds=300)
+        self.assertLessEqual(budget.remaining(), 300)
+        budget.add("example", 0, 400)
+        self.assertFalse(budget.claim("example"))
+
+    def test_release(self):
+        budget = RunBudget(1000, workers=1, reserve_seconds=0)
+        budget.add("news", 2, 900)
+        budget.add("magazine", 1, 300)
+        self.assertFalse(budget.claim("magazine"))
+
+        budget = RunBudget(1000, workers=1, reserve_seconds=0)
+        budget.add("news", 2, 900)
+        budget.add("magazine", 1, 300)
+        # news is restored from cache instead, so its time is no longer set aside
+        budget.release("news")
+        self.assertTrue(budget.claim("magazine"))
+        budget.release("unknown")
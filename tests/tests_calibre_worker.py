@@ -0,0 +1,78 @@
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+from _calibre_worker import CalibreWorkerError, CalibreWorkerPool
+
+WORKER_SCRIPT = f"""
+import os
+import sys
+import time
+sys.path.insert(0, {str(Path(__file__).parent.parent.absolute())!r})
+from _calibre_worker import serve
+
+def echo(argv):
+    print(" ".join(argv[1:]), os.environ.get("EXAMPLE", ""))
+    return 0
+
+def fail(argv):
+    print("failed")
+    sys.exit(2)
+
+def crash(argv):
+    os._exit(1)
+
+def slow(argv):
+    time.sleep(5)
+
+serve({{"echo": echo, "fail": fail, "crash": crash, "slow": slow}})
+"""
+
+
+class CalibreWorkerTests(unittest.TestCase):
+    def setUp(self):
+        self.pool = CalibreWorkerPool(2, [sys.executable, "-c", WORKER_SCRIPT])
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_run(self):
+        self.assertEqual(self.pool.run(["echo", "a", "b"]), (0, "a b \n"))
+        self.assertEqual(
+            self.pool.run(["echo", "c"], env={"EXAMPLE": "x"}), (0, "c x\n")
+        )
+        # env is not kept between commands
+        self.assertEqual(self.pool.run(["echo", "d"]), (0, "d \n"))
+        self.assertEqual(self.pool.run(["fail"]), (2, "failed\n"))
+        exit_code, output = self.pool.run(["unknown"])
+        self.assertEqual(exit_code, 1)
+        self.assertIn("KeyError", output)
+        # worker is reused
+        self.assertEqual(self.pool.started, 1)
+
+    def test_worker_died(self):
+        self.assertEqual(self.pool.run(["echo", "a"]), (0, "a \n"))
+        with self.assertRaises(CalibreWorkerError):
+            self.pool.run(["crash"])
+        self.assertEqual(self.pool.started, 0)
+        # a new worker is started
+        self.assertEqual(self.pool.run(["echo", "b"]), (0, "b \n"))
+
+    def test_worker_died_on_start(self):
+        with self.assertRaises(CalibreWorkerError):
+            self.pool.run(["crash"])
+        self.assertTrue(self.pool.disabled)
+
+    def test_timeout(self):
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.pool.run(["slow"], timeout=1)
+        self.assertEqual(self.pool.run(["echo", "a"]), (0, "a \n"))
+
+    def test_unavailable(self):
+        pool = CalibreWorkerPool(1, ["newsrack-missing-calibre-debug"])
+        with self.assertRaises(CalibreWorkerError):
+            pool.run(["echo"])
+        self.assertTrue(pool.disabled)
+        with self.assertRaises(CalibreWorkerError):
+            pool.run(["echo"])
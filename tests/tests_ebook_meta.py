@@ -0,0 +1,258 @@
+import struct
+import tempfile
+import unittest
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional, Union
+
+from _ebook_meta import (
+    BookMetaError,
+    html_to_text,
+    parse_meta_date,
+    read_meta,
+    read_mobi_exth,
+    read_mobi_records,
+    write_meta,
+)
+
+OPF_TEMPLATE = """<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="2.0" unique-identifier="uid">
+<metadata xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:opf="http://www.idpf.org/2007/opf">
+<dc:title>Example: 17 Oct, 2026</dc:title>
+<dc:date opf:event="modification">2026-10-18T00:00:00+00:00</dc:date>
+<dc:date>2026-10-17T01:02:03+00:00</dc:date>
+<dc:description>Articles in this issue:
+
+Article &amp; One
+
+Article Two
+
+https://example.com/</dc:description>
+<dc:publisher>newsrack</dc:publisher>
+<meta name="cover" content="cover"/>
+</metadata>
+<manifest>
+<item id="cover" href="cover.jpg" media-type="image/jpeg"/>
+</manifest>
+</package>
+"""
+
+CONTAINER_XML = """<?xml version="1.0"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+<rootfiles>
+<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+</rootfiles>
+</container>
+"""
+
+
+def make_epub(file_path: Path, opf: Union[str, bytes] = OPF_TEMPLATE) -> None:
+    with zipfile.ZipFile(file_path, "w") as book:
+        book.writestr(
+            "mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED
+        )
+        book.writestr("META-INF/container.xml", CONTAINER_XML)
+        book.writestr("OEBPS/content.opf", opf)
+        book.writestr("OEBPS/cover.jpg", b"old cover")
+        book.writestr("OEBPS/text.html", "<p>text</p>" * 100)
+
+
+def make_mobi(
+    file_path: Path, title: str, exth: dict, images: Optional[List[bytes]] = None
+) -> None:
+    exth_data = b""
+    for exth_type, value in exth.items():
+        exth_data += struct.pack(">II", exth_type, len(value) + 8) + value
+    exth_block = (
+        b"EXTH" + struct.pack(">II", 12 + len(exth_data), len(exth)) + exth_data
+    )
+    mobi_header_length = 232
+    full_name = title.encode("utf-8")
+    full_name_offset = 16 + mobi_header_length + len(exth_block)
+    mobi_header = bytearray(mobi_header_length)
+    mobi_header[0:4] = b"MOBI"
+    struct.pack_into(">I", mobi_header, 4, mobi_header_length)
+    struct.pack_into(">I", mobi_header, 12, 65001)  # utf-8
+    struct.pack_into(">II", mobi_header, 68, full_name_offset, len(full_name))
+    struct.pack_into(">I", mobi_header, 92, 2)  # first image index
+    struct.pack_into(">I", mobi_header, 112, 0x40)  # has EXTH
+    records = [
+        bytes(16) + bytes(mobi_header) + exth_block + full_name + bytes(4),
+        b"text",
+    ] + (images or [])
+    header = bytearray(78)
+    header[0 : len(b"example")] = b"example"
+    header[60:68] = b"BOOKMOBI"
+    struct.pack_into(">H", header, 76, len(records))
+    offset = 78 + len(records) * 8 + 2
+    records_info = b""
+    for i, record in enumerate(records):
+        records_info += struct.pack(">II", offset, i)
+        offset += len(record)
+    with file_path.open("wb") as f:
+        f.write(bytes(header) + records_info + bytes(2) + b"".join(records))
+
+
+def make_cover(file_path: Path) -> None:
+    from PIL import Image
+
+    Image.new("RGB", (60, 80), (255, 0, 0)).save(file_path)
+
+
+class EbookMetaTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.folder = Path(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_parse_meta_date(self):
+        expected = datetime(2026, 10, 17, 1, 2, 3, tzinfo=timezone.utc)
+        self.assertEqual(parse_meta_date("2026-10-17T01:02:03+00:00"), expected)
+        self.assertEqual(parse_meta_date("2026-10-17T01:02:03Z"), expected)
+        self.assertEqual(parse_meta_date("2026-10-17T09:02:03+08:00"), expected)
+        self.assertIsNone(parse_meta_date("not a date"))
+
+    def test_html_to_text(self):
+        self.assertEqual(
+            html_to_text("<p>Articles:</p><p>A &amp; B</p>"), "Articles:\nA & B\n"
+        )
+        self.assertEqual(html_to_text("plain"), "plain")
+
+    def test_read_epub_meta(self):
+        book_path = self.folder.joinpath("example.epub")
+        make_epub(book_path)
+        meta = read_meta(book_path)
+        self.assertEqual(meta.title, "Example: 17 Oct, 2026")
+        self.assertEqual(
+            meta.published, datetime(2026, 10, 17, 1, 2, 3, tzinfo=timezone.utc)
+        )
+        self.assertEqual(
+            [c.strip() for c in meta.comments.split("\n") if c.strip()],
+            [
+                "Articles in this issue:",
+                "Article & One",
+                "Article Two",
+                "https://example.com/",
+            ],
+        )
+        self.assertEqual(meta.publisher, "newsrack")
+
+    def test_read_mobi_meta(self):
+        book_path = self.folder.joinpath("example.mobi")
+        make_mobi(
+            book_path,
+            "Example",
+            {
+                106: b"2026-10-17T01:02:03+00:00",
+                103: b"Articles in this issue:\n\nArticle One",
+                503: b"Example: 17 Oct, 2026",
+            },
+        )
+        meta = read_meta(book_path)
+        self.assertEqual(meta.title, "Example: 17 Oct, 2026")
+        self.assertEqual(
+            meta.published, datetime(2026, 10, 17, 1, 2, 3, tzinfo=timezone.utc)
+        )
+        self.assertEqual(meta.comments, "Articles in this issue:\n\nArticle One")
+        with book_path.open("rb") as f:
+            self.assertEqual(
+                read_mobi_exth(f.read())[106], [b"2026-10-17T01:02:03+00:00"]
+            )
+
+    def test_read_mobi_meta_full_name(self):
+        book_path = self.folder.joinpath("example.mobi")
+        make_mobi(book_path, "Example Title", {})
+        self.assertEqual(read_meta(book_path).title, "Example Title")
+
+    def test_unsupported(self):
+        book_path = self.folder.joinpath("example.pdf")
+        book_path.write_bytes(b"%PDF")
+        with self.assertRaises(BookMetaError):
+            read_meta(book_path)
+        book_path = self.folder.joinpath("example.epub")
+        book_path.write_bytes(b"not a zip")
+        with self.assertRaises(BookMetaError):
+            read_meta(book_path)
+
+    def test_write_epub_meta(self):
+        book_path = self.folder.joinpath("example.epub")
+        make_epub(book_path)
+        cover_path = self.folder.joinpath("cover.png")
+        make_cover(cover_path)
+        write_meta(
+            book_path,
+            series="Example",
+            series_index=2026290,
+            publisher="https://example.com/",
+            cover_path=cover_path,
+        )
+        meta = read_meta(book_path)
+        self.assertEqual(meta.title, "Example: 17 Oct, 2026")
+        self.assertEqual(meta.publisher, "https://example.com/")
+        with zipfile.ZipFile(book_path) as book:
+            self.assertIsNone(book.testzip())
+            infos = book.infolist()
+            self.assertEqual(infos[0].filename, "mimetype")
+            self.assertEqual(infos[0].compress_type, zipfile.ZIP_STORED)
+            opf = book.read("OEBPS/content.opf").decode("utf-8")
+            self.assertEqual(opf.count("<dc:publisher>"), 1)
+            self.assertIn('<meta name="calibre:series" content="Example"/>', opf)
+            self.assertIn('<meta name="calibre:series_index" content="2026290"/>', opf)
+            # cover is converted to the format of the existing cover
+            self.assertEqual(book.read("OEBPS/cover.jpg")[:2], b"\xff\xd8")
+            self.assertEqual(book.read("OEBPS/text.html"), b"<p>text</p>" * 100)
+
+        # updating again replaces instead of duplicating the series
+        write_meta(book_path, series="Example", series_index=2026291)
+        with zipfile.ZipFile(book_path) as book:
+            opf = book.read("OEBPS/content.opf").decode("utf-8")
+            self.assertEqual(opf.count('name="calibre:series"'), 1)
+            self.assertIn('content="2026291"', opf)
+
+    def test_write_epub_meta_not_utf8(self):
+        book_path = self.folder.joinpath("example.epub")
+        make_epub(
+            book_path,
+            OPF_TEMPLATE.replace('encoding="utf-8"', 'encoding="iso-8859-1"')
+            .replace("Article Two", "Caf\u00e9")
+            .encode("iso-8859-1"),
+        )
+        with self.assertRaises(BookMetaError):
+            write_meta(book_path, publisher="https://example.com/")
+
+    def test_write_mobi_meta(self):
+        book_path = self.folder.joinpath("example.mobi")
+        make_mobi(
+            book_path,
+            "Example",
+            {
+                101: b"newsrack",
+                201: struct.pack(">I", 0),
+                202: struct.pack(">I", 1),
+                503: b"Example: 17 Oct, 2026",
+            },
+            images=[b"old cover", b"old thumbnail"],
+        )
+        cover_path = self.folder.joinpath("cover.png")
+        make_cover(cover_path)
+        write_meta(book_path, publisher="https://example.com/", cover_path=cover_path)
+        meta = read_meta(book_path)
+        self.assertEqual(meta.title, "Example: 17 Oct, 2026")
+        self.assertEqual(meta.publisher, "https://example.com/")
+        with book_path.open("rb") as f:
+            data = f.read()
+        records = [data[start:end] for start, end in read_mobi_records(data)]
+        self.assertEqual(len(records), 4)
+        self.assertEqual(records[1], b"text")
+        self.assertEqual(records[2][:2], b"\xff\xd8")
+        self.assertEqual(records[3][:2], b"\xff\xd8")
+        self.assertEqual(read_mobi_exth(data)[101], [b"https://example.com/"])
+
+    def test_write_unsupported(self):
+        book_path = self.folder.joinpath("example.pdf")
+        book_path.write_bytes(b"%PDF")
+        with self.assertRaises(BookMetaError):
+            write_meta(book_path, publisher="newsrack")
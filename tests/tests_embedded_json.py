@@ -0,0 +1,63 @@
+import json
+import re
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent.joinpath("recipes", "includes")))
+from embedded_json import get_ld_json, get_script_json  # noqa: E402
+
+PAGE = """<html><head>
+<script src="https://example.com/app.js"></script>
+<script type="application/ld+json">{"@type": "WebSite"}</script>
+<SCRIPT type='application/ld+json'>
+  {"@type": "NewsArticle", "headline": "Headline"}
+</SCRIPT>
+<script>var ads = [];</script>
+<script>
+window.__STATE__ = {"title": "Line 1
+Line 2", "ad": undefined, "items": [1, undefined], "text": "undefined"};
+window.other = 1;
+</script>
+<script id="__NEXT_DATA__" type="application/json">{"props": {"id": 1}}</script>
+</head><body></body></html>"""
+
+
+class EmbeddedJsonTests(unittest.TestCase):
+    def test_script_json_prefix(self):
+        data = get_script_json(PAGE, r"window.__STATE__\s*=\s*")
+        self.assertEqual(data["title"], "Line 1\nLine 2")
+        self.assertIsNone(data["ad"])
+        self.assertEqual(data["items"], [1, None])
+        self.assertEqual(data["text"], "undefined")
+
+    def test_script_json_attrs(self):
+        self.assertEqual(
+            get_script_json(PAGE, "", {"id": "__NEXT_DATA__", "src": False}),
+            {"props": {"id": 1}},
+        )
+        self.assertEqual(
+            get_script_json(PAGE, "", {"id": re.compile(r"^__NEXT")}),
+            {"props": {"id": 1}},
+        )
+        self.assertIsNone(get_script_json(PAGE, r"window.__MISSING__\s*=\s*"))
+        self.assertIsNone(get_script_json(PAGE, "", {"src": True}))
+
+    def test_script_json_errors(self):
+        html = '<script>{"a": </script><script>{"b": 2}</script>'
+        with self.assertRaises(json.JSONDecodeError):
+            get_script_json(html)
+        errors = []
+        self.assertEqual(
+            get_script_json(html, on_error=lambda e, s: errors.append(s)), {"b": 2}
+        )
+        self.assertEqual(errors, ['{"a": '])
+
+    def test_ld_json(self):
+        data = get_ld_json(PAGE, lambda d: d.get("@type") == "NewsArticle")
+        self.assertEqual(data["headline"], "Headline")
+        self.assertIsNone(get_ld_json(PAGE, lambda d: d.get("@type") == "Person"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,371 @@
+import io
+import os
+import subprocess
+import tempfile
+import time
+import unittest
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+from unittest import mock
+
+import requests
+
+import _generate
+from _artifact_cache import ArtifactCache, file_sha256
+from _budget import RunBudget
+from _generate import PipelineContext, RecipeJob, RecipeOutput
+from _history import OUTCOME_GENERATED, OUTCOME_RECOVERED
+from _recipe_utils import Recipe
+
+
+def make_context(**kwargs) -> PipelineContext:
+    values = dict(
+        publish_site="https://example.com/",
+        cached=None,
+        cache_sess=None,
+        artifact_cache=None,
+        regenerate_recipes_slugs=[],
+        verbose_mode=False,
+        single_fetch=False,
+        calibre_workers=None,
+        budget=None,
+        today=None,
+    )
+    values.update(kwargs)
+    return PipelineContext(**values)
+
+
+class GenerateTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        cwd = os.getcwd()
+        os.chdir(self.temp_dir.name)
+        self.addCleanup(os.chdir, cwd)
+        Path(_generate.publish_folder).mkdir()
+        Path(_generate.meta_folder).mkdir()
+
+    def test_fetch_stage_removes_oeb_build_on_failure(self):
+        recipe = Recipe(
+            recipe="example", slug="example", src_ext="epub", category="News"
+        )
+
+        def run_cmd(job, cmd, *args, **kwargs):
+            # the recipe writes part of its build before failing
+            oeb_path = _generate.oeb_folder.joinpath(recipe.slug)
+            oeb_path.mkdir(parents=True, exist_ok=True)
+            oeb_path.joinpath("index.html").write_text("partial")
+            if cmd[0] == "timeout":
+                raise subprocess.TimeoutExpired(cmd, 1)
+            return 1
+
+        context = make_context(single_fetch=True)
+        with mock.patch.object(
+            _generate, "_should_run_recipe", return_value=True
+        ), mock.patch.object(_generate, "_run_cmd", side_effect=run_cmd):
+            for cmd in (["fail"], ["timeout"]):
+                job = RecipeJob(recipe=recipe, cmd=cmd, env={}, fetch_timeouts=[1])
+                _generate._fetch_stage(job, context)
+                self.assertIsNone(job.oeb_path)
+                self.assertFalse(_generate.oeb_folder.joinpath(recipe.slug).exists())
+
+        with mock.patch.object(
+            _generate, "_should_run_recipe", return_value=True
+        ), mock.patch.object(_generate, "_run_cmd", return_value=0):
+            job = RecipeJob(recipe=recipe, cmd=["ok"], env={}, fetch_timeouts=[1])
+            _generate._fetch_stage(job, context)
+            self.assertEqual(job.oeb_path, _generate.oeb_folder.joinpath(recipe.slug))
+
+    def test_build_from_oeb_format_timeout(self):
+        recipe = Recipe(
+            recipe="example",
+            slug="example",
+            src_ext="epub",
+            target_ext=["azw3", "pdf"],
+            category="News",
+        )
+
+        def run_cmd(job, cmd, *args, **kwargs):
+            # every format writes part of its output
+            Path(cmd[2]).write_text("partial")
+            if cmd[2].endswith(tuple(timeout_exts)):
+                raise subprocess.TimeoutExpired(cmd, 1)
+            return 0
+
+        def build() -> RecipeJob:
+            oeb_path = _generate.oeb_folder.joinpath(recipe.slug)
+            oeb_path.mkdir(parents=True)
+            oeb_path.joinpath("content.opf").write_text("")
+            job = RecipeJob(recipe=recipe, cmd=[], env={}, oeb_path=oeb_path)
+            with mock.patch.object(_generate, "_run_cmd", side_effect=run_cmd):
+                _generate._build_from_oeb(job, make_context())
+            self.assertFalse(oeb_path.exists())
+            return job
+
+        def outputs() -> List[str]:
+            return sorted(p.name for p in _generate.publish_folder.glob("example.*"))
+
+        # an alternative format timing out does not fail the recipe
+        timeout_exts = [".pdf"]
+        job = build()
+        self.assertEqual(job.exit_code, 0)
+        self.assertEqual(outputs(), ["example.azw3", "example.epub"])
+
+        for p in _generate.publish_folder.glob("example.*"):
+            p.unlink()
+        timeout_exts = [".epub"]
+        job = build()
+        self.assertEqual(job.exit_code, 1)
+        self.assertEqual(outputs(), [])
+
+    def test_fetch_stage_releases_budget_when_restored(self):
+        budget = RunBudget(1000, workers=1, reserve_seconds=0)
+        budget.add("news", 2, 900)
+        budget.add("magazine", 1, 300)
+        context = make_context(budget=budget)
+        recipe = Recipe(recipe="news", slug="news", src_ext="epub", category="News")
+        job = RecipeJob(recipe=recipe, cmd=["news"], env={})
+        with mock.patch.object(
+            _generate, "_should_run_recipe", return_value=False
+        ), mock.patch.object(_generate, "_download_from_cache", return_value=False):
+            _generate._fetch_stage(job, context)
+        self.assertNotIn("news", budget.pending)
+        self.assertTrue(budget.claim("magazine"))
+
+    def test_index_hashes(self):
+        recipe = Recipe(
+            recipe="example", slug="example", src_ext="epub", category="News"
+        )
+        book_path = _generate.publish_folder.joinpath("example-2022-10-01.epub")
+        book_path.write_bytes(b"example")
+        cached: Future = Future()
+        cached.set_result(
+            {
+                "example": [
+                    {"filename": book_path.name, "source_hash": "previous"},
+                ]
+            }
+        )
+        context = make_context(cached=cached)
+        for last_run, expected_source_hash in (
+            (time.time(), "current"),
+            (0, "previous"),
+        ):
+            job = RecipeJob(
+                recipe=recipe,
+                cmd=[],
+                env={},
+                source_hash="current",
+                last_run=last_run,
+                index_entries=[{"filename": book_path.name}],
+            )
+            _generate._add_index_hashes(job, context, book_path)
+            self.assertEqual(
+                job.index_entries[0],
+                {
+                    "filename": book_path.name,
+                    "size": 7,
+                    "sha256": file_sha256(book_path),
+                    # a book restored from cache keeps the source hash it was generated with
+                    "source_hash": expected_source_hash,
+                },
+            )
+
+    def test_run_record_fetch_duration(self):
+        recipe = Recipe(
+            recipe="example", slug="example", src_ext="epub", category="News"
+        )
+        calls = []
+
+        def run_cmd(job, cmd, *args, **kwargs):
+            calls.append(cmd)
+            if len(calls) == 1:
+                time.sleep(0.2)
+                raise subprocess.TimeoutExpired(cmd, 1)
+            return 0
+
+        job = RecipeJob(recipe=recipe, cmd=["example"], env={}, fetch_timeouts=[1, 2])
+        with mock.patch.object(
+            _generate, "_run_cmd", side_effect=run_cmd
+        ), mock.patch.object(_generate, "default_retry_wait_interval", 0):
+            _generate._run_fetch(job, make_context(), time.monotonic())
+        self.assertEqual(len(calls), 2)
+        # only the attempt that completed is counted
+        self.assertLess(job.fetch_duration, 0.2)
+
+        job.last_run = time.time()
+        job.fetch_duration = 30
+        job.stage_timings = {"fetch": 100, "build": 10}
+        record = _generate._get_run_record(job)
+        self.assertEqual(record.outcome, OUTCOME_GENERATED)
+        self.assertEqual(record.fetch, 30)
+        self.assertEqual(record.duration, 110)
+
+        # the fetch had no output and the cached copy was used instead
+        job.job_status = ":outbox_tray: From cache"
+        record = _generate._get_run_record(job)
+        self.assertEqual(record.outcome, OUTCOME_RECOVERED)
+        self.assertEqual(record.fetch, 0)
+
+    def test_resume_interrupted_run(self):
+        checkpoint_path = _generate.meta_folder.joinpath(_generate.checkpoint_filename)
+        recipes = [
+            Recipe(recipe=slug, slug=slug, src_ext="epub", category="News")
+            for slug in ("a", "b", "c", "d")
+        ]
+
+        def make_jobs() -> Dict[str, RecipeJob]:
+            return {r.slug: RecipeJob(recipe=r, cmd=[r.slug], env={}) for r in recipes}
+
+        def publish_stage(job, context):
+            rename_to = f"{job.recipe.slug}-2022-10-01.epub"
+            book_path = _generate.publish_folder.joinpath(rename_to)
+            if book_path.exists():
+                # like the fetch stage, an existing book is used as is
+                job.job_status = "From local"
+                return
+            if job.recipe.slug == "c" and kill_at_c:
+                # killed while writing the book
+                book_path.write_text("partial")
+                raise SystemExit()
+            book_path.write_text(f"{job.recipe.slug} run {run_count}")
+            job.job_status = "Generated"
+            job.last_run = time.time()
+            job.outputs = [
+                RecipeOutput(
+                    recipe=job.recipe,
+                    title=job.recipe.slug,
+                    file=book_path,
+                    rename_to=rename_to,
+                    published_dt=datetime(2022, 10, 1, tzinfo=timezone.utc),
+                    description="",
+                    articles=[],
+                )
+            ]
+            executed.append(job.recipe.slug)
+
+        def run_series(resume: bool) -> Dict[str, RecipeJob]:
+            recipe_jobs = make_jobs()
+            restored = _generate._resume_jobs(checkpoint_path, recipe_jobs, resume)
+            _generate._run_pipeline(
+                [j for s, j in recipe_jobs.items() if s not in restored],
+                make_context(),
+                on_job_done=lambda job: _generate._write_checkpoint(
+                    checkpoint_path, job
+                ),
+            )
+            return recipe_jobs
+
+        executed: List[str] = []
+        with mock.patch.object(
+            _generate, "pipeline_stages", [("publish", publish_stage, False)]
+        ):
+            run_count, kill_at_c = 1, True
+            run_series(resume=False)
+            self.assertEqual(executed, ["a", "b"])
+            self.assertTrue(checkpoint_path.exists())
+
+            executed.clear()
+            run_count, kill_at_c = 2, False
+            recipe_jobs = run_series(resume=True)
+            # the partial book for c is not mistaken for a finished one
+            self.assertEqual(executed, ["c", "d"])
+            for slug, run_number in (("a", 1), ("b", 1), ("c", 2), ("d", 2)):
+                self.assertEqual(recipe_jobs[slug].job_status, "Generated")
+                self.assertEqual(
+                    _generate.publish_folder.joinpath(
+                        f"{slug}-2022-10-01.epub"
+                    ).read_text(),
+                    f"{slug} run {run_number}",
+                )
+
+            # a book that has changed since it was checkpointed is not restored
+            _generate.publish_folder.joinpath("a-2022-10-01.epub").write_text("other")
+            executed.clear()
+            run_series(resume=True)
+            self.assertEqual(executed, ["a"])
+
+            # starting over discards the checkpoint
+            self.assertEqual(
+                _generate._resume_jobs(checkpoint_path, make_jobs(), False), []
+            )
+            self.assertFalse(checkpoint_path.exists())
+
+    def test_job_output_written_when_done(self):
+        checkpoint_path = _generate.meta_folder.joinpath(_generate.checkpoint_filename)
+        recipes = [
+            Recipe(recipe=slug, slug=slug, src_ext="epub", category="News")
+            for slug in ("a", "b")
+        ]
+        stdout = io.StringIO()
+        written_before: Dict[str, str] = {}
+
+        def publish_stage(job, context):
+            written_before[job.recipe.slug] = stdout.getvalue()
+            job.output.append(f"output of {job.recipe.slug}\n")
+
+        with mock.patch.object(
+            _generate, "pipeline_stages", [("publish", publish_stage, False)]
+        ), mock.patch.object(_generate.sys, "stdout", stdout):
+            _generate._run_pipeline(
+                [RecipeJob(recipe=r, cmd=[r.slug], env={}) for r in recipes],
+                make_context(),
+                on_job_done=lambda job: _generate._on_job_done(checkpoint_path, job),
+            )
+        # the output of a is not held back until the run is done
+        self.assertIn("output of a", written_before["b"])
+        self.assertIn("output of b", stdout.getvalue())
+
+    def test_download_cached_file_304_without_cached_copy(self):
+        class Response:
+            def __init__(self, status_code: int, content: bytes = b""):
+                self.status_code = status_code
+                self.content = content
+                self.headers = {"ETag": '"new"'} if content else {}
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                self.close()
+
+            def close(self):
+                pass
+
+            def raise_for_status(self):
+                if self.status_code >= 400:
+                    raise requests.exceptions.HTTPError(self.status_code)
+
+            def iter_content(self, chunk_size: int = 1):
+                yield self.content
+
+        url = "https://example.com/example.epub"
+        artifact_cache = ArtifactCache(Path("cache"))
+        downloaded = Path("example.epub")
+        downloaded.write_bytes(b"old")
+        object_path = artifact_cache.store(url, downloaded, {"ETag": '"old"'})
+        request_headers = []
+
+        def get(_, headers=None, **__):
+            request_headers.append(headers or {})
+            if headers and headers.get("If-None-Match"):
+                # the cached copy is pruned by another run in the meantime
+                object_path.chmod(0o600)
+                object_path.unlink()
+                return Response(304)
+            return Response(200, b"new")
+
+        cache_sess = mock.Mock(get=get)
+        file_path = _generate.publish_folder.joinpath("example.epub")
+        self.assertTrue(
+            _generate._download_cached_file(
+                url, file_path, cache_sess, 0, artifact_cache
+            )
+        )
+        self.assertEqual(file_path.read_bytes(), b"new")
+        self.assertEqual(request_headers, [{"If-None-Match": '"old"'}, {}])
+        self.assertEqual(
+            artifact_cache.conditional_headers(url), {"If-None-Match": '"new"'}
+        )
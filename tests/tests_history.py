@@ -0,0 +1,72 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from _history import (
+    OUTCOME_CACHED,
+    OUTCOME_GENERATED,
+    OUTCOME_TIMEOUT,
+    RecipeHistory,
+    RunRecord,
+    percentile,
+)
+
+
+class HistoryTests(unittest.TestCase):
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 50))
+        self.assertEqual(percentile([10], 95), 10)
+        self.assertEqual(percentile([30, 10, 20], 50), 20)
+        self.assertEqual(percentile([10, 20], 50), 15)
+        self.assertAlmostEqual(percentile(list(range(1, 101)), 95), 95.05)
+
+    def test_estimate(self):
+        history = RecipeHistory(max_records=3)
+        self.assertIsNone(history.estimate("example"))
+        for duration, outcome in (
+            (500, OUTCOME_GENERATED),
+            (100, OUTCOME_GENERATED),
+            (200, OUTCOME_GENERATED),
+            (1, OUTCOME_CACHED),
+            (900, OUTCOME_TIMEOUT),
+        ):
+            history.add("example", RunRecord(0, duration, outcome))
+        # only the most recent records are kept
+        self.assertEqual(len(history.records["example"]), 3)
+        # runs that didn't execute the recipe are excluded
+        self.assertEqual(history.durations("example"), [200, 900])
+        self.assertEqual(history.estimate("example"), 550)
+        self.assertEqual(history.estimate("example", 95), 865)
+
+    def test_load_save(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = Path(temp_dir, "history.json")
+            self.assertEqual(RecipeHistory.load(file_path).records, {})
+            history = RecipeHistory()
+            history.add(
+                "example",
+                RunRecord(1700000000, 60.5, OUTCOME_GENERATED, articles=10, bytes=1),
+            )
+            history.save(file_path)
+            self.assertEqual(RecipeHistory.load(file_path).records, history.records)
+            file_path.write_text('{"example": [{"unknown": 1}]}', encoding="utf-8")
+            self.assertEqual(RecipeHistory.load(file_path).records, {})
+
+    def test_fetch_timeout(self):
+        history = RecipeHistory()
+        for fetch in (100, 120, 110, 130):
+            history.add("example", RunRecord(0, fetch, OUTCOME_GENERATED, fetch=fetch))
+        # not enough samples
+        self.assertEqual(history.fetch_timeout("example", 600), 600)
+        history.add("example", RunRecord(0, 900, OUTCOME_TIMEOUT, fetch=900))
+        self.assertEqual(history.fetch_timeout("example", 600), 600)
+        history.add("example", RunRecord(0, 200, OUTCOME_GENERATED, fetch=200))
+        # p95 (186) + 50%
+        self.assertEqual(history.fetch_timeout("example", 600), 279)
+        # clamped by the configured timeout
+        self.assertEqual(history.fetch_timeout("example", 240), 240)
+        # not less than the minimum
+        history = RecipeHistory()
+        for _ in range(5):
+            history.add("example", RunRecord(0, 10, OUTCOME_GENERATED, fetch=10))
+        self.assertEqual(history.fetch_timeout("example", 600), 180)
@@ -0,0 +1,159 @@
+import os
+import sys
+import tempfile
+import unittest
+from io import BytesIO
+from pathlib import Path
+from urllib.error import HTTPError
+
+sys.path.append(str(Path(__file__).parent.parent.joinpath("recipes", "includes")))
+from http_cache import (  # noqa: E402
+    BufferedResponse,
+    HttpCache,
+    get_freshness_lifetime,
+    normalize_url,
+)
+from .utils import make_headers  # noqa: E402
+
+
+class FakeOpener:
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+
+    def open_novisit(self, url_or_request, *args, **kwargs):
+        self.requests.append(url_or_request)
+        code, headers, body = self.responses.pop(0)
+        url = getattr(url_or_request, "get_full_url", lambda: url_or_request)()
+        if code >= 300:
+            raise HTTPError(url, code, "", headers, BytesIO(body))
+        return BufferedResponse(url, code, "OK", headers, body)
+
+
+class HttpCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = HttpCache(self.temp_dir.name)
+        self.opener = FakeOpener()
+        self.url = "https://Example.com:443/article?b=2&a=1#top"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_normalize_url(self):
+        self.assertEqual(normalize_url(self.url), "https://example.com/article?a=1&b=2")
+        self.assertEqual(
+            normalize_url("http://example.com:8080"), "http://example.com:8080/"
+        )
+
+    def test_freshness_lifetime(self):
+        self.assertEqual(
+            get_freshness_lifetime(make_headers(Cache_Control="public, max-age=60")),
+            60,
+        )
+        self.assertIsNone(
+            get_freshness_lifetime(make_headers(Cache_Control="no-store"))
+        )
+        self.assertEqual(
+            get_freshness_lifetime(make_headers(Cache_Control="no-cache, max-age=60")),
+            0,
+        )
+        self.assertEqual(
+            get_freshness_lifetime(
+                make_headers(
+                    Date="Sat, 17 Oct 2026 00:00:00 GMT",
+                    Expires="Sat, 17 Oct 2026 00:02:00 GMT",
+                )
+            ),
+            120,
+        )
+        self.assertEqual(get_freshness_lifetime(make_headers()), 0)
+
+    def test_fresh(self):
+        self.opener.responses.append(
+            (200, make_headers(Cache_Control="max-age=60"), b"x")
+        )
+        res = self.cache.open(self.opener.open_novisit, self.url, timeout=10)
+        self.assertEqual(res.read(), b"x")
+        res = self.cache.open(
+            self.opener.open_novisit, "https://example.com/article?a=1&b=2"
+        )
+        self.assertEqual(res.read(), b"x")
+        self.assertEqual(res.info()["Cache-Control"], "max-age=60")
+        self.assertEqual(len(self.opener.requests), 1)
+
+    def test_revalidate(self):
+        self.opener.responses.append((200, make_headers(ETag='"v1"'), b"x"))
+        self.cache.open(self.opener.open_novisit, self.url)
+        self.opener.responses.append((304, make_headers(), b""))
+        res = self.cache.open(self.opener.open_novisit, self.url)
+        self.assertEqual(res.read(), b"x")
+        self.assertEqual(self.opener.requests[-1].get_header("If-none-match"), '"v1"')
+
+        # changed
+        self.opener.responses.append((200, make_headers(ETag='"v2"'), b"y"))
+        self.assertEqual(
+            self.cache.open(self.opener.open_novisit, self.url).read(), b"y"
+        )
+        self.assertEqual(self.cache.get(self.url)[0]["etag"], '"v2"')
+
+    def test_not_stored(self):
+        self.opener.responses.append(
+            (200, make_headers(Cache_Control="no-store"), b"x")
+        )
+        self.cache.open(self.opener.open_novisit, self.url)
+        self.assertIsNone(self.cache.get(self.url))
+        # no validators and no lifetime
+        self.opener.responses.append((200, make_headers(), b"x"))
+        self.cache.open(self.opener.open_novisit, self.url)
+        self.assertIsNone(self.cache.get(self.url))
+        # not a GET
+        self.opener.responses.append(
+            (200, make_headers(Cache_Control="max-age=60"), b"x")
+        )
+        self.cache.open(self.opener.open_novisit, self.url, data=b"x")
+        self.assertIsNone(self.cache.get(self.url))
+
+    def test_not_shared(self):
+        for headers in (
+            make_headers(Cache_Control="max-age=60", Set_Cookie="session=1"),
+            make_headers(Cache_Control="max-age=60", Vary="Accept-Encoding, Cookie"),
+            make_headers(Cache_Control="max-age=60", Vary="*"),
+        ):
+            self.opener.responses.append((200, headers, b"x"))
+            self.cache.open(self.opener.open_novisit, self.url)
+            self.assertIsNone(self.cache.get(self.url))
+        headers = make_headers(Cache_Control="max-age=60", Vary="Accept-Encoding")
+        headers["Vary"] = "Authorization"
+        self.opener.responses.append((200, headers, b"x"))
+        self.cache.open(self.opener.open_novisit, self.url)
+        self.assertIsNone(self.cache.get(self.url))
+        # bodies are stored decoded
+        self.opener.responses.append(
+            (
+                200,
+                make_headers(Cache_Control="max-age=60", Vary="Accept-Encoding"),
+                b"x",
+            )
+        )
+        self.cache.open(self.opener.open_novisit, self.url)
+        self.assertIsNotNone(self.cache.get(self.url))
+
+    def test_forced_ttl(self):
+        self.opener.responses.append(
+            (200, make_headers(Cache_Control="no-store"), b"x")
+        )
+        self.cache.open(self.opener.open_novisit, self.url, forced_ttl=60)
+        res = self.cache.open(self.opener.open_novisit, self.url, forced_ttl=60)
+        self.assertEqual(res.read(), b"x")
+        self.assertEqual(len(self.opener.requests), 1)
+
+    def test_evict(self):
+        cache = HttpCache(self.temp_dir.name, max_size=2000)
+        for i in range(5):
+            cache.put(f"https://example.com/{i}", {"expires": 0}, os.urandom(600))
+            os.utime(cache._path(f"https://example.com/{i}"), (i, i))
+        self.assertLessEqual(cache.size, 2000)
+        self.assertIsNone(cache.get("https://example.com/0"))
+        self.assertIsNotNone(cache.get("https://example.com/4"))
+        self.assertEqual(HttpCache(self.temp_dir.name).size, cache.size)
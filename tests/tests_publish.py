@@ -0,0 +1,74 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from _publish import (
+    FileSystemBackend,
+    PublishError,
+    get_backend,
+    get_content_type,
+    get_delta,
+    manifest_filename,
+    upload,
+)
+
+
+class PublishTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.folder = Path(self.temp_dir.name).joinpath("public")
+        self.folder.mkdir()
+        self.target = Path(self.temp_dir.name).joinpath("target")
+        self.backend = FileSystemBackend(self.target)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_delta(self):
+        self.folder.joinpath("index.html").write_text("v1")
+        self.folder.joinpath("a-2026-10-16.epub").write_bytes(b"a")
+        self.folder.joinpath("css").mkdir()
+        self.folder.joinpath("css", "site.css").write_text("body {}")
+
+        delta = get_delta(self.folder, self.backend)
+        self.assertEqual(
+            delta.added, ["a-2026-10-16.epub", "css/site.css", "index.html"]
+        )
+        self.assertEqual(delta.changed, [])
+        self.assertEqual(delta.removed, [])
+        upload(self.folder, delta, self.backend, workers=2)
+        self.assertEqual(self.target.joinpath("css", "site.css").read_text(), "body {}")
+        self.assertEqual(
+            json.loads(self.target.joinpath(manifest_filename).read_text()),
+            delta.manifest,
+        )
+
+        # next run
+        self.folder.joinpath("a-2026-10-16.epub").unlink()
+        self.folder.joinpath("a-2026-10-17.epub").write_bytes(b"a")
+        self.folder.joinpath("index.html").write_text("v2")
+        delta = get_delta(self.folder, self.backend)
+        self.assertEqual(delta.added, ["a-2026-10-17.epub"])
+        self.assertEqual(delta.changed, ["index.html"])
+        self.assertEqual(delta.removed, ["a-2026-10-16.epub"])
+        self.assertNotIn(manifest_filename, delta.manifest)
+        upload(self.folder, delta, self.backend)
+        self.assertFalse(self.target.joinpath("a-2026-10-16.epub").exists())
+        self.assertEqual(self.target.joinpath("index.html").read_text(), "v2")
+
+        # nothing changed
+        delta = get_delta(self.folder, self.backend)
+        self.assertEqual((delta.added, delta.changed, delta.removed), ([], [], []))
+
+    def test_get_backend(self):
+        self.assertIsInstance(get_backend(str(self.target)), FileSystemBackend)
+        self.assertIsInstance(get_backend(f"file://{self.target}"), FileSystemBackend)
+        with self.assertRaises(PublishError):
+            get_backend("ftp://example.com/")
+
+    def test_content_type(self):
+        self.assertEqual(get_content_type("a.epub"), "application/epub+zip")
+        self.assertEqual(get_content_type("a.azw3"), "application/x-mobi8-ebook")
+        self.assertEqual(get_content_type("index.html"), "text/html")
+        self.assertEqual(get_content_type("a.unknown"), "application/octet-stream")
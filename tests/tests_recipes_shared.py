@@ -0,0 +1,190 @@
+import logging
+import os
+import re
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+from urllib.error import HTTPError
+
+sys.path.append(str(Path(__file__).parent.parent.joinpath("recipes", "includes")))
+try:
+    import recipes_shared  # noqa: E402
+except ImportError:  # the recipe includes need calibre
+    recipes_shared = None  # type: ignore[assignment]
+from .utils import make_headers  # noqa: E402
+
+
+class FetcherRecipe:
+    """Stands in for calibre's BasicNewsRecipe article fetching"""
+
+    def __init__(self, feed_objects):
+        self.log = logging.getLogger(__file__)
+        self.feed_objects = feed_objects
+        self.fetched = []
+
+    def fetch_article(self, url, dir, f, a, num_of_feeds):
+        self.fetched.append(url)
+        html_path = os.path.join(dir, "index.html")
+        with open(html_path, "w", encoding="utf-8") as html_f:
+            html_f.write(
+                '<html><body><article data-og-link="https://example.com/post/">'
+                "Post</article></body></html>"
+            )
+        with open(html_path, "r", encoding="utf-8") as html_f:
+            soup = recipes_shared.BeautifulSoup(html_f.read())
+        # calibre calls this when it processes the fetched article
+        self.populate_article_metadata(self.feed_objects[f].articles[a], soup, True)
+        return html_path, [html_path], []
+
+
+class BrowserRecipe:
+    """Stands in for calibre's BasicNewsRecipe browser methods"""
+
+    def get_browser(self, *args, **kwargs):
+        return SimpleNamespace(
+            name="new", clone_browser=lambda: SimpleNamespace(name="clone")
+        )
+
+    def clone_browser(self, br):
+        return br.clone_browser()
+
+
+@unittest.skipUnless(recipes_shared, "calibre is not installed")
+class RecipesSharedTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        store_dir = os.path.join(self.temp_dir.name, "store")
+        patcher = mock.patch.dict(os.environ, {"newsrack_article_store_dir": store_dir})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        recipes_shared._article_store = None
+        self.addCleanup(setattr, recipes_shared, "_article_store", None)
+
+    def test_html_to_text(self):
+        html_to_text = recipes_shared.html_to_text
+        self.assertEqual(
+            html_to_text("<em>Fish</em> &amp; Chips&#8217; <br/>Menu"),
+            "Fish & Chips\u2019 Menu",
+        )
+        self.assertEqual(html_to_text("5 &lt; 6 and 7 &gt; 3"), "5 < 6 and 7 > 3")
+        self.assertEqual(html_to_text("&lt;b&gt; is bold"), "<b> is bold")
+        self.assertEqual(html_to_text("5 < 6 and 7 > 3"), "5 < 6 and 7 > 3")
+        self.assertEqual(html_to_text("<!-- note -->Title"), "Title")
+
+    def test_restored_article_metadata(self):
+        class ExampleRecipe(recipes_shared.WordPressNewsrackRecipe, FetcherRecipe):
+            pass
+
+        api_url = "https://example.com/wp-json/wp/v2/posts/1"
+        for run in range(2):
+            article = SimpleNamespace(url=api_url, title="Post")
+            recipe = ExampleRecipe([SimpleNamespace(articles=[article])])
+            recipe.set_article_marker(api_url, "2022-10-01T00:00:00")
+            article_dir = os.path.join(self.temp_dir.name, f"run{run}", "article_0")
+            os.makedirs(article_dir)
+            res, paths, failures = recipe.fetch_article(api_url, article_dir, 0, 0, 1)
+            self.assertEqual(failures, [])
+            self.assertTrue(os.path.exists(res))
+            # fetched in the first run, restored from the article store in the second
+            self.assertEqual(recipe.fetched, [] if run else [api_url])
+            self.assertEqual(article.url, "https://example.com/post/")
+
+    def test_clone_browser(self):
+        class DefaultRecipe(recipes_shared.BasicNewsrackRecipe, BrowserRecipe):
+            pass
+
+        class LoginRecipe(recipes_shared.BasicNewsrackRecipe, BrowserRecipe):
+            def get_browser(self, *args, **kwargs):
+                br = super().get_browser(*args, **kwargs)
+                br.logged_in = True
+                return br
+
+        self.assertFalse(DefaultRecipe.customises_browser())
+        self.assertTrue(LoginRecipe.customises_browser())
+        for recipe_class, expected_name in (
+            (DefaultRecipe, "new"),
+            (LoginRecipe, "clone"),
+        ):
+            recipe = recipe_class()
+            br = recipe.clone_browser(recipe.get_browser())
+            # requests still go through the recipe, e.g. for packed articles
+            self.assertIsInstance(br, recipes_shared.RecipeBrowser)
+            self.assertEqual(br.name, expected_name)
+
+    def test_guarded_urls(self):
+        class ExampleRecipe(recipes_shared.BasicNewsrackRecipe):
+            pass
+
+        recipe = ExampleRecipe()
+        # building the index
+        self.assertTrue(recipe.is_guarded_url("https://example.com/"))
+        self.assertTrue(recipe.is_guarded_url("https://api.example.com/posts"))
+        self.assertFalse(recipe.is_guarded_url("https://example.com/logo.png"))
+
+        article = SimpleNamespace(url="https://example.com/post/", title="Post")
+        recipe.feed_objects = [SimpleNamespace(articles=[article])]
+        self.assertTrue(recipe.is_guarded_url("https://example.com/other-post/"))
+        self.assertFalse(recipe.is_guarded_url("https://example.com/photo.jpg"))
+        # e.g. images from a CDN
+        self.assertFalse(recipe.is_guarded_url("https://cdn.example.net/photo"))
+
+        recipe.circuit_breaker_domains = ["example.net"]
+        self.assertTrue(recipe.is_guarded_url("https://cdn.example.net/photo"))
+        self.assertFalse(recipe.is_guarded_url("https://example.com/post/"))
+
+        recipe.use_circuit_breaker = False
+        self.assertFalse(recipe.is_guarded_url("https://cdn.example.net/photo"))
+
+    def test_abort_on_block(self):
+        class AbortRecipe(Exception):
+            pass
+
+        class ExampleRecipe(recipes_shared.BasicNewsrackRecipe):
+            log = logging.getLogger(__file__)
+
+            def abort_recipe_processing(self, msg):
+                raise AbortRecipe(msg)
+
+        requested = []
+
+        def open_func(url):
+            requested.append(url)
+            if url.endswith(".jpg"):
+                raise HTTPError(url, 403, "Forbidden", make_headers(), None)
+            if "tosv" in url:
+                # redirected to the bot challenge page
+                raise HTTPError(
+                    url,
+                    307,
+                    "Temporary Redirect",
+                    make_headers(Location="https://example.com/tosv2.html"),
+                    None,
+                )
+            raise HTTPError(url, 451, "Unavailable", make_headers(), None)
+
+        recipe = ExampleRecipe()
+        guarded_open = recipe.guard_requests(open_func, "example.com")
+        # blocked images, e.g. hotlink protected, are not counted
+        for _ in range(5):
+            with self.assertRaises(HTTPError):
+                guarded_open("https://example.com/photo.jpg")
+        for _ in range(recipe.block_threshold - 1):
+            with self.assertRaises(HTTPError):
+                guarded_open("https://example.com/post/")
+        with self.assertRaises(AbortRecipe):
+            guarded_open("https://example.com/post/")
+        # no more requests once the host is blocking
+        requested.clear()
+        with self.assertRaises(AbortRecipe):
+            guarded_open("https://example.com/other-post/")
+        self.assertEqual(requested, [])
+
+        recipe = ExampleRecipe()
+        recipe.blocked_url_re = re.compile(r"/tosv.*\.html")
+        recipe.block_threshold = 1
+        with self.assertRaises(AbortRecipe):
+            recipe.guard_requests(open_func, "example.com")("https://example.com/tosv")
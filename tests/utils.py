@@ -0,0 +1,14 @@
+from http.client import HTTPMessage
+
+
+def make_headers(**headers) -> HTTPMessage:
+    """
+    Make response headers, with underscores in the names as dashes
+
+    :param headers:
+    :return:
+    """
+    msg = HTTPMessage()
+    for k, v in headers.items():
+        msg[k.replace("_", "-")] = v
+    return msg